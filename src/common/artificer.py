@@ -1,6 +1,8 @@
 #!/usr/bin/python3
 
 import collections
+import functools
+import json
 import re
 import logging
 
@@ -8,42 +10,69 @@ from src.common.config import Constants
 
 
 class Artificer:
+    """
+    Paints text with ANSI styles.
+
+    The escape sequence of a style (its format, background and foreground
+    colors) is built once and cached, every response type gets its own
+    (see style), so painting a text is only a concatenation.
+    """
+
+    RESET = "\u001b[0;0m"
+
     @classmethod
     def load(cls) -> dict:
         return Constants.chroma
 
-    def __construct(self, text: str):
-        self.nOiCe= f"\u001b[{self.format};{self.bg_color};{self.fg_color}m{text}\u001b[0;0m"
-        self.nOiCe = re.sub(r';+', ';', self.nOiCe)
-
-    def __set_format(self, args: collections.defaultdict):
-        defaults = self.chroma['default']
-        self.format = args.get('format', defaults['format'])
-        self.format = list(map(self.chroma['format'].get, self.format))
-        self.format = list(map(str, sorted(self.format)))
-        self.format = ';'.join(self.format)
-
-    def __set_bg_color(self, args: collections.defaultdict):
-        defaults = self.chroma['default']
-        self.bg_color = args.get('background-color', defaults['background-color'])
-        if self.bg_color != "":
-            self.bg_color = self.chroma['background-color'][self.bg_color]
-
-    def __set_fg_color(self, args: collections.defaultdict):
-        defaults = self.chroma['default']
-        self.fg_color = args.get('foreground-color', defaults['foreground-color'])
-        if self.fg_color != "":
-            self.fg_color = self.chroma['foreground-color'][self.fg_color]
-
-    def __set_attrs(self, args: collections.defaultdict) -> bool:
-        self.__set_format(args)
-        self.__set_bg_color(args)
-        self.__set_fg_color(args)
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def prefix(setup: str) -> str:
+        """
+        Builds the escape sequence of a style.
+
+        Args:
+            setup (str): The style, as JSON (for it to be cached).
+        """
+        args = json.loads(setup)
+        chroma = Artificer.load()
+        defaults = chroma['default']
+
+        format = args.get('format', defaults['format'])
+        format = ';'.join(map(str, sorted(map(chroma['format'].get, format))))
+
+        bg_color = args.get('background-color', defaults['background-color'])
+        if bg_color != "":
+            bg_color = chroma['background-color'][bg_color]
+
+        fg_color = args.get('foreground-color', defaults['foreground-color'])
+        if fg_color != "":
+            fg_color = chroma['foreground-color'][fg_color]
+
+        return re.sub(r';+', ';', f"\u001b[{format};{bg_color};{fg_color}m")
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def style(cls, response_type: str) -> str:
+        """
+        The escape sequence of a response type (see response.json).
+        """
+        return cls.prefix(json.dumps(Constants.response[response_type], sort_keys=True))
+
+    @classmethod
+    def warm_up(cls) -> None:
+        """
+        Builds the styles of all the response types ahead of the first response.
+        """
+        for response_type in Constants.response:
+            cls.style(response_type)
+        logging.info(f"Styles ready for {len(Constants.response)} response types")
+
+    @classmethod
+    def paint(cls, response_type: str, text: str) -> str:
+        return cls.style(response_type) + text + cls.RESET
 
     def __init__(self, setup: collections.defaultdict, text: str):
-        self.chroma = self.load()
-        self.__set_attrs(setup)
-        self.__construct(text)
+        self.nOiCe = self.prefix(json.dumps(setup, sort_keys=True)) + text + self.RESET
 
     def touch(self) -> str:
-        return self.nOiCe
\ No newline at end of file
+        return self.nOiCe
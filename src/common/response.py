@@ -1,28 +1,56 @@
 #!/usr/bin/python3
 
+import gzip
+import io
 import logging
+import re
 
 from src.common import artificer, config
 
 
 class Response:
+    """
+    A styled (ANSI) message, rendered as an ```ansi code block.
+
+    Messages longer than Discord allows are paginated (see paginate) into
+    valid pages of their own: code blocks are closed and reopened across
+    pages, and so is the style in effect, without ever splitting an escape
+    sequence. Past a number of pages, they are sent as a gzipped text
+    attachment instead, with a preview (see digest).
+    """
+
+    FENCE = '```'
+    RESET = '\u001b[0;0m'
+    TOKENS = re.compile(r'(```(?:\w*\n)?|\u001b\[[0-9;]*m)')
+    ESCAPE = re.compile(r'\u001b\[[0-9;]*m')
+    # Room kept on every page to close the style and the code block
+    RESERVE = len(RESET) + len(FENCE)
+    # Longest language of a code block, and escape sequence, reopened on every page
+    LANGUAGE = 32
+    STYLE = 32
+
     @classmethod
     def load(cls) -> dict:
         return config.Constants.response
 
     def __init__(self, response_type: str, response: str):
         self.raw = response
-        self.__resp = self.load()
-        artist = artificer.Artificer(self.__resp[response_type], self.raw)
         self.resp_type = response_type
-        self.art = artist.touch()
+        # Painted fragments, joined only when rendered (see art)
+        self.fragments = [artificer.Artificer.paint(response_type, response)]
+
+    @property
+    def art(self) -> str:
+        if len(self.fragments) > 1:
+            self.fragments = [''.join(self.fragments)]
+        return self.fragments[0]
 
     def __str__(self) -> str:
         return f"```ansi\n{self.art}```"
     
     def add(self, other_response, sep='\n'):
         if isinstance(other_response, Response):
-            self.art += sep + other_response.art
+            self.fragments.extend([sep] + other_response.fragments)
             return self
         elif isinstance(other_response, str):
             return Response(self.resp_type, self.raw + other_response)
@@ -31,9 +59,142 @@ class Response:
 
     def __add__(self, other_response):
         if isinstance(other_response, Response):
-            self.art += other_response.art
+            self.fragments.extend(list(other_response.fragments))
             return self
         elif isinstance(other_response, str):
             return Response(self.resp_type, self.raw + other_response)
         else:
-            raise TypeError('Unsupported operand for +')
\ No newline at end of file
+            raise TypeError('Unsupported operand for +')
+
+    def pages(self, limit: int) -> list:
+        return Response.paginate(str(self), limit)
+
+    @classmethod
+    def paginate(cls, text: str, limit: int) -> list:
+        """
+        Splits a message into pages of up to limit characters, at line breaks
+        where possible.
+
+        A page breaking inside a code block closes it (and the style in effect),
+        the next one reopens both. Escape sequences are never split, except
+        for those longer than STYLE, taken as text (as are languages longer
+        than LANGUAGE). Every page carries some of the text, and holds within
+        limit as long as a reopened code block leaves room for it (limits of
+        a hundred characters or more).
+
+        Args:
+            text (str): The message, e.g. str(Response) or several of them.
+            limit (int): Most characters in a page.
+
+        Returns:
+            list: The pages.
+        """
+        if len(text) <= limit:
+            return [text]
+
+        pages = []
+        state = {'fence': None, 'style': None}
+
+        def prefix() -> str:
+            if state['fence'] is None:
+                return ''
+            return state['fence'] + (state['style'] or '')
+
+        def suffix() -> str:
+            if state['fence'] is None:
+                return ''
+            return (cls.RESET if state['style'] else '') + cls.FENCE
+
+        page = ''
+        for index, token in enumerate(cls.TOKENS.split(text)):
+            if not token:
+                continue
+
+            if index % 2:
+                if token.startswith(cls.FENCE) and state['fence'] is not None:
+                    # Closes the code block, whatever follows is text
+                    units = [(cls.FENCE, 'close'), (token[len(cls.FENCE):], 'text')]
+                elif token.startswith(cls.FENCE) and len(token) > len(cls.FENCE) + cls.LANGUAGE + 1:
+                    # No language is that long, it is text (e.g. job output)
+                    units = [(f'{cls.FENCE}\n', 'open'), (token[len(cls.FENCE):], 'text')]
+                elif token.startswith(cls.FENCE):
+                    units = [(token, 'open')]
+                elif len(token) > cls.STYLE:
+                    units = [(token, 'text')]
+                else:
+                    units = [(token, 'style')]
+            else:
+                units = [(line, 'text') for line in token.splitlines(keepends=True)]
+
+            for unit, kind in units:
+                # Leaves an opening code block some room on its page
+                needed = len(unit) + (64 if kind == 'open' else 0)
+                # Closing the code block takes the room kept for it
+                if kind != 'close' and len(page) + needed > limit - cls.RESERVE and page != prefix():
+                    pages.append(page + suffix())
+                    page = prefix()
+
+                while kind == 'text' and len(unit) > 1 and len(page) + len(unit) > limit - cls.RESERVE:
+                    # A line longer than a page
+                    room = max(limit - cls.RESERVE - len(page), 1)
+                    pages.append(page + unit[:room] + suffix())
+                    page, unit = prefix(), unit[room:]
+
+                page += unit
+                if kind == 'open':
+                    state['fence'], state['style'] = unit if unit.endswith('\n') else unit + '\n', None
+                elif kind == 'close':
+                    state['fence'], state['style'] = None, None
+                elif kind == 'style':
+                    state['style'] = None if re.fullmatch(r'\u001b\[0?(;0)*m', unit) else unit
+
+        if page != prefix():
+            pages.append(page + suffix())
+        return pages
+
+    @classmethod
+    def digest(cls, text: str, limit: int, most: int) -> tuple:
+        """
+        Paginates a message, or attaches it as a gzipped text file past most pages.
+
+        Returns:
+            tuple: The pages, and the attachments as (file, filename) pairs.
+        """
+        pages = cls.paginate(text, limit)
+        if len(pages) <= most:
+            return pages, []
+
+        plain = cls.ESCAPE.sub('', re.sub(r'```\w*', '', text))
+        data = gzip.compress(plain.encode(), compresslevel=9)
+
+        notice = str(Response('info', f'{len(pages)} pages long, attached in full as response.txt.gz ({len(data) / 1024:.0f} KB)'))
+        preview = cls.paginate(text, limit - len(notice) - 1)[0]
+        return [f'{preview}\n{notice}'], [(io.BytesIO(data), 'response.txt.gz')]
+
+
+if __name__ == '__main__':
+    # Micro-benchmark: python3 -m src.common.response [responses]
+    import functools
+    import sys
+    import timeit
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    types = list(Response.load())
+    lines = [f'{index:05d} /home/suman/Documents/file-{index}.txt' for index in range(count)]
+
+    def build() -> list:
+        return [Response(types[index % len(types)], line) for index, line in enumerate(lines)]
+
+    def compose() -> str:
+        return str(functools.reduce(lambda total, response: total.add(response), build()))
+
+    def append() -> str:
+        total = Response('success', 'Here ya go!')
+        for index, line in enumerate(lines):
+            total += Response(types[index % len(types)], line)
+        return str(total)
+
+    for name, job in [('build', build), ('reduce add', compose), ('append +=', append)]:
+        runs = 5
+        seconds = min(timeit.repeat(job, number=1, repeat=runs))
+        print(f'{name:<12} {count} responses: {seconds * 1000:8.2f} ms, {seconds / count * 1e6:6.2f} us per response')
@@ -0,0 +1,288 @@
+#!/usr/bin/python3
+
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+import traceback
+
+from src.common.config import Constants
+
+
+class Runtime:
+    """
+    Runs the flows of the bot process, a bounded number at a time.
+
+    Every flow is a task, with an ID, run in one of two modes:
+        process: In a forked process, out of at most `processes` at a time,
+            for the flows that compute or block. The process is reaped as
+            soon as it exits (through its sentinel, on the event loop), and
+            cancelling the task terminates it (and kills it after `grace`
+            seconds).
+        task: On the event loop of the bot, for the I/O bound flows, which
+            share its state (and Runtime). Coroutines run as asyncio tasks,
+            blocking callables in a pool of `threads` threads; those cannot
+            be cancelled once running.
+
+    Process mode forks a new process per flow rather than reusing worker
+    processes: a process is only bounded, not pooled. Cancelling a flow
+    has to kill whatever it runs, which would take a reused worker down
+    (and its next flows with it). The flows also need no pickling this
+    way (they are forked along with the state of the bot), and none of
+    them sees what an earlier one left behind in its process. A fork costs
+    a few milliseconds, little next to any flow.
+
+    Flows may also be limited to a number of concurrent tasks each. Tasks
+    waiting for a slot are queued, at most `backlog` of them (Runtime.Busy
+    is raised beyond), and the last `history` finished tasks are kept for
+    ps.
+
+    Utilities (see call) are run with a timeout, coroutines on the event
+    loop and blocking callables in a pool of their own (`helpers` threads),
+    so that neither stalls the loop (and the Discord heartbeats).
+
+    The state lives in the bot process, Runtime must be used from its event
+    loop (cancel and ps may be called from any of its threads).
+    """
+
+    QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+    class Busy(Exception):
+        pass
+
+    class Task:
+        def __init__(self, task_id: int, name: str, mode: str, blocking: bool):
+            self.id = task_id
+            self.name = name
+            self.mode = mode
+            self.blocking = blocking
+            self.state = Runtime.QUEUED
+            self.pid = None
+            self.exitcode = None
+            self.error = None
+            self.created = time.time()
+            self.started = None
+            self.finished = None
+            self.future = None
+
+        def status(self) -> dict:
+            now = time.time()
+            return {
+                'id': self.id,
+                'flow': self.name,
+                'mode': self.mode,
+                'state': self.state,
+                'pid': self.pid,
+                'waited': round((self.started or self.finished or now) - self.created, 1),
+                'elapsed': round((self.finished or now) - self.started, 1) if self.started else None,
+                'exitcode': self.exitcode,
+                'error': self.error,
+            }
+
+    tasks = collections.OrderedDict()
+    counter = itertools.count(1)
+    lock = threading.Lock()
+    loop = None
+    pool = None
+    helpers = None
+    slots = None
+    limits = dict()
+
+    @classmethod
+    def load(cls) -> dict:
+        return Constants.setup['runtime']
+
+    @classmethod
+    def mode(cls, name: str) -> str:
+        return cls.load()['modes'].get(name, 'process')
+
+    @classmethod
+    def __prepare(cls) -> None:
+        """
+        Binds the runtime to the running event loop, on first use.
+        """
+        loop = asyncio.get_running_loop()
+        if cls.loop is loop:
+            return
+
+        for pool in [cls.pool, cls.helpers]:
+            if pool is not None:
+                # Left over by a previous loop
+                pool.shutdown(wait=False)
+
+        setup = cls.load()
+        cls.loop = loop
+        cls.pool = concurrent.futures.ThreadPoolExecutor(max_workers=setup['threads'], thread_name_prefix='runtime')
+        cls.helpers = concurrent.futures.ThreadPoolExecutor(max_workers=setup['helpers'], thread_name_prefix='helper')
+        cls.slots = asyncio.Semaphore(setup['processes'])
+        cls.limits = {
+            name: asyncio.Semaphore(limit) for name, limit in setup['limits'].items()
+        }
+
+    @classmethod
+    def pending(cls) -> int:
+        with cls.lock:
+            return sum(1 for task in cls.tasks.values() if task.state == Runtime.QUEUED)
+
+    @classmethod
+    def submit(cls, name: str, target, args: tuple = ()) -> Task:
+        """
+        Schedules a flow, which starts as soon as its limits allow.
+
+        Args:
+            name (str): Name of the flow (its trigger), for its mode and limit.
+            target (callable): The flow, a coroutine function in task mode only.
+            args (tuple): Arguments of the target.
+
+        Returns:
+            Runtime.Task: The scheduled task.
+
+        Raises:
+            Runtime.Busy: If `backlog` tasks are already queued.
+        """
+        cls.__prepare()
+        if cls.pending() >= cls.load()['backlog']:
+            raise Runtime.Busy(f"{cls.pending()} tasks already queued. Please retry later.")
+
+        mode = cls.mode(name)
+        blocking = mode == 'task' and not asyncio.iscoroutinefunction(target)
+        task = Runtime.Task(next(cls.counter), name, mode, blocking)
+        with cls.lock:
+            cls.tasks[task.id] = task
+        task.future = cls.loop.create_task(cls.__run(task, target, args), name=f'{name}#{task.id}')
+        return task
+
+    @classmethod
+    async def __run(cls, task: Task, target, args: tuple) -> None:
+        limit = cls.limits.get(task.name)
+        try:
+            async with limit if limit is not None else contextlib.nullcontext():
+                if task.mode == 'process':
+                    async with cls.slots:
+                        await cls.__fork(task, target, args)
+                else:
+                    task.state, task.started = Runtime.RUNNING, time.time()
+                    if task.blocking:
+                        await cls.loop.run_in_executor(cls.pool, target, *args)
+                    else:
+                        await target(*args)
+                    task.state = Runtime.DONE
+
+        except asyncio.CancelledError:
+            task.state = Runtime.CANCELLED
+        except Exception as e:
+            logging.error(f"Task {task.id} ({task.name}) failed: {traceback.format_exc()}")
+            task.state, task.error = Runtime.FAILED, str(e)
+        finally:
+            task.finished = time.time()
+            cls.__forget()
+
+    @classmethod
+    async def __fork(cls, task: Task, target, args: tuple) -> None:
+        process = multiprocessing.Process(target=target, args=args, name=f'{task.name}#{task.id}')
+        process.start()
+        task.state, task.started, task.pid = Runtime.RUNNING, time.time(), process.pid
+
+        try:
+            await cls.__exited(process)
+        except asyncio.CancelledError:
+            process.terminate()
+            try:
+                await asyncio.wait_for(cls.__exited(process), cls.load()['grace'])
+            except asyncio.TimeoutError:
+                process.kill()
+                await cls.__exited(process)
+            raise
+        finally:
+            # Reaps the process, it exited
+            process.join()
+            task.exitcode = process.exitcode
+            process.close()
+
+        task.state = Runtime.DONE if task.exitcode == 0 else Runtime.FAILED
+
+    @classmethod
+    async def __exited(cls, process: multiprocessing.Process) -> None:
+        """
+        Waits for the process to exit, on the event loop.
+        """
+        exited = cls.loop.create_future()
+
+        def ready():
+            if not exited.done():
+                exited.set_result(None)
+
+        cls.loop.add_reader(process.sentinel, ready)
+        try:
+            await exited
+        finally:
+            cls.loop.remove_reader(process.sentinel)
+
+    @classmethod
+    async def call(cls, target, timeout: float = None):
+        """
+        Runs a utility without blocking the event loop.
+
+        Args:
+            target (callable): The utility, coroutine functions are awaited on the
+                loop, the rest run in a helper thread.
+            timeout (float) [Optional]: Seconds to wait for the result, None for no limit.
+
+        Returns:
+            The result of the utility.
+
+        Raises:
+            asyncio.TimeoutError: If the utility did not finish in time. A blocking
+                utility still runs to completion in its thread, a coroutine is cancelled.
+        """
+        cls.__prepare()
+        if asyncio.iscoroutinefunction(target):
+            return await asyncio.wait_for(target(), timeout)
+        return await asyncio.wait_for(cls.loop.run_in_executor(cls.helpers, target), timeout)
+
+    @classmethod
+    def __forget(cls) -> None:
+        """
+        Keeps only the last `history` finished tasks.
+        """
+        with cls.lock:
+            finished = [task_id for task_id, task in cls.tasks.items() if task.finished is not None]
+            for task_id in finished[:max(len(finished) - cls.load()['history'], 0)]:
+                del cls.tasks[task_id]
+
+    @classmethod
+    def cancel(cls, task_id: int) -> dict:
+        """
+        Cancels a task, queued or running (except for running blocking tasks).
+        """
+        with cls.lock:
+            task = cls.tasks.get(task_id)
+
+        if task is None or task.finished is not None:
+            return {'status': 'error', 'message': f'No task {task_id} is queued or running'}
+        if task.blocking and task.state == Runtime.RUNNING:
+            return {'status': 'error', 'message': f'Task {task_id} ({task.name}) cannot be cancelled once running'}
+
+        cls.loop.call_soon_threadsafe(task.future.cancel)
+        return {'status': 'success', 'message': f'Task {task_id} ({task.name}) cancelled'}
+
+    @classmethod
+    def ps(cls) -> list:
+        with cls.lock:
+            return [task.status() for task in cls.tasks.values()]
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """
+        Cancels all the tasks and waits for them to wind up.
+        """
+        with cls.lock:
+            futures = [task.future for task in cls.tasks.values() if task.finished is None]
+        for future in futures:
+            future.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
@@ -79,6 +79,12 @@ class TriggerLoader:
             return state, self.messages[state.trigger]
         return state, None
     
+    def timeout(self, trigger: str) -> float:
+        """
+        Seconds a utility may take, None for no limit.
+        """
+        return self.timeouts.get(trigger)
+
     def manifest(self) -> list:
         return self.swift.manifest()
 
@@ -128,6 +134,11 @@ class TriggerLoader:
             for triplet in utility_routines + power_routines
         }
 
+        self.timeouts = {
+            triplet[0]: utils[triplet[2]][triplet[0]].get('timeout')
+            for triplet in utility_routines + power_routines
+        }
+
         self.utils = self.messages.keys()
 
     def __get_util(self, routine: str) -> typing.Callable:
@@ -1,5 +1,6 @@
 #!/usr/bin/python3
 
+import asyncio
 import datetime
 import logging
 import os
@@ -15,9 +16,16 @@ import psutil
 from src.common.config import Constants
 
 class UTIL:
+    '''
+    Utilities of the bot, each returning a status and a message.
+
+    Coroutine functions are async-native, they run on the event loop of
+    the bot; the rest are blocking, and run in a helper thread (see
+    Runtime.call).
+    '''
 
     @staticmethod
-    def get_local_time() -> dict:
+    async def get_local_time() -> dict:
         '''
         Get the current local time and return it as a formatted string.
     
@@ -29,7 +37,7 @@ class UTIL:
             str: A string representing the current local time in a human-readable format.
 
         Example:
-            >>> local_time = MyClass.get_local_time()
+            >>> local_time = await MyClass.get_local_time()
             >>> print(local_time)
             'Mon Sep 29 15:48:03 2023'
         '''
@@ -47,7 +55,7 @@ class UTIL:
             }
 
     @staticmethod
-    def get_current_working_directory():
+    async def get_current_working_directory():
         '''
         Get the current working directory as a string.
 
@@ -59,7 +67,7 @@ class UTIL:
             str: A string representing the absolute path of the current working directory.
 
         Example:
-            >>> cwd = MyClass.get_current_working_directory()
+            >>> cwd = await MyClass.get_current_working_directory()
             >>> print(cwd)
             '/path/to/current/directory'        
         '''
@@ -77,7 +85,7 @@ class UTIL:
     
 
     @staticmethod
-    def get_local_ip_address():
+    async def get_local_ip_address():
         '''
         Retrieves the IP address of the machine within a router network.
 
@@ -110,7 +118,7 @@ class UTIL:
             }
     
     @staticmethod
-    def get_connected_ssid():
+    async def get_connected_ssid():
         '''
         Retrieves the SSID of the Wi-Fi router the Raspberry Pi is currently connected to.
 
@@ -118,7 +126,18 @@ class UTIL:
             str or None: The SSID of the connected Wi-Fi network, or None if not connected to any network.
         '''
         try:
-            output = subprocess.check_output(["iwconfig", "wlan0"])
+            process = await asyncio.create_subprocess_exec(
+                "iwconfig", "wlan0", stdout=asyncio.subprocess.PIPE
+            )
+            try:
+                output, _ = await process.communicate()
+            finally:
+                if process.returncode is None:
+                    # Timed out
+                    process.kill()
+                    await process.wait()
+            if process.returncode:
+                raise subprocess.CalledProcessError(process.returncode, ["iwconfig", "wlan0"])
             output = output.decode()
 
             # Use regular expressions to extract the SSID from the output
@@ -268,7 +287,7 @@ class UTIL:
 
 
 if __name__ == '__main__':
-    print(UTIL.get_local_ip_address())
-    print(UTIL.get_connected_ssid())
+    print(asyncio.run(UTIL.get_local_ip_address()))
+    print(asyncio.run(UTIL.get_connected_ssid()))
     print(UTIL.get_cpu_temperature())
     print(UTIL.discover_wireless_siblings())
\ No newline at end of file
@@ -7,6 +7,8 @@ import traceback
 
 from src.common.Flow import Flow
 from src.common.response import Response
+from src.services.conduit import Conduit
+from src.services.courier import Courier
 from src.services.informio import Informio
 from src.services.librarian import Librarian
 
@@ -22,6 +24,8 @@ class FileLocator(Flow):
         path (str): Directory to search in
         pattern (str): String to match
         domain (str): Either "title" or "content"
+        limit (int) [Optional]: Maximum number of files to list
+        regex (bool) [Optional]: Whether pattern is a regular expression (Only for "content")
 
     Raises:
         ValueError: If any of the Args are not provided
@@ -47,6 +51,7 @@ class FileLocator(Flow):
             path_to_search = args.get('path')
             string_to_match = args.get('pattern')
             domain = args.get('domain')
+            limit = args.get('limit')
 
             if domain not in ['title', 'content']:
                 raise ValueError('Invalid value for domain. domain must be in ["title", "content"]')
@@ -54,9 +59,9 @@ class FileLocator(Flow):
             lib = Librarian()
 
             if domain == 'title':
-                response = lib.title_tracker(path_to_search, string_to_match)
+                response = lib.title_tracker(path_to_search, string_to_match, limit)
             else:
-                response = lib.content_curator(path_to_search, string_to_match)
+                response = lib.content_curator(path_to_search, string_to_match, limit, bool(args.get('regex')))
 
             if response['status'] == 'error':
                 return response
@@ -67,7 +72,8 @@ class FileLocator(Flow):
 
             return {
                 'status': 'success',
-                'files': files
+                'files': files,
+                'matches': response.get('matches')
             }
 
         except Exception as e:
@@ -92,6 +98,13 @@ class FileLocator(Flow):
             files = resp['files']
             if files == []:
                 response = Response('info', 'No file found')
+            elif resp.get('matches'):
+                response = Response('success', 'Your moment of anticipation is over. Here ya go!')
+                response += Response('info', 'Files found (most hits first):')
+                for match in resp['matches']:
+                    response += Response('general', f"\n{match['path']} ({match['hits']} hits)")
+                    for snippet in match['snippets']:
+                        response += Response('info', f"\n  {snippet['line']}: {snippet['text']}")
             else:
                 response = Response('success', 'Your moment of anticipation is over. Here ya go!')
                 response += Response('info', 'Files found:')
@@ -131,12 +144,19 @@ class FileUploader(Flow):
         path (str): The path to the file or folder to be uploaded
         compress (bool) [True/False]: Whether to compress the file in a Zip
         password (str) [Optional]: Password to protect the zip
+        bulk (bool) [Optional]: Whether to upload the files of the folder one by one instead of zipped
 
     Notes:
         "path" must be a valid path.
         If "path" points to a valid directory, the directory will be automatically zipped irrespective of the compress option.
         If "path" points to a valid file, "compress" will decide whether the file should be zipped or not.
         "password", if provided, must not contain spaces.
+        Archiving progress (and throughput) is reported periodically while the zip is built.
+        The zip is streamed into the upload as it is built, unless disabled (librarian.conduit),
+        in which case it is written next to "path" first.
+        With "bulk", the files are uploaded as is, several at a time. Interrupted uploads resume
+        where they stopped on the next run, and files already in the Drive folder are skipped.
+        The progress of bulk uploads (of any process) is reported by ps.
 
     Example args:
     Example 1: {
@@ -153,6 +173,10 @@ class FileUploader(Flow):
         "compress": true
         # If password is not provided, directory will not be encrypted
     }
+    Example 4: {
+        "path": "/home/suman/Pictures",
+        "bulk": true
+    }
     """
 
     traces = []
@@ -168,9 +192,15 @@ class FileUploader(Flow):
             file_path = args.get('path')
             compress = os.path.isdir(file_path) or args.get('compress')
             
-            if compress:
+            if args.get('bulk'):
+                response = lib.tomes_transporter(file_path, getattr(self, 'delivery_listener', None))
+            elif compress and Conduit.enabled():
+                # Zipped on the fly, straight into the upload
+                password = args.get('password', None)
+                response = lib.stream_transporter(file_path, password, getattr(self, 'listener', None))
+            elif compress:
                 password = args.get('password', None)
-                resp = lib.archive_creator(file_path, password)
+                resp = lib.archive_creator(file_path, password, getattr(self, 'listener', None))
                 if resp['status'] == 'error':
                     return resp
                 response = lib.tome_transporter(resp['zip_file_path'])
@@ -193,13 +223,43 @@ class FileUploader(Flow):
 
         time.sleep(1)
 
+        def progress(archived: int, total: int, elapsed: float):
+            percent = 100 * archived / total if total else 100
+            update = Response(
+                'info',
+                f'Archiving: {percent:.0f}% ({archived / 2**20:.0f}/{total / 2**20:.0f} MB) at {archived / 2**20 / elapsed:.1f} MB/s'
+            )
+            informio.send_message(str(update))
+
+        def delivery(status: dict):
+            percent = 100 * status['sent'] / status['bytes'] if status['bytes'] else 100
+            update = Response(
+                'info',
+                f"Uploading: {percent:.0f}% ({status['done']}/{status['files'] - status['duplicates']} files, "
+                f"{status['duplicates']} already in Drive, {status['failed']} failed)"
+            )
+            informio.send_message(str(update))
+
+        self.listener = progress
+        self.delivery_listener = delivery
         resp = self.exec(args)
 
         self.respond_discord(resp, informio)
 
     def respond_discord(self, resp: collections.defaultdict, informio: Informio):
         
-        if resp['status'] == 'success':
+        if 'uploaded' in resp:
+            response = Response(
+                'success' if resp['status'] == 'success' else 'error',
+                f"{len(resp['uploaded'])} files uploaded, {len(resp['duplicates'])} already in Drive, "
+                f"{len(resp['failed'])} failed\n"
+            )
+            for file in resp['uploaded']:
+                response += Response('general', f"{file['path']}: {file['webViewLink']}")
+            for path, error in resp['failed'].items():
+                response += Response('error', f"{path}: {error}")
+
+        elif resp['status'] == 'success':
             response = Response('success', 'Your moment of anticipation is over. Here ya go!')
             response += Response('info', 'File has been uploaded\n')
             
@@ -224,12 +284,13 @@ class FileUploader(Flow):
 
     @classmethod
     def ps(cls) -> list:
-        return cls.traces
+        return Courier.progress() + cls.traces
 
     @classmethod
     def purge(cls) -> bool:
         try:
             cls.traces.clear()
+            Courier.purge()
             return True
         except:
             return False
\ No newline at end of file
@@ -2,6 +2,7 @@
 
 import collections
 import io
+import json
 import time
 import traceback
 
@@ -23,9 +24,16 @@ class RemoteScriptExecution(Flow):
         source (str): The source code of the Script
         time_limit (int): Time limit for the Job in seconds
         memory_limit (int): Memory limit for the Job in Kilobytes
-        stdin (str): Standard input (Empty String for No input)
+        stdin (str | list): Standard input (Empty String for No input). A list of stdin cases runs the Script against each of them
+        expected (list) [Optional]: Expected stdout of each stdin case, to judge the cases AC/WA
         source_file_name (str): Name of the file to which source has to be written (Not required if lang in C, CPP, PYTHON)
         path (str): Target location for Execution
+        pooled (bool) [Optional]: Run JAVA jobs on the warm JVM pool (Defaults to jvm_pool.enabled in rse.json)
+        warm (bool) [Optional]: Run PYTHON jobs on the pre-forked interpreter (Defaults to zygote.enabled in rse.json)
+
+    Output is streamed while the job runs: the latest output is posted every
+    stream.interval seconds, outputs beyond stream.spill MB are spilled to disk,
+    and the job is killed once an output exceeds stream.cap MB (see rse.json).
 
     Raises:
         ValueError: If any of the Args are not provided
@@ -55,7 +63,7 @@ class RemoteScriptExecution(Flow):
 
     def exec(self, args: collections.defaultdict) -> dict:
         try:
-            rse_obj = Remo(args)
+            rse_obj = Remo(args, listener=getattr(self, 'listener', None))
             response = rse_obj.run()
             self.traces.append(response)
             return response
@@ -67,24 +75,48 @@ class RemoteScriptExecution(Flow):
             }
         
     def capture_discord(self, args: collections.defaultdict, informio: Informio):
-        acknowledgement = Response('success', f'{self.trigger()} request has been captured. Please wait!')
+        if Remo.scheduler.is_full():
+            response = Response('warning', f'{self.trigger()} is busy, the job queue is full. Please retry later!')
+            informio.send_message(str(response))
+            return
+
+        jobs_ahead = Remo.scheduler.status()['admitted']
+        acknowledgement = Response('success', f'{self.trigger()} request has been captured ({jobs_ahead} jobs ahead). Please wait!')
         informio.send_message(str(acknowledgement))
 
         time.sleep(1)
 
         if 'attachment' in args:
             args['source'] = args['attachment']
-        
+
+        def progress(stdout: str, stderr: str, elapsed: float):
+            update = Response('info', f'Still running after {elapsed:.0f}s, latest output:')
+            update += Response('info', f'\nstdout: ...{stdout}' if stdout else '\nstdout: <empty>')
+            if stderr:
+                update += Response('warning', f'\nstderr: ...{stderr}')
+            informio.send_message(str(update))
+
+        self.listener = progress
         resp = self.exec(args)
 
         self.respond_discord(resp, informio)
 
     def respond_discord(self, resp: collections.defaultdict, informio: Informio):
         
-        if resp['status'] == 'success':
+        if resp['status'] == 'success' and 'cases' in resp:
+            files_to_upload = [
+                (io.BytesIO(json.dumps(resp['cases'], indent=4).encode()), 'cases.json')
+            ]
+            summary = ', '.join(f'{verdict}: {count}' for verdict, count in resp['summary'].items())
+            response = Response('success', 'Your moment of anticipation is over. Here ya go!')
+            response += Response('info', f"\n{len(resp['cases'])} cases, {summary}")
+
+            informio.send_message(str(response), files=files_to_upload)
+
+        elif resp['status'] == 'success':
             files_to_upload = [
                 (io.BytesIO(resp['stdout'].encode()), 'stdout'),
-                (io.BytesIO(resp['stderr'].encode()), 'stderr')
+                (io.BytesIO(resp['stderr'].encode()), 'stderr'),
             ]
             response = Response('success', 'Your moment of anticipation is over. Here ya go!')
 
@@ -102,12 +134,12 @@ class RemoteScriptExecution(Flow):
 
     @classmethod
     def ps(cls) -> list:
-        return cls.traces
+        return [Remo.scheduler.status()] + cls.traces
 
     @classmethod
     def purge(cls) -> bool:
         try:
             cls.traces.clear()
-            return True
+            return Remo.purge()
         except:
             return False
\ No newline at end of file
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import collections
+import json
+import traceback
+
+from src.common.Flow import Flow
+from src.common.response import Response
+from src.common.runtime import Runtime
+from src.services.informio import Informio
+
+
+class ProcessStatus(Flow):
+    """
+    Shows the tasks of the bot, and the status of every flow
+
+    Trigger:
+        !ps
+
+    Execution Args:
+        cancel (int) [Optional]: ID of a task to cancel
+        purge (bool) [Optional]: Whether to purge the traces of the flows
+
+    Notes:
+        Tasks are listed with their flow, mode (process or task), state
+        (queued, running, done, failed or cancelled), pid and timings.
+        Runs in the bot process (see Runtime), where the tasks are.
+
+    Example args:
+    Example 1: (none)
+    Example 2: {
+        "cancel": 4
+    }
+    """
+
+    traces = []
+
+    @classmethod
+    def trigger(cls) -> str:
+        return '!ps'
+
+    def exec(self, args: collections.defaultdict) -> dict:
+        try:
+            if args.get('cancel') is not None:
+                return Runtime.cancel(int(args.get('cancel')))
+
+            flows = {
+                flow.trigger(): flow for flow in Flow.discover_descendants() if flow is not ProcessStatus
+            }
+
+            if args.get('purge'):
+                purged = [trigger for trigger, flow in flows.items() if flow.purge()]
+                return {'status': 'success', 'message': f"Purged {', '.join(purged)}"}
+
+            return {
+                'status': 'success',
+                'tasks': Runtime.ps(),
+                'flows': {trigger: flow.ps() for trigger, flow in flows.items()},
+            }
+
+        except Exception as e:
+            return {
+                'status': 'error',
+                'message': traceback.format_exc()
+            }
+
+    def capture_discord(self, args: collections.defaultdict, informio: Informio):
+        resp = self.exec(args)
+
+        self.respond_discord(resp, informio)
+
+    def respond_discord(self, resp: collections.defaultdict, informio: Informio):
+
+        if resp['status'] == 'success' and 'tasks' in resp:
+            response = Response('success', f"{len(resp['tasks'])} tasks\n")
+            for task in resp['tasks']:
+                kind = {'failed': 'error', 'cancelled': 'warning'}.get(task['state'], 'general')
+                response += Response(
+                    kind,
+                    f"#{task['id']} {task['flow']} [{task['mode']}] {task['state']}"
+                    f" pid={task['pid']} waited={task['waited']}s elapsed={task['elapsed']}s\n"
+                )
+            for trigger, status in resp['flows'].items():
+                response += Response('info', f"\n{trigger}: ")
+                response += Response('general', json.dumps(status, default=str))
+
+        elif resp['status'] == 'success':
+            response = Response('success', resp['message'])
+
+        else:
+            response_text = "It appears we've encountered an unexpected problem!\n"
+            response_text += '\n'.join(
+                [
+                    f'{key}: {value}' for key, value in resp.items()
+                ]
+            )
+            response = Response('error', response_text)
+
+        informio.send_message(str(response))
+
+    @classmethod
+    def ps(cls) -> list:
+        return Runtime.ps()
+
+    @classmethod
+    def purge(cls) -> bool:
+        return True
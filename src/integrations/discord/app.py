@@ -1,12 +1,17 @@
 #!/usr/bin/python3
 
+import asyncio
 import functools
 
 import src.integrations.discord.bot as bot
+from src.common.artificer import Artificer
 from src.common.config import Constants
 from src.common.response import Response
+from src.common.runtime import Runtime
 from src.common.trigger_loader import TriggerLoader
+from src.services.bifrost import Bifrost
 from src.services.informio import Informio
+from src.services.sentinel import Sentinel
 
 
 def __send_welcome():
@@ -20,8 +25,21 @@ def __send_welcome():
 
     states_and_messages = list(map(trigger_loader.fetch, triggers))
 
+    async def report(trigger, state) -> dict:
+        timeout = trigger_loader.timeout(trigger)
+        try:
+            return await Runtime.call(state.job, timeout)
+        except asyncio.TimeoutError:
+            return {'status': 'error', 'message': f'Timed out after {timeout}s'}
+
+    async def gather() -> list:
+        # All at once, the slowest (e.g. a network sweep) sets the pace
+        return await asyncio.gather(
+            *[report(trigger, state) for trigger, (state, _) in zip(triggers, states_and_messages)]
+        )
+
     responses = [
-        (message, state.job()) for state, message in states_and_messages
+        (message, result) for (_, message), result in zip(states_and_messages, asyncio.run(gather()))
     ]
 
     responses = map(
@@ -48,5 +66,8 @@ def __send_welcome():
     Informio().send_message(str(welcome_message))
 
 def start():
+    Artificer.warm_up()
     __send_welcome()
+    Sentinel.start()
+    Bifrost.warm_up()
     bot.main()
\ No newline at end of file
@@ -3,12 +3,12 @@
 import asyncio
 import logging
 
-import discord, multiprocessing
+import discord
 
 from src.common.config import Constants
+from src.common.runtime import Runtime
 from src.integrations.discord.command_matrix import CommandMatrix
 from src.services.informio import Informio
-from src.services.librarian import download
 
 
 class Bot(discord.Client):
@@ -23,15 +23,12 @@ class Bot(discord.Client):
         logging.info(ready_message)
         print(ready_message)
 
+    async def close(self):
+        # Winds up the flows still running, their processes included
+        await Runtime.shutdown()
+        await super().close()
+
     async def on_message(self, message: discord.Message):
-        if message.content == 'drive':
-            process = multiprocessing.Process(
-                target=download
-            )
-            process.start()
-            await message.reply('Download started')
-            return
-        
         if message.author == self.user:
             logging.info('Message from Self')
             return
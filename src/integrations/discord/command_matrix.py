@@ -1,11 +1,12 @@
 #!/usr/bin/python3
 
-import multiprocessing
+import asyncio
 import traceback
 
 import discord
 
 from src.common.response import Response
+from src.common.runtime import Runtime
 from src.common.trigger_loader import TriggerLoader
 from src.integrations.discord.cyberparser import CyberParser
 from src.services.informio import Informio
@@ -46,15 +47,21 @@ class CommandMatrix:
                         signature["command"]
                     )
 
+                    timeout = self.trigger_loader.timeout(signature["command"])
+
                     if state.trigger_type == "power":
                         response = Response("warning", routine_message)
                         await message.reply(str(response))
-                        state.job()
+                        await Runtime.call(state.job, timeout)
 
                     else:
                         assert state.trigger_type == "utility"
-                        routine_message += str(state.job())
-                        response = Response("info", routine_message)
+                        try:
+                            # Off the event loop, or async-native (see UTIL)
+                            routine_message += str(await Runtime.call(state.job, timeout))
+                            response = Response("info", routine_message)
+                        except asyncio.TimeoutError:
+                            response = Response("error", f"{routine_message}timed out after {timeout}s")
                         await message.reply(str(response))
 
                 else:
@@ -67,12 +74,23 @@ class CommandMatrix:
 
                     state, _ = self.trigger_loader.fetch(command)
 
-                    # Spawn a new process that doesn't interrupt with the state of bot
-                    process = multiprocessing.Process(
-                        target=state.job().capture_discord,
-                        args=(args, self.informio),
-                    )
-                    process.start()
+                    try:
+                        # Runs apart from the bot, in a process or a thread (see Runtime)
+                        task = Runtime.submit(
+                            command, state.job().capture_discord, (args, Informio())
+                        )
+                    except Runtime.Busy as e:
+                        response = Response("warning", f"{command} cannot be taken: {e}")
+                        await message.reply(str(response))
+                        return
+
+                    # Lets the task start, unless it has to wait for a slot
+                    await asyncio.sleep(0)
+                    if task.state == Runtime.QUEUED:
+                        response = Response(
+                            "info", f"{command} queued as task {task.id}, {Runtime.pending() - 1} tasks ahead"
+                        )
+                        await message.reply(str(response))
 
         except Exception as e:
             response = Response('exception', traceback.format_exc())
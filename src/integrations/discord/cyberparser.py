@@ -35,15 +35,22 @@ class CyberParser:
         return signature
 
     def __parse_flow_request(self, message: str) -> dict:
-        command, content = re.split(r'\s+', message.strip(), 1)
+        command, *content = re.split(r'\s+', message.strip(), 1)
+        content = content[0] if content else ''
         signature = dict()
 
         try:
 
-            if content.startswith('{') and content.endswith('}'):
+            if not content:
+                # A flow without arguments
+                signature['kind'] = 'flow'
+                signature['command'] = command
+                signature['args'] = collections.defaultdict(lambda: None)
+
+            elif content.startswith('{') and content.endswith('}'):
                 try:
                     json_body = json.loads(content)
-                    signature['king'] = 'flow'
+                    signature['kind'] = 'flow'
                     signature['command'] = command
                     signature['args'] = json_body
                 
@@ -0,0 +1,178 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.nio.file.StandardCopyOption;
+import java.security.Permission;
+
+/*
+ * Long-lived JVM used by the Barista pool (see barista.py).
+ *
+ * Listens on a loopback port (written to the file given as the only
+ * argument) and serves one job at a time. Every job is loaded in its own
+ * class loader, so static state never leaks between jobs.
+ *
+ * Request:  [int n][n bytes classpath] [int n][n bytes main class] [int n][n bytes stdin]
+ * Response: [int status][long elapsed nanos] [int n][n bytes stdout] [int n][n bytes stderr]
+ */
+public class PoolWorker {
+    private static final PrintStream STDOUT = System.out;
+    private static final PrintStream STDERR = System.err;
+    private static final InputStream STDIN = System.in;
+
+    // Status reported when the job terminated the JVM through System.exit
+    // and the exit status could not be trapped
+    private static final int ABANDONED = Integer.MIN_VALUE;
+
+    private static volatile Thread jobThread;
+    private static volatile DataOutputStream reply;
+    private static volatile ByteArrayOutputStream jobOut;
+    private static volatile ByteArrayOutputStream jobErr;
+    private static volatile long jobStart;
+
+    private static class ExitTrap extends SecurityException {
+        private final int status;
+
+        ExitTrap(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        trapExits();
+        Runtime.getRuntime().addShutdownHook(new Thread(PoolWorker::abandon));
+
+        ServerSocket server = new ServerSocket(0, 1, InetAddress.getLoopbackAddress());
+
+        Path portFile = Paths.get(args[0]);
+        Path staging = Paths.get(args[0] + ".tmp");
+        Files.write(staging, String.valueOf(server.getLocalPort()).getBytes(StandardCharsets.UTF_8));
+        Files.move(staging, portFile, StandardCopyOption.REPLACE_EXISTING, StandardCopyOption.ATOMIC_MOVE);
+
+        while (true) {
+            try (Socket socket = server.accept()) {
+                serve(socket);
+            } catch (IOException e) {
+                e.printStackTrace(STDERR);
+            }
+        }
+    }
+
+    @SuppressWarnings("removal")
+    private static void trapExits() {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkPermission(Permission permission) {
+                }
+
+                @Override
+                public void checkExit(int status) {
+                    if (Thread.currentThread() == jobThread) {
+                        throw new ExitTrap(status);
+                    }
+                }
+            });
+        } catch (Throwable e) {
+            // Security managers are disabled on this JVM, System.exit
+            // from a job is handled by the shutdown hook instead
+        }
+    }
+
+    private static byte[] readFrame(DataInputStream in) throws IOException {
+        byte[] frame = new byte[in.readInt()];
+        in.readFully(frame);
+        return frame;
+    }
+
+    private static void writeFrame(DataOutputStream out, byte[] frame) throws IOException {
+        out.writeInt(frame.length);
+        out.write(frame);
+    }
+
+    private static synchronized void respond(int status) {
+        DataOutputStream out = reply;
+        if (out == null) {
+            return;
+        }
+        reply = null;
+
+        System.out.flush();
+        System.err.flush();
+
+        try {
+            out.writeInt(status);
+            out.writeLong(System.nanoTime() - jobStart);
+            writeFrame(out, jobOut.toByteArray());
+            writeFrame(out, jobErr.toByteArray());
+            out.flush();
+        } catch (IOException e) {
+            e.printStackTrace(STDERR);
+        }
+    }
+
+    private static void abandon() {
+        respond(ABANDONED);
+    }
+
+    private static void serve(Socket socket) throws IOException {
+        DataInputStream in = new DataInputStream(new BufferedInputStream(socket.getInputStream()));
+        DataOutputStream out = new DataOutputStream(new BufferedOutputStream(socket.getOutputStream()));
+
+        String classpath = new String(readFrame(in), StandardCharsets.UTF_8);
+        String mainClass = new String(readFrame(in), StandardCharsets.UTF_8);
+        byte[] stdin = readFrame(in);
+
+        jobOut = new ByteArrayOutputStream();
+        jobErr = new ByteArrayOutputStream();
+        jobStart = System.nanoTime();
+        jobThread = Thread.currentThread();
+        reply = out;
+
+        System.setIn(new ByteArrayInputStream(stdin));
+        System.setOut(new PrintStream(jobOut, true));
+        System.setErr(new PrintStream(jobErr, true));
+
+        int status = 0;
+        URL[] urls = {Paths.get(classpath).toUri().toURL()};
+        try (URLClassLoader loader = new URLClassLoader(urls, ClassLoader.getSystemClassLoader().getParent())) {
+            Method main = loader.loadClass(mainClass).getMethod("main", String[].class);
+            main.invoke(null, (Object) new String[0]);
+        } catch (InvocationTargetException e) {
+            Throwable cause = e.getCause();
+            if (cause instanceof ExitTrap) {
+                status = ((ExitTrap) cause).status;
+            } else {
+                System.err.print("Exception in thread \"main\" ");
+                cause.printStackTrace();
+                status = 1;
+            }
+        } catch (Throwable e) {
+            e.printStackTrace();
+            status = 1;
+        } finally {
+            jobThread = null;
+            respond(status);
+            System.setIn(STDIN);
+            System.setOut(STDOUT);
+            System.setErr(STDERR);
+        }
+    }
+}
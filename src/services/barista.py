@@ -0,0 +1,361 @@
+#!/usr/bin/python3
+
+import collections
+import contextlib
+import fcntl
+import functools
+import logging
+import os
+import re
+import signal
+import socket
+import struct
+import subprocess
+import time
+import traceback
+
+import src.common.config as config
+
+
+class ClassFile:
+    """
+    A minimal reader for the JVM class file format.
+
+    Only walks the constant pool and the member tables, which is all
+    that is needed to find the entry points of the compiled classes
+    without forking a disassembler per class.
+    """
+
+    ACC_PUBLIC = 0x0001
+    ACC_STATIC = 0x0008
+
+    MAIN_DESCRIPTOR = '([Ljava/lang/String;)V'
+
+    # Sizes of the constant pool entries, keyed by tag (excluding the tag itself)
+    CONSTANT_SIZES = {
+        3: 4, 4: 4, 5: 8, 6: 8, 7: 2, 8: 2, 9: 4, 10: 4,
+        11: 4, 12: 4, 15: 3, 16: 2, 17: 4, 18: 4, 19: 2, 20: 2
+    }
+
+    @classmethod
+    def methods(cls, byte_code: bytes) -> list:
+        """
+        Lists the methods declared in a class file.
+
+        Returns:
+            list: A list of (access_flags, name, descriptor) tuples.
+        """
+        magic, = struct.unpack_from('>I', byte_code, 0)
+        if magic != 0xCAFEBABE:
+            raise ValueError('Not a class file')
+
+        pool_count, = struct.unpack_from('>H', byte_code, 8)
+        offset = 10
+        strings = dict()
+
+        index = 1
+        while index < pool_count:
+            tag = byte_code[offset]
+            if tag == 1:
+                length, = struct.unpack_from('>H', byte_code, offset + 1)
+                strings[index] = byte_code[offset + 3:offset + 3 + length].decode(errors='replace')
+                offset += 3 + length
+            else:
+                offset += 1 + cls.CONSTANT_SIZES[tag]
+            # Long and Double constants take up two entries
+            index += 2 if tag in (5, 6) else 1
+
+        # access_flags, this_class, super_class
+        offset += 6
+        interfaces_count, = struct.unpack_from('>H', byte_code, offset)
+        offset += 2 + 2 * interfaces_count
+
+        methods = []
+        for table in ['fields', 'methods']:
+            members_count, = struct.unpack_from('>H', byte_code, offset)
+            offset += 2
+            for _ in range(members_count):
+                flags, name, descriptor, attributes_count = struct.unpack_from('>HHHH', byte_code, offset)
+                offset += 8
+                for _ in range(attributes_count):
+                    length, = struct.unpack_from('>I', byte_code, offset + 2)
+                    offset += 6 + length
+                if table == 'methods':
+                    methods.append((flags, strings[name], strings[descriptor]))
+
+        return methods
+
+    @classmethod
+    def has_main_method(cls, path) -> bool:
+        with open(path, 'rb') as class_file:
+            byte_code = class_file.read()
+
+        entry_point = cls.ACC_PUBLIC | cls.ACC_STATIC
+        return any(
+            name == 'main' and descriptor == cls.MAIN_DESCRIPTOR and flags & entry_point == entry_point
+            for flags, name, descriptor in cls.methods(byte_code)
+        )
+
+
+class Barista:
+    """
+    A pool of warm JVMs serving Executor.JAVA jobs.
+
+    Each worker is a long-lived PoolWorker process (see PoolWorker.java)
+    listening on a loopback port. Workers are detached from the process that
+    spawned them, so they outlive the flow and are reused by later jobs.
+
+    Every worker slot is guarded by a lock file; whoever holds the lock owns
+    the worker, and (re)spawns it when it is missing. A job that exceeds its
+    time limit takes its worker down with it.
+
+    The heap of the workers is fixed (-Xmx, from memory_limit.JAVA), only
+    the jobs with that memory limit are pooled, the others run on a cold
+    JVM. A job that calls System.exit is reported as RE, with its status
+    where a security manager can trap it (up to Java 23), and the worker
+    is replaced if it could not. Threads a job spawns are not stopped when
+    it ends, they keep running in the worker (and using its CPU and heap)
+    until they finish or the worker is retired.
+
+    Layout of the pool directory:
+        PoolWorker.class        Compiled worker
+        worker-<N>.lock         Slot lock
+        worker-<N>.port         Port of the worker, written by the worker
+        worker-<N>.pid          PID of the worker
+    """
+
+    # Status reported by the worker when a job called System.exit
+    # and the exit status could not be trapped
+    ABANDONED = -2**31
+
+    @classmethod
+    def load(cls) -> dict:
+        return config.Constants.rse['jvm_pool']
+
+    @classmethod
+    def heap(cls) -> int:
+        """
+        Heap of the workers, in Kilobytes.
+        """
+        return config.Constants.rse['memory_limit']['JAVA'] * 1024
+
+    @classmethod
+    def enabled(cls, task) -> bool:
+        """
+        Whether the job runs on a pooled JVM, only if its memory limit is the heap of the workers.
+        """
+        pooled = getattr(task, 'pooled', cls.load()['enabled'])
+        return pooled and getattr(task, 'memory_limit', cls.heap()) == cls.heap()
+
+    @classmethod
+    def directory(cls) -> str:
+        path = os.path.expanduser(cls.load()['path'])
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def java_version() -> int:
+        output = subprocess.run(['java', '-version'], capture_output=True, text=True).stderr
+        major, minor = re.search(r'version "(\d+)(?:\.(\d+))?', output).groups()
+        # Versions prior to 9 are reported as 1.x
+        return int(minor) if major == '1' else int(major)
+
+    @classmethod
+    def __brew(cls) -> str:
+        """
+        Compiles PoolWorker.java into the pool directory, if outdated.
+        """
+        directory = cls.directory()
+        source = os.path.join(os.path.dirname(__file__), 'PoolWorker.java')
+        target = os.path.join(directory, 'PoolWorker.class')
+
+        with open(os.path.join(directory, '.brew.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+                logging.info(f"Compiling {source} into {directory}")
+                subprocess.run(['javac', '-d', directory, source], capture_output=True, check=True)
+
+        return directory
+
+    @classmethod
+    @contextlib.contextmanager
+    def __acquire(cls):
+        """
+        Yields the index of a free worker slot, waiting for one if necessary.
+        """
+        size = cls.load()['size']
+        directory = cls.directory()
+        lock_files = [open(os.path.join(directory, f'worker-{slot}.lock'), 'w') for slot in range(size)]
+
+        try:
+            slot = None
+            while slot is None:
+                for index, lock_file in enumerate(lock_files):
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        slot = index
+                        break
+                    except BlockingIOError:
+                        continue
+                else:
+                    time.sleep(0.05)
+
+            try:
+                yield slot
+            finally:
+                fcntl.flock(lock_files[slot], fcntl.LOCK_UN)
+
+        finally:
+            for lock_file in lock_files:
+                lock_file.close()
+
+    @classmethod
+    def __read(cls, slot: int, suffix: str):
+        try:
+            with open(os.path.join(cls.directory(), f'worker-{slot}.{suffix}')) as file:
+                return int(file.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @classmethod
+    def __is_alive(cls, slot: int) -> bool:
+        pid = cls.__read(slot, 'pid')
+        if pid is None or cls.__read(slot, 'port') is None:
+            return False
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+
+    @classmethod
+    def __spawn(cls, slot: int) -> None:
+        directory = cls.__brew()
+        port_file = os.path.join(directory, f'worker-{slot}.port')
+        pid_file = os.path.join(directory, f'worker-{slot}.pid')
+
+        for file in [port_file, pid_file]:
+            if os.path.exists(file):
+                os.remove(file)
+
+        shell_cmds = ['java', f'-Xmx{cls.heap()}k']
+        if cls.java_version() >= 12:
+            shell_cmds.append('-Djava.security.manager=allow')
+        shell_cmds += ['-cp', directory, 'PoolWorker', port_file]
+
+        logging.info(f"Spawning JVM worker {slot}")
+        process = subprocess.Popen(
+            shell_cmds,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+        with open(pid_file, 'w') as file:
+            file.write(str(process.pid))
+
+        deadline = time.monotonic() + cls.load()['startup_timeout']
+        while not os.path.exists(port_file):
+            if process.poll() is not None or time.monotonic() > deadline:
+                cls.__retire(slot)
+                raise RuntimeError(f"JVM worker {slot} failed to start")
+            time.sleep(0.02)
+
+    @classmethod
+    def __retire(cls, slot: int) -> None:
+        pid = cls.__read(slot, 'pid')
+        if pid is not None:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+
+        for suffix in ['port', 'pid']:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(cls.directory(), f'worker-{slot}.{suffix}'))
+
+    @staticmethod
+    def __receive(connection: socket.socket, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = connection.recv(min(size, 2**16))
+            if not chunk:
+                raise ConnectionError('JVM worker closed the connection')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    @classmethod
+    def submit(cls, task) -> collections.defaultdict:
+        """
+        Runs the main class of a prepared Executor.JAVA job on a pooled JVM.
+
+        Returns:
+            collections.defaultdict: A response shaped like the one of Executor.exec
+        """
+        response = collections.defaultdict()
+        try:
+            stdin = task.stdin or ''
+            stdin = stdin if isinstance(stdin, bytes) else stdin.encode()
+            frames = [os.path.abspath(task.workspace).encode(), task.main_class.encode(), stdin]
+            request = b''.join(struct.pack('>I', len(frame)) + frame for frame in frames)
+
+            with cls.__acquire() as slot:
+                if not cls.__is_alive(slot):
+                    cls.__spawn(slot)
+
+                try:
+                    address = ('127.0.0.1', cls.__read(slot, 'port'))
+                    with socket.create_connection(address, timeout=task.time_limit) as connection:
+                        connection.sendall(request)
+                        status, elapsed = struct.unpack('>iq', cls.__receive(connection, 12))
+                        stdout_size, = struct.unpack('>I', cls.__receive(connection, 4))
+                        stdout = cls.__receive(connection, stdout_size)
+                        stderr_size, = struct.unpack('>I', cls.__receive(connection, 4))
+                        stderr = cls.__receive(connection, stderr_size)
+
+                except socket.timeout:
+                    cls.__retire(slot)
+                    response['status'] = 'error'
+                    response['verdict'] = 'TLE'
+                    response['message'] = f'Time limit exceeded ({task.time_limit}s)'
+                    return response
+
+                except (ConnectionError, struct.error):
+                    cls.__retire(slot)
+                    raise
+
+                if status == cls.ABANDONED:
+                    # The worker is on its way out, make room for a new one
+                    cls.__retire(slot)
+
+            response['stdout'] = stdout.decode(errors='replace')
+            response['stderr'] = stderr.decode(errors='replace')
+            response['elapsed'] = elapsed / 10**9
+
+            if status == 0:
+                response['status'] = 'success'
+                response['verdict'] = 'OK'
+            elif status == cls.ABANDONED:
+                response['status'] = 'error'
+                response['verdict'] = 'RE'
+                response['message'] = f'Main class {task.main_class} called System.exit, with an unknown exit status'
+            else:
+                response['status'] = 'error'
+                response['verdict'] = 'RE'
+                response['message'] = f'Main class {task.main_class} exited with status {status}'
+
+        except Exception as e:
+            response['status'] = 'error'
+            response['message'] = traceback.format_exc()
+
+        return response
+
+    @classmethod
+    def get_status(cls) -> dict:
+        size = cls.load()['size']
+        return {
+            'pooled': cls.load()['enabled'],
+            'workers': size,
+            'alive': sum(map(cls.__is_alive, range(size))),
+        }
@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import traceback
+
+import src.common.config as config
+from src.services.remo import Remo
+
+
+class Benchmark:
+    """
+    A reproducible benchmark of the Remo/Executor pipeline.
+
+    Runs a fixed corpus of programs through Remo, the way the !rse flow
+    does (a process per job, sharing the Remo scheduler), at increasing
+    concurrency levels. Reports latency percentiles of every phase
+    (see the timings of a Remo response), throughput and peak memory, as
+    JSON, along with the setup they were measured on.
+
+    Usage:
+        python3 -m src.services.benchmark --levels 1 2 4 --rounds 5 --output bench.json
+    """
+
+    CORPUS = {
+        'C': {
+            'source': (
+                "#include <stdio.h>\n"
+                "int main() {\n"
+                "    int n; long long sum = 0;\n"
+                "    scanf(\"%d\", &n);\n"
+                "    for (int i = 0, x; i < n; i++) { scanf(\"%d\", &x); sum += x; }\n"
+                "    printf(\"%lld\\n\", sum);\n"
+                "}\n"
+            ),
+            'stdin': "100000\n" + " ".join(str(i % 1000) for i in range(100000)),
+        },
+        'CPP': {
+            'source': (
+                "#include <bits/stdc++.h>\n"
+                "using namespace std;\n"
+                "int main() {\n"
+                "    int n; cin >> n;\n"
+                "    vector<int> v(n);\n"
+                "    for (auto &x : v) cin >> x;\n"
+                "    sort(v.begin(), v.end());\n"
+                "    cout << v[n / 2] << endl;\n"
+                "}\n"
+            ),
+            'stdin': "100000\n" + " ".join(str(i * 7919 % 100003) for i in range(100000)),
+        },
+        'JAVA': {
+            'source_file_name': 'Sieve.java',
+            'source': (
+                "import java.util.Scanner;\n"
+                "public class Sieve {\n"
+                "    public static void main(String[] args) {\n"
+                "        int n = new Scanner(System.in).nextInt(), count = 0;\n"
+                "        boolean[] composite = new boolean[n + 1];\n"
+                "        for (int i = 2; i <= n; i++) {\n"
+                "            if (composite[i]) continue;\n"
+                "            count++;\n"
+                "            for (long j = (long) i * i; j <= n; j += i) composite[(int) j] = true;\n"
+                "        }\n"
+                "        System.out.println(count);\n"
+                "    }\n"
+                "}\n"
+            ),
+            'stdin': "1000000",
+        },
+        'PYTHON': {
+            'source': (
+                "import functools\n"
+                "@functools.lru_cache(maxsize=None)\n"
+                "def fib(n):\n"
+                "    return n if n < 2 else (fib(n - 1) + fib(n - 2)) % 1000000007\n"
+                "print(sum(fib(i) for i in range(int(input()))) % 1000000007)\n"
+            ),
+            'stdin': "900",
+        },
+    }
+
+    PHASES = ['wait', 'prepare', 'run', 'total']
+
+    @classmethod
+    def submit(cls, lang: str, nonce: int, cold: bool) -> dict:
+        case = cls.CORPUS[lang]
+        args = collections.defaultdict(lambda: None, lang=lang, source=case['source'], stdin=case['stdin'])
+        if 'source_file_name' in case:
+            args['source_file_name'] = case['source_file_name']
+        if cold:
+            # A unique source misses the build cache
+            comment = '#' if lang == 'PYTHON' else '//'
+            args['source'] += f'\n{comment} {nonce} {time.time_ns()}\n'
+
+        try:
+            response = Remo(args).run()
+        except Exception as e:
+            response = {'status': 'error', 'message': traceback.format_exc()}
+
+        return {
+            'lang': lang,
+            'status': response['status'],
+            'timings': response.get('timings', {}),
+            'peak_rss': response.get('peak_rss'),
+            'message': response.get('message'),
+        }
+
+    @staticmethod
+    def percentiles(samples: list) -> dict:
+        if not samples:
+            return {}
+        if len(samples) == 1:
+            cuts = samples * 99
+        else:
+            cuts = statistics.quantiles(samples, n=100, method='inclusive')
+        return {
+            'p50': round(cuts[49], 4),
+            'p95': round(cuts[94], 4),
+            'p99': round(cuts[98], 4),
+            'mean': round(statistics.mean(samples), 4),
+            'max': round(max(samples), 4),
+        }
+
+    @classmethod
+    def summarize(cls, results: list, elapsed: float) -> dict:
+        succeeded = [result for result in results if result['status'] == 'success']
+        peaks = [result['peak_rss'] for result in succeeded if result['peak_rss']]
+
+        summary = {
+            'jobs': len(results),
+            'errors': len(results) - len(succeeded),
+            'elapsed': round(elapsed, 4),
+            'throughput': round(len(succeeded) / elapsed, 4) if elapsed else None,
+            'latency': {
+                phase: cls.percentiles([result['timings'][phase] for result in succeeded if phase in result['timings']])
+                for phase in cls.PHASES
+            },
+            'peak_rss': {
+                'max': max(peaks, default=None),
+                'mean': round(statistics.mean(peaks)) if peaks else None,
+            },
+        }
+
+        errors = collections.Counter(
+            (result['message'] or '').strip().splitlines()[-1:][0] if result['message'] else 'Unknown error'
+            for result in results if result['status'] != 'success'
+        )
+        if errors:
+            summary['error_messages'] = dict(errors)
+
+        return summary
+
+    @classmethod
+    def run(cls, langs: list, levels: list, rounds: int, cold: bool) -> dict:
+        """
+        Args:
+            langs (list): Languages of the corpus to run.
+            levels (list): Numbers of jobs to submit concurrently.
+            rounds (int): Jobs per language, per concurrency level.
+            cold (bool): Make every source unique, bypassing the build cache.
+
+        Returns:
+            dict: The setup and the results per concurrency level, overall and per language.
+        """
+        # Warm up caches and pools, so that only the steady state is measured
+        for lang in langs:
+            cls.submit(lang, -1, cold=False)
+
+        report = {
+            'started': datetime.datetime.now().isoformat(timespec='seconds'),
+            'setup': {
+                'platform': platform.platform(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'python': sys.version.split()[0],
+                'langs': langs,
+                'rounds': rounds,
+                'cold': cold,
+                'rse': config.Constants.rse,
+            },
+            'levels': [],
+        }
+
+        # Jobs are forked, just like flows are, to share the Remo scheduler
+        context = multiprocessing.get_context('fork')
+        for level in levels:
+            jobs = [(lang, nonce) for nonce in range(rounds) for lang in langs]
+
+            started = time.perf_counter()
+            with concurrent.futures.ProcessPoolExecutor(max_workers=level, mp_context=context) as pool:
+                futures = [pool.submit(cls.submit, lang, nonce, cold) for lang, nonce in jobs]
+                results = [future.result() for future in futures]
+            elapsed = time.perf_counter() - started
+
+            entry = {'concurrency': level, 'overall': cls.summarize(results, elapsed)}
+            entry['langs'] = {
+                lang: cls.summarize([result for result in results if result['lang'] == lang], elapsed)
+                for lang in langs
+            }
+            report['levels'].append(entry)
+
+        # Includes the pool workers and the jobs they ran
+        report['harness_peak_rss'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Remo/Executor pipeline')
+    parser.add_argument('--langs', nargs='+', default=list(Benchmark.CORPUS.keys()), choices=list(Benchmark.CORPUS.keys()))
+    parser.add_argument('--levels', nargs='+', type=int, default=[1, 2, 4, 8], help='Concurrency levels')
+    parser.add_argument('--rounds', type=int, default=5, help='Jobs per language, per concurrency level')
+    parser.add_argument('--cold', action='store_true', help='Bypass the build cache')
+    parser.add_argument('--output', help='Write the report to this file instead of stdout')
+    cli_args = parser.parse_args()
+
+    report = Benchmark.run(cli_args.langs, cli_args.levels, cli_args.rounds, cli_args.cold)
+    if cli_args.output:
+        with open(cli_args.output, 'w') as output:
+            json.dump(report, output, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
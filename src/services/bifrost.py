@@ -0,0 +1,294 @@
+#!/usr/bin/python3
+
+import concurrent.futures
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import google_auth_httplib2
+import httplib2
+from google.oauth2 import service_account
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
+
+from src.common.config import Constants
+
+
+class Bifrost:
+    """
+    A process-wide, cached connection to the Google Drive API.
+
+    The service account credentials are loaded once per process, and their
+    access token is refreshed only when it is about to expire. The Drive
+    discovery document is cached on disk, so the client is built without
+    any round-trip (and even offline) once it has been fetched. Every
+    thread gets its own client, on top of its own HTTP connection pool
+    (httplib2 is not thread-safe), reused for all its calls.
+
+    Warmed up in the bot process, the credentials (and their token) and
+    the discovery document are inherited by the forked flows, whose own
+    connections are opened on first use.
+
+    The time spent authenticating, fetching the discovery document and
+    calling the API is tallied in `telemetry`.
+
+    Listings are paginated through (see enumerate), and bulk operations go
+    through the Drive batch endpoint, a few batches at a time, retrying
+    whatever was rate-limited with exponential backoff (see batch).
+
+    The API may be pointed to another endpoint (e.g. test/fake_drive.py).
+    """
+
+    # Answers worth retrying later, the rest are final
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    RATE_LIMITS = {'ratelimitexceeded', 'userratelimitexceeded'}
+
+    DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/drive/v3/rest'
+
+    credentials = None
+    document = None
+    lock = threading.RLock()
+    local = threading.local()
+    telemetry = {
+        kind: {'calls': 0, 'seconds': 0.0} for kind in ['auth', 'discovery', 'api']
+    }
+
+    class Http(httplib2.Http):
+        """
+        A pooled HTTP session, timing its requests in Bifrost.telemetry.
+        """
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # "308 Resume Incomplete" answers resumable uploads, it is no redirect
+            # (googleapiclient.http.build_http does the same)
+            self.redirect_codes = self.redirect_codes - {308}
+
+        def request(self, uri, method='GET', *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return super().request(uri, method, *args, **kwargs)
+            finally:
+                elapsed = Bifrost.record('api', started)
+                logging.debug(f"Drive {method} {uri.split('?')[0]} took {elapsed:.3f}s")
+
+    @classmethod
+    def load(cls) -> dict:
+        return Constants.librarian['bifrost']
+
+    @classmethod
+    def record(cls, kind: str, started: float) -> float:
+        elapsed = time.perf_counter() - started
+        with cls.lock:
+            cls.telemetry[kind]['calls'] += 1
+            cls.telemetry[kind]['seconds'] += elapsed
+        return elapsed
+
+    @classmethod
+    def __authenticate(cls):
+        """
+        Loads the credentials once, and refreshes their token if it expired (or is about to).
+        """
+        with cls.lock:
+            if cls.credentials is None:
+                started = time.perf_counter()
+                cls.credentials = service_account.Credentials.from_service_account_file(
+                    Constants.creds['librarian']['json-key-file'],
+                    scopes=Constants.creds['librarian']['scopes'],
+                )
+                cls.record('auth', started)
+
+            if not cls.credentials.valid:
+                started = time.perf_counter()
+                cls.credentials.refresh(google_auth_httplib2.Request(httplib2.Http(timeout=cls.load()['timeout'])))
+                logging.info(f"Refreshed the Google Drive token in {cls.record('auth', started):.2f}s")
+
+            return cls.credentials
+
+    @classmethod
+    def __discover(cls) -> str:
+        """
+        Loads the discovery document, from the disk cache if there, from Google
+        (or from the copy bundled with googleapiclient, offline) otherwise.
+        """
+        with cls.lock:
+            if cls.document is not None:
+                return cls.document
+
+            path = os.path.expanduser(cls.load()['discovery'])
+            if os.path.exists(path):
+                with open(path) as file:
+                    cls.document = file.read()
+                return cls.document
+
+            started = time.perf_counter()
+            try:
+                response, content = httplib2.Http(timeout=cls.load()['timeout']).request(cls.DISCOVERY_URL)
+                if response.status != 200:
+                    raise httplib2.HttpLib2Error(f'HTTP {response.status}')
+                document = content.decode()
+                json.loads(document)
+            except (httplib2.HttpLib2Error, OSError, ValueError) as e:
+                logging.warning(f"Unable to fetch the Drive discovery document ({e}), using the bundled one")
+                document = get_static_doc('drive', 'v3')
+            cls.record('discovery', started)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f'{path}.part', 'w') as file:
+                file.write(document)
+            os.replace(f'{path}.part', path)
+
+            cls.document = document
+            return cls.document
+
+    @classmethod
+    def connect(cls):
+        """
+        Returns the Drive client of the calling thread, built on first use.
+
+        Returns:
+            googleapiclient.discovery.Resource: An authenticated Google Drive API service.
+        """
+        credentials = cls.__authenticate()
+
+        local = cls.local
+        if getattr(local, 'pid', None) != os.getpid():
+            # Inherited from the parent process, its connections are not ours
+            local.__dict__.clear()
+            local.pid = os.getpid()
+
+        if getattr(local, 'service', None) is None:
+            http = cls.Http(timeout=cls.load()['timeout'])
+            authorized = google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+            document = cls.__discover()
+            if cls.load()['endpoint']:
+                # Moves the upload and batch endpoints along, which an api_endpoint would not
+                document = json.loads(document) | {'rootUrl': cls.load()['endpoint']}
+            local.service = build_from_document(document, http=authorized)
+
+        return local.service
+
+    @classmethod
+    def batch_uri(cls) -> str:
+        """
+        The batch endpoint, which googleapiclient would otherwise always
+        derive from the discovery document, whatever the API endpoint.
+        """
+        document = json.loads(cls.__discover())
+        root = cls.load()['endpoint'] or document['rootUrl']
+        return f"{root}{document.get('batchPath', 'batch')}"
+
+    @classmethod
+    def enumerate(cls, fields: str, query: str = None):
+        """
+        Lists the files of the Drive, page after page.
+
+        Args:
+            fields (str): Fields of every file, e.g. "id, name".
+            query (str) [Optional]: Drive search query, e.g. "trashed = false".
+
+        Yields:
+            dict: The fields of every file.
+        """
+        setup = cls.load()
+        files = cls.connect().files()
+        request = files.list(pageSize=setup['page_size'], q=query, fields=f'nextPageToken, files({fields})')
+        while request is not None:
+            response = request.execute(num_retries=setup['retries'])
+            yield from response.get('files', [])
+            request = files.list_next(request, response)
+
+    @classmethod
+    def __retryable(cls, error: Exception) -> bool:
+        if isinstance(error, HttpError):
+            if error.resp.status in cls.RETRY_STATUSES:
+                return True
+            content = error.content.decode(errors='replace').lower() if error.content else ''
+            return error.resp.status == 403 and any(reason in content for reason in cls.RATE_LIMITS)
+        # Transport errors, the whole batch failed
+        return isinstance(error, (httplib2.HttpLib2Error, OSError))
+
+    @classmethod
+    def __execute(cls, requests: dict, keys: list) -> dict:
+        """
+        Executes the requests of the keys as a single batch, from the client of the calling thread.
+
+        Returns:
+            dict: (response, error) by key.
+        """
+        # Building a collection builds all of its methods, once is enough
+        files = cls.connect().files()
+        outcomes = dict()
+
+        def collect(key, response, error):
+            outcomes[key] = (response, error)
+
+        batch = BatchHttpRequest(callback=collect, batch_uri=cls.batch_uri())
+        for key in keys:
+            batch.add(requests[key](files), request_id=key)
+        try:
+            batch.execute()
+        except Exception as e:
+            return {key: (None, e) for key in keys}
+        return outcomes
+
+    @classmethod
+    def batch(cls, requests: dict) -> dict:
+        """
+        Executes requests through the batch endpoint, in batches of up to
+        `batch_size`, `concurrency` batches at a time. Rate-limited (and
+        failed) requests are retried, with exponential backoff, up to
+        `retries` times.
+
+        Args:
+            requests (dict): Builders of the requests by key (str), called with the
+                files collection of a Drive service, e.g. lambda files: files.delete(fileId=key).
+
+        Returns:
+            dict: (response, error) by key, error being None on success.
+        """
+        setup = cls.load()
+        size = setup['batch_size']
+        outcomes = dict()
+        pending = list(requests)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=setup['concurrency'], thread_name_prefix='bifrost') as pool:
+            for attempt in range(setup['retries'] + 1):
+                if attempt:
+                    delay = min(setup['backoff'] * 2 ** (attempt - 1), setup['max_backoff'])
+                    delay *= random.uniform(0.5, 1)
+                    logging.warning(f"Retrying {len(pending)} Drive requests in {delay:.1f}s")
+                    time.sleep(delay)
+
+                batches = [pending[i:i + size] for i in range(0, len(pending), size)]
+                for executed in pool.map(lambda keys: cls.__execute(requests, keys), batches):
+                    outcomes.update(executed)
+
+                pending = [key for key in pending if cls.__retryable(outcomes[key][1])]
+                if not pending:
+                    break
+
+        return outcomes
+
+    @classmethod
+    def warm_up(cls) -> None:
+        """
+        Authenticates and loads the discovery document ahead of the first call,
+        in the bot process, for the flows to inherit.
+        """
+        try:
+            cls.__authenticate()
+            cls.__discover()
+            logging.info(f"Google Drive client ready: {cls.get_status()}")
+        except Exception as e:
+            logging.warning(f"Unable to warm up the Google Drive client: {e}")
+
+    @classmethod
+    def get_status(cls) -> dict:
+        with cls.lock:
+            return {kind: dict(tally) for kind, tally in cls.telemetry.items()}
@@ -0,0 +1,318 @@
+#!/usr/bin/python3
+
+import collections
+import concurrent.futures
+import contextlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+import zlib
+
+import pyzipper
+from pyzipper.zipfile_aes import AESZipEncrypter, AESZipInfo
+
+from src.common.config import Constants
+
+
+class Bindery:
+    """
+    Binds files into zip archives, compressing them in parallel.
+
+    Every file is compressed (and encrypted, for password protected
+    archives) by a pool of worker processes, as a raw deflate stream
+    written next to the archive. The archive itself is assembled in order
+    by the calling process, which only writes the entry headers and copies
+    the compressed data in, and the central directory is written by
+    zipfile (or pyzipper, for AES archives) on close.
+
+    Files whose extension is listed in `stored` (media and archives, which
+    do not compress any further) are stored as they are; unencrypted ones
+    are not even copied by the workers, which only compute their CRC.
+    Entries smaller than `spill` come back from the workers in memory.
+
+    The archive may also be written to an unseekable stream (e.g. a
+    Conduit), in which case nothing is spilled to disk: files larger than
+    `spill` come back from the workers in memory too, as long as those in
+    flight add up to at most `budget` MB (waiting for the earlier ones to
+    be written out otherwise). Files larger than the budget itself are
+    compressed by the calling process as they are written out, their
+    sizes following their data (in a data descriptor).
+
+    The workers are forked when the pool starts (see pool); a caller with
+    threads of its own (e.g. uploading the archive) should start it before
+    them, and pass it to bind.
+
+    At most `window` entries are in flight, so that the compressed data
+    waiting to be copied in stays bounded whatever the size of the tree.
+    """
+
+    # Flag bit of encrypted entries, and WinZip AES strength of 256-bit keys (as pyzipper writes them)
+    ENCRYPTED = 0x1
+    AES_256 = 3
+
+    @classmethod
+    def load(cls) -> dict:
+        return Constants.librarian['bindery']
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls.load()['enabled']
+
+    @classmethod
+    def pool(cls) -> concurrent.futures.ProcessPoolExecutor:
+        """
+        Starts a pool of workers, forked right away (rather than on the first
+        file), so that they do not inherit the locks of threads started later.
+        """
+        # Forked, so that the workers start without re-importing the bot
+        context = multiprocessing.get_context('fork')
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=cls.load()['workers'] or os.cpu_count(), mp_context=context)
+        pool.submit(int).result()
+        return pool
+
+    @staticmethod
+    def collect(path: str) -> list:
+        """
+        Lists the files to archive, along with their names in the archive.
+
+        Returns:
+            list: (path, arcname) of every file, in walking order.
+        """
+        if not os.path.isdir(path):
+            return [(path, os.path.basename(path))]
+        files = []
+        for folder_root, _, filenames in os.walk(path):
+            for name in filenames:
+                file_path = os.path.join(folder_root, name)
+                files.append((file_path, os.path.relpath(file_path, path)))
+        return files
+
+    @classmethod
+    def compress(cls, path: str, store: bool, password: bytes, level: int, spill: int, directory: str) -> dict:
+        """
+        Compresses (or stores) and encrypts a file, the work of a single entry.
+
+        Returns:
+            dict: crc, file_size and compress_size of the entry, its payload
+            (compressed data, along with the encryption header and trailer)
+            in memory, in a temporary file (payload_file, never without a
+            directory), or neither if the file is to be copied in as it is,
+            and wz_aes_version if encrypted.
+        """
+        chunk = cls.load()['chunk'] * 2**20
+        encrypter = AESZipEncrypter(password) if password else None
+        compressor = None if store else zlib.compressobj(level, zlib.DEFLATED, -15)
+        copy = store and encrypter is None
+
+        crc = file_size = compress_size = 0
+        head, sink = [], None
+
+        def emit(data: bytes) -> None:
+            nonlocal compress_size, sink
+            if not data:
+                return
+            compress_size += len(data)
+            if sink is None and directory is not None and compress_size > spill:
+                sink = tempfile.NamedTemporaryFile(prefix='jarvis-', suffix='.part', dir=directory, delete=False)
+                sink.writelines(head)
+                head.clear()
+            if sink is None:
+                head.append(data)
+            else:
+                sink.write(data)
+
+        try:
+            if encrypter is not None:
+                emit(encrypter.encryption_header())
+
+            with open(path, 'rb') as file:
+                for data in iter(lambda: file.read(chunk), b''):
+                    crc = zlib.crc32(data, crc)
+                    file_size += len(data)
+                    if copy:
+                        continue
+                    if compressor is not None:
+                        data = compressor.compress(data)
+                    if encrypter is not None and data:
+                        data = encrypter.encrypt(data)
+                    emit(data)
+
+            if copy:
+                compress_size = file_size
+            else:
+                tail = compressor.flush() if compressor is not None else b''
+                if encrypter is not None:
+                    tail = (encrypter.encrypt(tail) if tail else b'') + encrypter.flush()
+                emit(tail)
+
+        finally:
+            if sink is not None:
+                sink.close()
+
+        entry = {'crc': crc, 'file_size': file_size, 'compress_size': compress_size}
+        if encrypter is not None:
+            zinfo = AESZipInfo()
+            zinfo.file_size = file_size
+            zinfo.compress_type = zipfile.ZIP_STORED if store else zipfile.ZIP_DEFLATED
+            entry['wz_aes_version'] = encrypter.compute_aes_version(zinfo)
+        if sink is not None:
+            entry['payload_file'] = sink.name
+        elif not copy:
+            entry['payload'] = b''.join(head)
+        return entry
+
+    @staticmethod
+    def __splice(archive: zipfile.ZipFile, zinfo: zipfile.ZipInfo, entry: dict, path: str) -> None:
+        """
+        Writes an entry compressed by a worker into the archive: its local
+        header, then its data. The central directory is left to the archive.
+        """
+        zinfo.CRC = entry['crc']
+        zinfo.file_size = entry['file_size']
+        zinfo.compress_size = entry['compress_size']
+
+        zinfo.header_offset = archive.fp.tell()
+        archive.fp.write(zinfo.FileHeader())
+
+        if 'payload' in entry:
+            archive.fp.write(entry['payload'])
+        else:
+            with open(entry.get('payload_file', path), 'rb') as payload:
+                shutil.copyfileobj(payload, archive.fp, 2**20)
+
+        archive.filelist.append(zinfo)
+        archive.NameToInfo[zinfo.filename] = zinfo
+        archive.start_dir = archive.fp.tell()
+
+    @classmethod
+    def bind(cls, path: str, destination, password: str = None, listener=None, pool=None) -> dict:
+        """
+        Archives a file or a folder (its contents) into a zip, password
+        protected (AES) if a password is provided.
+
+        Args:
+            path (str): The file or folder to archive.
+            destination (str | file): Path of the zip archive, or a binary stream to write it to.
+            password (str) [Optional]: Password to protect the archive with.
+            listener (callable) [Optional]: Called with the number of bytes
+                archived so far, the total and the elapsed seconds, every
+                `interval` seconds.
+            pool (concurrent.futures.ProcessPoolExecutor) [Optional]: Workers to compress
+                with (see pool), left running. A pool of its own otherwise.
+
+        Returns:
+            dict: Number of entries, bytes archived and their compressed size,
+            elapsed seconds and throughput (MB/s).
+        """
+        setup = cls.load()
+        stored = {extension.lower() for extension in setup['stored']}
+        spill = setup['spill'] * 2**20
+        budget = setup['budget'] * 2**20
+        window = setup['window']
+        secret = password.encode() if password is not None else None
+
+        files = cls.collect(path)
+        sizes = dict()
+        for file_path, _ in files:
+            with contextlib.suppress(OSError):
+                sizes[file_path] = os.path.getsize(file_path)
+        total = sum(sizes.values())
+
+        # Spilled next to the archive, never if streamed
+        directory = os.path.dirname(os.path.abspath(destination)) if isinstance(destination, str) else None
+        if secret is None:
+            archive = zipfile.ZipFile(destination, 'w', zipfile.ZIP_DEFLATED, compresslevel=setup['level'])
+            info_class = zipfile.ZipInfo
+        else:
+            archive = pyzipper.AESZipFile(
+                destination, 'w', compression=pyzipper.ZIP_DEFLATED, compresslevel=setup['level'], encryption=pyzipper.WZ_AES
+            )
+            archive.pwd = secret
+            info_class = AESZipInfo
+
+        started = last_report = time.monotonic()
+        archived = compressed = 0
+        # Bytes of the large files compressed in memory, in flight
+        reserved = 0
+        pending = collections.deque()
+
+        def bind_next() -> None:
+            nonlocal archived, compressed, last_report, reserved
+            file_path, arcname, store, future, size = pending.popleft()
+            reserved -= size
+            zinfo = info_class.from_file(file_path, arcname)
+            zinfo.compress_type = zipfile.ZIP_STORED if store else zipfile.ZIP_DEFLATED
+
+            if future is None:
+                # Compressed (and encrypted) by the archive, right into the stream
+                zinfo._compresslevel = setup['level']
+                with open(file_path, 'rb') as source, archive.open(zinfo, 'w') as target:
+                    shutil.copyfileobj(source, target, setup['chunk'] * 2**20)
+                entry = {'file_size': zinfo.file_size, 'compress_size': zinfo.compress_size}
+            else:
+                entry = future.result()
+                try:
+                    if secret is not None:
+                        zinfo.flag_bits |= cls.ENCRYPTED
+                        zinfo.wz_aes_vendor_id = b'AE'
+                        zinfo.wz_aes_strength = cls.AES_256
+                        zinfo.wz_aes_version = entry['wz_aes_version']
+                    cls.__splice(archive, zinfo, entry, file_path)
+                finally:
+                    if 'payload_file' in entry:
+                        os.remove(entry['payload_file'])
+
+            archived += entry['file_size']
+            compressed += entry['compress_size']
+            if listener is not None and time.monotonic() - last_report >= setup['interval']:
+                last_report = time.monotonic()
+                listener(archived, total, last_report - started)
+
+        owned = pool is None
+        pool = cls.pool() if owned else pool
+        try:
+            with archive:
+                for file_path, arcname in files:
+                    store = os.path.splitext(file_path)[1].lower() in stored
+                    copy = store and secret is None
+                    # Large files of a streamed archive are compressed in memory, within the budget
+                    large = directory is None and not copy and sizes.get(file_path, 0) > spill
+                    size = sizes.get(file_path, 0) if large else 0
+                    if size > budget:
+                        future, size = None, 0
+                    else:
+                        while pending and reserved + size > budget:
+                            bind_next()
+                        future = pool.submit(cls.compress, file_path, store, secret, setup['level'], spill, directory)
+                    reserved += size
+                    pending.append((file_path, arcname, store, future, size))
+                    while pending and (len(pending) >= window or pending[0][3] is None or pending[0][3].done()):
+                        bind_next()
+                while pending:
+                    bind_next()
+        finally:
+            if owned:
+                pool.shutdown(wait=True, cancel_futures=True)
+            else:
+                for _, _, _, future, _ in pending:
+                    if future is not None:
+                        future.cancel()
+                # Lets the running ones finish, for their payloads to be removed
+                concurrent.futures.wait([future for *_, future, _ in pending if future is not None])
+            # Payloads compressed for nothing, if the archive was abandoned
+            for _, _, _, future, _ in pending:
+                if future is not None and future.done() and not future.cancelled() and future.exception() is None:
+                    with contextlib.suppress(OSError, KeyError):
+                        os.remove(future.result()['payload_file'])
+
+        elapsed = time.monotonic() - started
+        return {
+            'entries': len(files),
+            'archived': archived,
+            'compressed': compressed,
+            'elapsed': round(elapsed, 2),
+            'throughput': round(archived / 2**20 / elapsed, 2) if elapsed else None,
+        }
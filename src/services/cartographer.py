@@ -0,0 +1,286 @@
+#!/usr/bin/python3
+
+import contextlib
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+import traceback
+
+from src.common.config import Constants
+
+
+class Cartographer:
+    """
+    Maps the local storage into an on-disk index of file names.
+
+    The index is a SQLite database of every entry under the configured roots
+    (hidden entries excluded, like Librarian.title_tracker always did), kept
+    fresh by Sentinel, or by a background crawler where Sentinel is not
+    available. A crawl only lists the directories whose mtime changed since
+    the previous crawl; unchanged directories are walked through from the
+    index itself.
+
+    Names are matched case-insensitively with glob patterns, through an FTS5
+    trigram index when SQLite supports it, so that a query does not need to
+    scan every name in the index.
+
+    Tables:
+        entries     dir, name, folded (lower-cased name), is_dir
+        names       FTS5 trigram index over entries.folded (optional)
+        dirs        path, mtime of every crawled directory
+        roots       path, completed (time of the last completed crawl)
+    """
+
+    @classmethod
+    def load(cls) -> dict:
+        return Constants.librarian['index']
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls.load()['enabled']
+
+    @classmethod
+    def connect(cls) -> sqlite3.Connection:
+        path = os.path.expanduser(cls.load()['path'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        connection = sqlite3.connect(path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                dir TEXT NOT NULL,
+                name TEXT NOT NULL,
+                folded TEXT NOT NULL,
+                is_dir INTEGER NOT NULL,
+                UNIQUE (dir, name)
+            );
+            CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY, completed REAL NOT NULL);
+        ''')
+
+        with contextlib.suppress(sqlite3.OperationalError):
+            # Requires SQLite 3.34+, queries scan entries.folded without it
+            connection.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(
+                    folded, content='entries', content_rowid='id', tokenize='trigram'
+                );
+                CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+                    INSERT INTO names (rowid, folded) VALUES (new.id, new.folded);
+                END;
+                CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+                    INSERT INTO names (names, rowid, folded) VALUES ('delete', old.id, old.folded);
+                END;
+            ''')
+
+        return connection
+
+    @staticmethod
+    def __has_names(connection: sqlite3.Connection) -> bool:
+        return connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'names'").fetchone() is not None
+
+    @staticmethod
+    def __subtree(path: str) -> tuple:
+        """
+        Bounds of the paths strictly under the path, for range queries
+        ('0' is the character right after '/').
+        """
+        return f'{path}/', f'{path}0'
+
+    @classmethod
+    def __forget(cls, connection: sqlite3.Connection, path: str) -> None:
+        """
+        Removes a directory and everything under it from the index.
+        """
+        low, high = cls.__subtree(path)
+        connection.execute('DELETE FROM entries WHERE dir = ? OR (dir >= ? AND dir < ?)', (path, low, high))
+        connection.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high))
+
+    @classmethod
+    def __index(cls, connection: sqlite3.Connection, directory: str, mtime: float) -> list:
+        """
+        Lists a directory into the index.
+
+        Returns:
+            list: Paths of the subdirectories.
+        """
+        listed = dict()
+        with os.scandir(directory) as scanner:
+            for entry in scanner:
+                if entry.name.startswith('.'):
+                    continue
+                with contextlib.suppress(OSError):
+                    listed[entry.name] = entry.is_dir(follow_symlinks=False)
+
+        indexed = dict(connection.execute('SELECT name, is_dir FROM entries WHERE dir = ?', (directory,)))
+
+        for name, is_dir in indexed.items():
+            if listed.get(name) != is_dir:
+                connection.execute('DELETE FROM entries WHERE dir = ? AND name = ?', (directory, name))
+                if is_dir:
+                    cls.__forget(connection, os.path.join(directory, name))
+
+        connection.executemany(
+            'INSERT INTO entries (dir, name, folded, is_dir) VALUES (?, ?, ?, ?)',
+            [
+                (directory, name, name.lower(), is_dir)
+                for name, is_dir in listed.items() if indexed.get(name) != is_dir
+            ]
+        )
+        connection.execute('INSERT OR REPLACE INTO dirs (path, mtime) VALUES (?, ?)', (directory, mtime))
+
+        return [os.path.join(directory, name) for name, is_dir in listed.items() if is_dir]
+
+    @classmethod
+    def __walk(cls, connection: sqlite3.Connection, directories: list, thorough: bool) -> tuple:
+        """
+        Brings the index of the directories up to date, along with the
+        directories under them that changed. Unchanged directories are only
+        walked through (from the index) when thorough.
+
+        Returns:
+            tuple: Number of directories visited and (re)listed.
+        """
+        batch = cls.load()['batch']
+        visited = listed = 0
+
+        stack = list(directories)
+        while stack:
+            directory = stack.pop()
+            visited += 1
+            try:
+                mtime = os.stat(directory).st_mtime
+                row = connection.execute('SELECT mtime FROM dirs WHERE path = ?', (directory,)).fetchone()
+                if row is None or row[0] != mtime:
+                    stack.extend(cls.__index(connection, directory, mtime))
+                    listed += 1
+                    if listed % batch == 0:
+                        connection.commit()
+                elif thorough:
+                    stack.extend(
+                        os.path.join(directory, name) for name, in connection.execute(
+                            'SELECT name FROM entries WHERE dir = ? AND is_dir = 1', (directory,)
+                        )
+                    )
+            except (FileNotFoundError, NotADirectoryError):
+                cls.__forget(connection, directory)
+            except PermissionError:
+                continue
+
+        return visited, listed
+
+    @classmethod
+    def crawl(cls, root: str) -> dict:
+        """
+        Brings the index of a root up to date.
+
+        Returns:
+            dict: Number of directories visited and (re)listed.
+        """
+        root = os.path.normpath(os.path.abspath(root))
+
+        connection = cls.connect()
+        try:
+            visited, listed = cls.__walk(connection, [root], thorough=True)
+            connection.execute('INSERT OR REPLACE INTO roots (path, completed) VALUES (?, ?)', (root, time.time()))
+            connection.commit()
+        finally:
+            connection.close()
+
+        return {'root': root, 'visited': visited, 'listed': listed}
+
+    @classmethod
+    def refresh(cls, directories: list) -> dict:
+        """
+        Re-lists the directories (typically reported as changed by Sentinel),
+        and indexes whatever new directories turned up under them.
+
+        Returns:
+            dict: Number of directories visited and (re)listed.
+        """
+        connection = cls.connect()
+        try:
+            visited, listed = cls.__walk(connection, sorted(set(directories)), thorough=False)
+            connection.commit()
+        finally:
+            connection.close()
+
+        return {'visited': visited, 'listed': listed}
+
+    @classmethod
+    def search(cls, path: str, pattern: str):
+        """
+        Looks up the names matching *pattern* (case-insensitive glob, as in
+        find -iname) under the path.
+
+        Returns:
+            list | None: Matching paths, or None if the path is not indexed
+            (no completed crawl of a root covering it).
+        """
+        path = os.path.normpath(os.path.abspath(path))
+
+        connection = cls.connect()
+        try:
+            roots = [root for root, in connection.execute('SELECT path FROM roots')]
+            if not any(path == root or path.startswith(f'{root}/') for root in roots):
+                return None
+
+            low, high = cls.__subtree(path)
+            term = f'*{pattern.lower()}*'
+            if cls.__has_names(connection):
+                # Matched in the trigram index first, then narrowed down to the path
+                query = '''
+                    SELECT dir, name FROM entries WHERE id IN (SELECT rowid FROM names WHERE folded GLOB ?)
+                    AND (dir = ? OR (dir >= ? AND dir < ?))
+                '''
+            else:
+                query = 'SELECT dir, name FROM entries WHERE folded GLOB ? AND (dir = ? OR (dir >= ? AND dir < ?))'
+
+            return sorted(os.path.join(directory, name) for directory, name in connection.execute(query, (term, path, low, high)))
+        finally:
+            connection.close()
+
+    @classmethod
+    def patrol(cls) -> None:
+        """
+        Crawls the roots over and over, every `interval` seconds.
+        """
+        while True:
+            for root in cls.load()['roots']:
+                try:
+                    started = time.monotonic()
+                    stats = cls.crawl(root)
+                    logging.info(f"Crawled {stats} in {time.monotonic() - started:.2f}s")
+                except Exception as e:
+                    logging.error(f"Unable to crawl {root}: {traceback.format_exc()}")
+            time.sleep(cls.load()['interval'])
+
+    @classmethod
+    def start(cls):
+        """
+        Starts the background crawler, if the index is enabled.
+
+        Returns:
+            multiprocessing.Process | None: The crawler.
+        """
+        if not cls.enabled():
+            return None
+        crawler = multiprocessing.Process(target=cls.patrol, name='cartographer', daemon=True)
+        crawler.start()
+        return crawler
+
+    @classmethod
+    def get_status(cls) -> dict:
+        connection = cls.connect()
+        try:
+            return {
+                'entries': connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0],
+                'dirs': connection.execute('SELECT COUNT(*) FROM dirs').fetchone()[0],
+                'trigram': cls.__has_names(connection),
+                'roots': dict(connection.execute('SELECT path, completed FROM roots')),
+            }
+        finally:
+            connection.close()
@@ -0,0 +1,351 @@
+#!/usr/bin/python3
+
+import contextlib
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+import traceback
+from stat import S_ISREG
+
+from src.common.config import Constants
+
+
+class Concordance:
+    """
+    An inverted index of the contents of text files, for content searches.
+
+    Every text file under the configured roots is broken down into the
+    (ASCII case-folded) trigrams of its bytes, and the index maps every
+    trigram to the files it occurs in. A query for a string only has to
+    look at the files containing all of its trigrams, which are then
+    verified by reading them, so the index never returns a false match.
+
+    The index is updated incrementally by Sentinel, or by a background
+    crawler where Sentinel is not available: only files whose mtime or size
+    changed are re-indexed. Hidden entries and binary
+    files (NUL bytes in the first block) are left out, files larger than
+    max_size are not broken down but always verified.
+
+    Tables:
+        files       id, path, mtime, size, state (INDEXED, OVERSIZED or BINARY)
+        trigrams    trigram, file
+        roots       path, completed (time of the last completed crawl)
+    """
+
+    INDEXED, OVERSIZED, BINARY = range(3)
+
+    # Bytes sniffed for NUL bytes, to tell binary files apart
+    SNIFF = 8192
+
+    @classmethod
+    def load(cls) -> dict:
+        return Constants.librarian['concordance']
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls.load()['enabled']
+
+    @classmethod
+    def connect(cls) -> sqlite3.Connection:
+        path = os.path.expanduser(cls.load()['path'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        connection = sqlite3.connect(path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                state INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS trigrams (
+                trigram INTEGER NOT NULL,
+                file INTEGER NOT NULL,
+                PRIMARY KEY (trigram, file)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS trigrams_file ON trigrams (file);
+            CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY, completed REAL NOT NULL);
+        ''')
+        return connection
+
+    @staticmethod
+    def trigrams(data: bytes) -> set:
+        data = data.lower()
+        # Deduplicated before being packed into integers, zip is the fastest way to slide over bytes
+        return {(a << 16) | (b << 8) | c for a, b, c in set(zip(data, data[1:], data[2:]))}
+
+    @staticmethod
+    def __subtree(path: str) -> tuple:
+        # '0' is the character right after '/'
+        return f'{path}/', f'{path}0'
+
+    @classmethod
+    def __discard(cls, connection: sqlite3.Connection, file_id: int) -> None:
+        connection.execute('DELETE FROM trigrams WHERE file = ?', (file_id,))
+        connection.execute('DELETE FROM files WHERE id = ?', (file_id,))
+
+    @classmethod
+    def __index(cls, connection: sqlite3.Connection, path: str, stat: os.stat_result) -> None:
+        with open(path, 'rb') as file:
+            head = file.read(cls.SNIFF)
+            if b'\0' in head:
+                state, grams = cls.BINARY, set()
+            elif stat.st_size > cls.load()['max_size'] * 2**20:
+                state, grams = cls.OVERSIZED, set()
+            else:
+                state, grams = cls.INDEXED, cls.trigrams(head + file.read())
+
+        row = connection.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()
+        if row is not None:
+            cls.__discard(connection, row[0])
+
+        file_id = connection.execute(
+            'INSERT INTO files (path, mtime, size, state) VALUES (?, ?, ?, ?)',
+            (path, stat.st_mtime, stat.st_size, state)
+        ).lastrowid
+        connection.executemany('INSERT INTO trigrams (trigram, file) VALUES (?, ?)', ((gram, file_id) for gram in grams))
+
+    @classmethod
+    def __visit(cls, connection: sqlite3.Connection, path: str, known: dict) -> bool:
+        """
+        (Re)indexes a file, unless it is hidden, not a regular file or unchanged
+        since it was last indexed. Known files are popped out of `known`.
+
+        Returns:
+            bool: True if the file was (re)indexed.
+        """
+        if os.path.basename(path).startswith('.'):
+            return False
+        try:
+            stat = os.stat(path, follow_symlinks=False)
+            if not S_ISREG(stat.st_mode):
+                return False
+            _, mtime, size = known.pop(path, (None, None, None))
+            if (mtime, size) == (stat.st_mtime, stat.st_size):
+                return False
+            cls.__index(connection, path, stat)
+            return True
+        except OSError:
+            return False
+
+    @classmethod
+    def __walk(cls, connection: sqlite3.Connection, root: str) -> tuple:
+        """
+        Brings the index of every file under the root up to date.
+
+        Returns:
+            tuple: Number of files (re)indexed and dropped.
+        """
+        batch = cls.load()['batch']
+        indexed = 0
+
+        low, high = cls.__subtree(root)
+        known = {
+            path: (file_id, mtime, size) for file_id, path, mtime, size in connection.execute(
+                'SELECT id, path, mtime, size FROM files WHERE path >= ? AND path < ?', (low, high)
+            )
+        }
+
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for name in filenames:
+                if cls.__visit(connection, os.path.join(directory, name), known):
+                    indexed += 1
+                    if indexed % batch == 0:
+                        connection.commit()
+
+        # Whatever was not seen is gone
+        for file_id, _, _ in known.values():
+            cls.__discard(connection, file_id)
+
+        return indexed, len(known)
+
+    @classmethod
+    def crawl(cls, root: str) -> dict:
+        """
+        Brings the index of a root up to date.
+
+        Returns:
+            dict: Number of files (re)indexed and dropped.
+        """
+        root = os.path.normpath(os.path.abspath(root))
+
+        connection = cls.connect()
+        try:
+            indexed, dropped = cls.__walk(connection, root)
+            connection.execute('INSERT OR REPLACE INTO roots (path, completed) VALUES (?, ?)', (root, time.time()))
+            connection.commit()
+        finally:
+            connection.close()
+
+        return {'root': root, 'indexed': indexed, 'dropped': dropped}
+
+    @classmethod
+    def refresh(cls, paths: list) -> dict:
+        """
+        Brings the index of the paths (typically reported as changed by
+        Sentinel) up to date. A path may be a file, a directory, or gone.
+
+        Returns:
+            dict: Number of files (re)indexed and dropped.
+        """
+        indexed = dropped = 0
+
+        connection = cls.connect()
+        try:
+            for path in sorted(set(paths)):
+                if not os.path.lexists(path):
+                    low, high = cls.__subtree(path)
+                    gone = connection.execute(
+                        'SELECT id FROM files WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high)
+                    ).fetchall()
+                    for file_id, in gone:
+                        cls.__discard(connection, file_id)
+                    dropped += len(gone)
+
+                elif os.path.isdir(path) and not os.path.islink(path):
+                    changes = cls.__walk(connection, path)
+                    indexed, dropped = indexed + changes[0], dropped + changes[1]
+
+                else:
+                    row = connection.execute('SELECT id, mtime, size FROM files WHERE path = ?', (path,)).fetchone()
+                    known = {path: row} if row else {}
+                    indexed += cls.__visit(connection, path, known)
+
+            connection.commit()
+        finally:
+            connection.close()
+
+        return {'indexed': indexed, 'dropped': dropped}
+
+    @staticmethod
+    def contains(path: str, needle: bytes) -> bool:
+        """
+        Checks whether the file contains the (lower-cased) needle, ignoring ASCII case.
+        """
+        overlap = len(needle) - 1
+        tail = b''
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(2**20), b''):
+                block = tail + block.lower()
+                if needle in block:
+                    return True
+                tail = block[-overlap:] if overlap else b''
+        return False
+
+    @classmethod
+    def candidates(cls, path: str, pattern: str):
+        """
+        Looks up the files that may contain the pattern (ignoring case) under
+        the path, leaving out the ones that certainly do not.
+
+        Returns:
+            list | None: Paths of the candidates, or None if the path is not
+            indexed (no completed crawl of a root covering it).
+        """
+        path = os.path.normpath(os.path.abspath(path))
+        needle = pattern.encode().lower()
+
+        connection = cls.connect()
+        try:
+            roots = [root for root, in connection.execute('SELECT path FROM roots')]
+            if not any(path == root or path.startswith(f'{root}/') for root in roots):
+                return None
+
+            low, high = cls.__subtree(path)
+            scope = '(files.path = ? OR (files.path >= ? AND files.path < ?))'
+
+            grams = cls.trigrams(needle)
+            if grams:
+                marks = ', '.join('?' * len(grams))
+                candidates = connection.execute(
+                    f'''
+                    SELECT files.path FROM trigrams JOIN files ON files.id = trigrams.file
+                    WHERE trigrams.trigram IN ({marks}) AND {scope}
+                    GROUP BY files.id HAVING COUNT(*) = ?
+                    ''',
+                    (*grams, path, low, high, len(grams))
+                ).fetchall()
+            else:
+                # Too short for trigrams, every text file is a candidate
+                candidates = connection.execute(
+                    f'SELECT path FROM files WHERE state = ? AND {scope}', (cls.INDEXED, path, low, high)
+                ).fetchall()
+
+            candidates += connection.execute(
+                f'SELECT path FROM files WHERE state = ? AND {scope}', (cls.OVERSIZED, path, low, high)
+            ).fetchall()
+        finally:
+            connection.close()
+
+        return [candidate for candidate, in candidates]
+
+    @classmethod
+    def search(cls, path: str, pattern: str):
+        """
+        Looks up the files containing the pattern (ignoring case) under the path.
+
+        Returns:
+            list | None: Matching paths, or None if the path is not indexed
+            (no completed crawl of a root covering it).
+        """
+        candidates = cls.candidates(path, pattern)
+        if candidates is None:
+            return None
+
+        needle = pattern.encode().lower()
+        matches = []
+        for candidate in candidates:
+            with contextlib.suppress(OSError):
+                if cls.contains(candidate, needle):
+                    matches.append(candidate)
+        return sorted(matches)
+
+    @classmethod
+    def patrol(cls) -> None:
+        """
+        Crawls the roots over and over, every `interval` seconds.
+        """
+        while True:
+            for root in cls.load()['roots']:
+                try:
+                    started = time.monotonic()
+                    stats = cls.crawl(root)
+                    logging.info(f"Indexed contents {stats} in {time.monotonic() - started:.2f}s")
+                except Exception as e:
+                    logging.error(f"Unable to index the contents of {root}: {traceback.format_exc()}")
+            time.sleep(cls.load()['interval'])
+
+    @classmethod
+    def start(cls):
+        """
+        Starts the background crawler, if the index is enabled.
+
+        Returns:
+            multiprocessing.Process | None: The crawler.
+        """
+        if not cls.enabled():
+            return None
+        crawler = multiprocessing.Process(target=cls.patrol, name='concordance', daemon=True)
+        crawler.start()
+        return crawler
+
+    @classmethod
+    def get_status(cls) -> dict:
+        connection = cls.connect()
+        try:
+            states = dict(connection.execute('SELECT state, COUNT(*) FROM files GROUP BY state'))
+            return {
+                'indexed': states.get(cls.INDEXED, 0),
+                'oversized': states.get(cls.OVERSIZED, 0),
+                'binary': states.get(cls.BINARY, 0),
+                'postings': connection.execute('SELECT COUNT(*) FROM trigrams').fetchone()[0],
+                'roots': dict(connection.execute('SELECT path, completed FROM roots')),
+            }
+        finally:
+            connection.close()
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+
+import collections
+import threading
+
+from googleapiclient.http import MediaUpload
+
+from src.common.config import Constants
+
+
+class Conduit:
+    """
+    An in-memory pipe between a thread producing a stream (e.g. Bindery
+    writing a zip) and a thread consuming it (e.g. a resumable upload).
+
+    The writing end is a minimal, unseekable binary file (write, tell,
+    flush), the reading end yields the bytes in order. At most `capacity`
+    bytes are held in between: a writer running ahead of the reader waits
+    for it, so the stream never has to exist as a whole, in memory or on disk.
+
+    Either end may give up: the writer with abort (the reader then raises
+    the writer's error), the reader with cancel (the writer then raises
+    BrokenPipeError).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.blocks = collections.deque()
+        self.buffered = 0
+        self.written = 0
+        self.closed = False
+        self.cancelled = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    @classmethod
+    def load(cls) -> dict:
+        return Constants.librarian['conduit']
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls.load()['enabled']
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        with self.condition:
+            while self.buffered >= self.capacity and not self.cancelled:
+                self.condition.wait()
+            if self.cancelled:
+                raise BrokenPipeError('The reading end of the conduit was cancelled')
+            if self.closed:
+                raise ValueError('Write to a closed conduit')
+            if data:
+                self.blocks.append(data)
+                self.buffered += len(data)
+                self.written += len(data)
+                self.condition.notify_all()
+        return len(data)
+
+    def tell(self) -> int:
+        return self.written
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        """
+        Ends the stream, the reader gets whatever is left and then EOF.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def abort(self, error: BaseException) -> None:
+        """
+        Ends the stream on an error, raised by the reader.
+        """
+        with self.condition:
+            self.error = error
+            self.closed = True
+            self.condition.notify_all()
+
+    def cancel(self) -> None:
+        """
+        Gives up on reading, any pending or further write raises BrokenPipeError.
+        """
+        with self.condition:
+            self.cancelled = True
+            self.blocks.clear()
+            self.buffered = 0
+            self.condition.notify_all()
+
+    def read(self, size: int) -> bytes:
+        """
+        Reads up to size bytes, blocking until some are available.
+
+        Returns:
+            bytes: b'' at the end of the stream.
+
+        Raises:
+            Exception: Whatever the writer aborted with.
+        """
+        with self.condition:
+            while not self.blocks and not self.closed:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+
+            chunks, length = [], 0
+            while self.blocks and length < size:
+                block = self.blocks.popleft()
+                if length + len(block) > size:
+                    block, rest = block[:size - length], block[size - length:]
+                    self.blocks.appendleft(rest)
+                chunks.append(block)
+                length += len(block)
+
+            self.buffered -= length
+            self.condition.notify_all()
+            return b''.join(chunks)
+
+    class Media(MediaUpload):
+        """
+        A resumable upload of a stream of unknown size, read from a Conduit.
+
+        The total size is only declared with the last chunk, as soon as the
+        end of the stream is in sight; the bytes of the chunk in flight are
+        kept, so that a failed chunk can be sent again.
+        """
+
+        def __init__(self, conduit, mimetype: str, chunksize: int):
+            super().__init__()
+            self.conduit = conduit
+            self._mimetype = mimetype
+            self._chunksize = chunksize
+            self.buffer = bytearray()
+            self.offset = 0
+            self.expected = 0
+            self.ended = False
+
+        def chunksize(self) -> int:
+            return self._chunksize
+
+        def mimetype(self) -> str:
+            return self._mimetype
+
+        def resumable(self) -> bool:
+            return True
+
+        def has_stream(self) -> bool:
+            return False
+
+        def __fill(self, length: int) -> None:
+            while not self.ended and len(self.buffer) < length:
+                data = self.conduit.read(max(length - len(self.buffer), 2**16))
+                if data:
+                    self.buffer += data
+                else:
+                    self.ended = True
+
+        def size(self):
+            """
+            Returns:
+                int | None: The total size if the next chunk is the last one, None otherwise.
+            """
+            # One byte beyond the next chunk tells whether it is the last one
+            self.__fill(self.expected - self.offset + self._chunksize + 1)
+            return self.offset + len(self.buffer) if self.ended else None
+
+        def getbytes(self, begin: int, length: int) -> bytes:
+            if begin < self.offset:
+                raise ValueError(f'Bytes from {begin} were already sent and dropped (kept from {self.offset})')
+            del self.buffer[:begin - self.offset]
+            self.offset = begin
+            self.__fill(length)
+            self.expected = begin + min(length, len(self.buffer))
+            return bytes(self.buffer[:length])
+
+        def to_json(self):
+            raise NotImplementedError('A Conduit stream cannot be serialized')
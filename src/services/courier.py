@@ -0,0 +1,325 @@
+#!/usr/bin/python3
+
+import concurrent.futures
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from mimetypes import MimeTypes
+
+from googleapiclient.http import MediaFileUpload
+
+from src.common.config import Constants
+from src.services.bifrost import Bifrost
+
+
+class Courier:
+    """
+    Uploads many files to Google Drive at once.
+
+    Files are uploaded `workers` at a time, each worker thread on its own
+    Drive client (see Bifrost). Files smaller than `simple_below` MB go up
+    in a single request; larger ones with a resumable upload, in chunks of
+    `chunk` MB.
+
+    The session URIs of the resumable uploads are kept in a journal on
+    disk, so that an upload interrupted by a crash or a restart resumes
+    where the Drive left it, as long as the session has not expired (a
+    week on Google's side). The journal also holds the progress of every
+    delivery, for Courier.progress (and FileUploader.ps) to report from
+    any process.
+
+    Files whose MD5 matches a file already in the Drive folder (or another
+    file of the same delivery) are not uploaded again.
+    """
+
+    @classmethod
+    def load(cls) -> dict:
+        return Constants.librarian['courier']
+
+    @classmethod
+    @contextlib.contextmanager
+    def __journal(cls):
+        """
+        Opens the journal for update, exclusively across processes.
+
+        Yields:
+            dict: sessions (resumable session URIs by file) and deliveries
+            (progress by delivery), saved back on exit.
+        """
+        path = cls.__path()
+        with open(f'{path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                journal = cls.__read(path)
+
+                yield journal
+
+                with open(f'{path}.part', 'w') as file:
+                    json.dump(journal, file)
+                os.replace(f'{path}.part', path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @classmethod
+    def __path(cls) -> str:
+        path = os.path.expanduser(cls.load()['journal'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    @staticmethod
+    def __read(path: str) -> dict:
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {'sessions': {}, 'deliveries': {}}
+
+    @classmethod
+    def __snapshot(cls) -> dict:
+        """
+        Reads the journal, sharing the lock with other readers, without updating it.
+        """
+        path = cls.__path()
+        with open(f'{path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            try:
+                return cls.__read(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def checksum(path: str) -> str:
+        digest = hashlib.md5()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(2**20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def session_key(path: str, folder_id: str) -> str:
+        """
+        Identifies the upload of a file, as long as the file does not change.
+        """
+        stat = os.stat(path)
+        return f'{folder_id}:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+    @classmethod
+    def __resume(cls, request, uri: str, size: int):
+        """
+        Points the request to an existing upload session, at the offset the
+        Drive received up to.
+
+        Returns:
+            dict | None: The uploaded file if the session had completed, None otherwise.
+
+        Raises:
+            LookupError: If the session expired or is unknown.
+        """
+        response, content = request.http.request(
+            uri, 'PUT', headers={'Content-Range': f'bytes */{size}', 'Content-Length': '0'}
+        )
+        if response.status in (200, 201):
+            return json.loads(content)
+        if response.status != 308:
+            raise LookupError(f'Upload session gone (HTTP {response.status})')
+
+        request.resumable_uri = uri
+        request.resumable_progress = int(response['range'].split('-')[1]) + 1 if 'range' in response else 0
+        return None
+
+    @classmethod
+    def send(cls, path: str, folder_id: str, fields: str, tally) -> dict:
+        """
+        Uploads a file, resuming its previous upload session if any.
+
+        Args:
+            tally (callable): Called with the number of bytes sent, as they are.
+
+        Returns:
+            dict: The requested fields of the uploaded file.
+        """
+        setup = cls.load()
+        size = os.path.getsize(path)
+        name = os.path.basename(path)
+        resumable = size >= setup['simple_below'] * 2**20
+
+        media = MediaFileUpload(
+            path, mimetype=MimeTypes().guess_type(name)[0], chunksize=setup['chunk'] * 2**20, resumable=resumable
+        )
+        request = Bifrost.connect().files().create(
+            body={'name': name, 'parents': [folder_id]}, media_body=media, fields=fields
+        )
+
+        if not resumable:
+            file = request.execute(num_retries=setup['retries'])
+            tally(size)
+            return file
+
+        key = cls.session_key(path, folder_id)
+        with cls.__journal() as journal:
+            session = journal['sessions'].get(key)
+
+        file = None
+        if session is not None and time.time() - session['created'] < setup['expiry']:
+            try:
+                file = cls.__resume(request, session['uri'], size)
+                logging.info(f"Resumed the upload of {path} from {request.resumable_progress} bytes")
+                tally(request.resumable_progress)
+            except LookupError as e:
+                logging.warning(f"Unable to resume the upload of {path}: {e}")
+                request.resumable_uri, request.resumable_progress = None, 0
+
+        sent = request.resumable_progress
+        while file is None:
+            _, file = request.next_chunk(num_retries=setup['retries'])
+            if session is None or session['uri'] != request.resumable_uri:
+                session = {'uri': request.resumable_uri, 'created': time.time()}
+                with cls.__journal() as journal:
+                    journal['sessions'][key] = session
+            progress = size if file is not None else request.resumable_progress
+            tally(progress - sent)
+            sent = progress
+
+        with cls.__journal() as journal:
+            journal['sessions'].pop(key, None)
+        return file
+
+    @classmethod
+    def duplicates(cls, paths: list, folder_id: str, pool) -> dict:
+        """
+        Matches the files against the ones in the Drive folder (and each other) by MD5.
+
+        Returns:
+            dict: The Drive file (or the path of the first local copy) by path of every duplicate.
+        """
+        remote = {
+            file['md5Checksum']: file for file in Bifrost.enumerate(
+                'id, name, md5Checksum, webViewLink, webContentLink', f"'{folder_id}' in parents and trashed = false"
+            ) if 'md5Checksum' in file
+        }
+
+        duplicates, seen = dict(), dict()
+        for path, checksum in zip(paths, pool.map(cls.checksum, paths)):
+            if checksum in remote:
+                duplicates[path] = remote[checksum]
+            elif checksum in seen:
+                duplicates[path] = {'path': seen[checksum]}
+            else:
+                seen[checksum] = path
+        return duplicates
+
+    @classmethod
+    def deliver(cls, paths: list, folder_id: str, fields: list, listener=None) -> dict:
+        """
+        Uploads the files to the Drive folder.
+
+        Args:
+            paths (list): Paths of the files to upload.
+            folder_id (str): The Drive folder to upload them to.
+            fields (list): Fields of the uploaded files to fetch.
+            listener (callable) [Optional]: Called with the progress of the delivery
+                (see progress), every `interval` seconds.
+
+        Returns:
+            dict: uploaded (the fields of every file uploaded, along with its path),
+            duplicates (the Drive file each duplicate matched) and failed (the error
+            by path).
+        """
+        setup = cls.load()
+        fields = ','.join(set(fields) | {'id'})
+        delivery_id = f'{os.getpid()}-{time.time_ns()}'
+        lock = threading.Lock()
+        status = {
+            'pid': os.getpid(), 'started': time.time(), 'state': 'running',
+            'files': len(paths), 'done': 0, 'duplicates': 0, 'failed': 0,
+            'bytes': sum(os.path.getsize(path) for path in paths), 'sent': 0,
+        }
+        reported = [0.0]
+
+        def report(force: bool = False) -> None:
+            with lock:
+                if not force and time.monotonic() - reported[0] < setup['interval']:
+                    return
+                reported[0] = time.monotonic()
+                snapshot = dict(status)
+            with cls.__journal() as journal:
+                journal['deliveries'][delivery_id] = snapshot
+            if listener is not None:
+                listener(snapshot)
+
+        def tally(sent: int) -> None:
+            with lock:
+                status['sent'] += sent
+            report()
+
+        uploaded, failed = [], dict()
+
+        def upload(path: str) -> None:
+            try:
+                file = cls.send(path, folder_id, fields, tally)
+                with lock:
+                    uploaded.append(file | {'path': path})
+                    status['done'] += 1
+            except Exception as e:
+                logging.error(f"Unable to upload {path}: {e}")
+                with lock:
+                    failed[path] = str(e)
+                    status['failed'] += 1
+            report()
+
+        report(force=True)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=setup['workers'], thread_name_prefix='courier') as pool:
+                duplicates = cls.duplicates(paths, folder_id, pool) if setup['dedupe'] else dict()
+                with lock:
+                    status['duplicates'] = len(duplicates)
+                    status['bytes'] -= sum(os.path.getsize(path) for path in duplicates)
+
+                list(pool.map(upload, [path for path in paths if path not in duplicates]))
+            status['state'] = 'done'
+        except BaseException:
+            status['state'] = 'failed'
+            raise
+        finally:
+            report(force=True)
+
+        return {'uploaded': uploaded, 'duplicates': duplicates, 'failed': failed}
+
+    @classmethod
+    def progress(cls) -> list:
+        """
+        Reports the progress of the deliveries, of every process.
+
+        Returns:
+            list: id, state (running, done, failed or interrupted), pid, files,
+            done, duplicates, failed, bytes and sent of every delivery. Deliveries
+            left running by processes that died are reported as interrupted (the
+            journal is left as it is).
+        """
+        progress = []
+        for delivery_id, status in cls.__snapshot()['deliveries'].items():
+            if status['state'] == 'running' and not os.path.exists(f"/proc/{status['pid']}"):
+                status = status | {'state': 'interrupted'}
+            progress.append({'id': delivery_id} | status)
+        return progress
+
+    @classmethod
+    def purge(cls) -> None:
+        """
+        Forgets the deliveries that are over, and the expired upload sessions.
+        """
+        expiry = cls.load()['expiry']
+        with cls.__journal() as journal:
+            journal['deliveries'] = {
+                delivery_id: status for delivery_id, status in journal['deliveries'].items()
+                if status['state'] == 'running' and os.path.exists(f"/proc/{status['pid']}")
+            }
+            journal['sessions'] = {
+                key: session for key, session in journal['sessions'].items()
+                if time.time() - session['created'] < expiry
+            }
@@ -4,11 +4,18 @@ import collections
 import logging
 import os
 import pathlib
+import re
 import subprocess
+import time
 import traceback
 
 import src.common.config as config
 from src.services import job
+from src.services.barista import Barista, ClassFile
+from src.services.foundry import Foundry
+from src.services.warden import Warden
+from src.services.workspace import Workspace
+from src.services.zygote import Zygote
 
 
 class Executor:
@@ -25,16 +32,39 @@ class Executor:
         if 'memory_limit' not in args:
             setattr(obj, 'memory_limit', 1024 * config.Constants.rse['memory_limit'][obj.lang])
 
+        # Args are plain dicts, jobs without stdin get an empty one
+        if 'stdin' not in args:
+            setattr(obj, 'stdin', '')
+
+        # Sources and binaries go to a scratch directory of the job,
+        # which also serves as the working directory if no path is provided
+        if not getattr(obj, 'workspace', None):
+            setattr(obj, 'workspace', Workspace.create(obj.lang))
+
+        if not args.get('path'):
+            setattr(obj, 'path', obj.workspace)
+
     @classmethod
     def prepare_files(cls, job: job.Job) -> tuple:
         try:
-            path = os.path.join(job.path, job.source_file_name)
+            path = os.path.join(job.workspace, job.source_file_name)
             with open(path, 'w') as source_file:
                 source_file.write(job.source)
             return True, path
         except Exception as e:
             return False, traceback.format_exc()
 
+    @staticmethod
+    def first_header(source: str):
+        """
+        Returns the header of the first #include <...> directive in the source, if any.
+        Only that one can be served from a precompiled header.
+        """
+        match = re.search(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]', source, re.MULTILINE)
+        if match and match.group(1) == '<':
+            return match.group(2)
+        return None
+
     @classmethod
     def get_timeout_perl(cls) -> str:
         return os.path.dirname(__file__)
@@ -43,7 +73,7 @@ class Executor:
     def prep(task: job.Job, shell_cmds: list) -> collections.defaultdict:
         response = collections.defaultdict()
         try:
-            process = subprocess.run(shell_cmds, capture_output=True, check=True, cwd=task.path, input=task.source, text=True)
+            process = subprocess.run(shell_cmds, capture_output=True, check=True, cwd=task.workspace, input=task.source, text=True)
 
             response['status'] = 'success'
             response['stdout'] = process.stdout
@@ -61,8 +91,48 @@ class Executor:
 
         return response
 
+    @staticmethod
+    def build(task: job.Job, compiler: str, flags: list) -> collections.defaultdict:
+        '''
+        Compiles the source through the build cache (see Foundry).
+        The output path is deliberately not a part of the cache key.
+        '''
+        if not Foundry.enabled():
+            return Executor.prep(task, [compiler] + flags + ['-o', task.executable])
+
+        try:
+            key = Foundry.fingerprint(task.source, compiler, flags)
+        except Exception as e:
+            logging.error(f"Build cache unavailable: {traceback.format_exc()}")
+            return Executor.prep(task, [compiler] + flags + ['-o', task.executable])
+
+        if Foundry.retrieve(key, task.executable):
+            Foundry.tally(task.lang, 'hits')
+            response = collections.defaultdict()
+            response['status'] = 'success'
+            response['stdout'] = ''
+            response['stderr'] = ''
+            response['cache'] = 'hit'
+            return response
+
+        Foundry.tally(task.lang, 'misses')
+        started = time.perf_counter()
+        response = Executor.prep(task, [compiler] + flags + ['-o', task.executable])
+        response['compile_time'] = time.perf_counter() - started
+        if response['status'] == 'success':
+            Foundry.store(key, task.executable)
+        response['cache'] = 'miss'
+        return response
+
     @staticmethod
     def exec(task: job.Job, shell_cmds: list) -> collections.defaultdict:
+        if Warden.is_native():
+            return Warden.run(
+                shell_cmds, task.path, task.stdin, task.time_limit, task.memory_limit,
+                listener=getattr(task, 'listener', None), spill_directory=task.workspace
+            )
+
+        # Fallback: Let timeout.pl poll the job for its limits (output is buffered, not streamed)
         response = collections.defaultdict()
         try:
             time_limit = str(task.time_limit)
@@ -71,6 +141,7 @@ class Executor:
 
             shell_cmds = ['perl', timeout_perl, '-t', time_limit, '-m', memory_limit] + shell_cmds
 
+            started = time.monotonic()
             process = subprocess.run(shell_cmds, capture_output=True, check=True, cwd=task.path, input=task.stdin, text=True)
             
             response['status'] = 'success'
@@ -86,7 +157,10 @@ class Executor:
         except Exception as e:
             response['status'] = 'error'
             response['message'] = traceback.format_exc()
+            return response
 
+        response['wall_time'] = time.monotonic() - started
+        response.update(Warden.parse_report(response['stderr']))
         return response
 
     '''
@@ -103,9 +177,9 @@ class Executor:
 
         def prepare(self, args: collections.defaultdict) -> collections.defaultdict:
             Executor.set_attributes(self, args)
-            self.executable = os.path.join(self.path, 'exe')
-            shell_cmds = ['gcc', '-xc', '-', '-o', self.executable, '-lm']
-            return Executor.prep(self, shell_cmds)
+            self.executable = os.path.join(self.workspace, 'exe')
+            flags = ['-xc', '-', '-lm']
+            return Executor.build(self, 'gcc', flags)
 
         def run(self) -> collections.defaultdict:
             shell_cmds = [self.executable]
@@ -113,13 +187,11 @@ class Executor:
             
         @classmethod
         def get_status(cls) -> list:
-            # TODO: Implement the method
-            return super().get_status()
+            return [Foundry.get_status(cls.__name__), Workspace.get_status(cls.__name__)]
 
         @classmethod
         def purge(cls) -> bool:
-            # TODO: Implement the method
-            return super().purge()
+            return Workspace.purge(cls.__name__)
 
     class CPP(job.Job):
         auxiliary_data = collections.defaultdict()
@@ -130,9 +202,23 @@ class Executor:
 
         def prepare(self, args: collections.defaultdict) -> collections.defaultdict:
             Executor.set_attributes(self, args)
-            self.executable = os.path.join(self.path, 'exe')
-            shell_cmds = ['g++', '-std=c++17', '-Wshadow', '-Wall', '-o', self.executable, '-O2', '-Wno-unused-result', '-xc++', '-']
-            return Executor.prep(self, shell_cmds)
+            self.executable = os.path.join(self.workspace, 'exe')
+            flags = ['-std=c++17', '-Wshadow', '-Wall', '-O2', '-Wno-unused-result']
+
+            header = Executor.first_header(self.source)
+            savings = dict()
+            if config.Constants.rse['pch']['enabled'] and header in config.Constants.rse['pch']['headers']:
+                try:
+                    directory, savings = Foundry.precompiled_headers('g++', flags)
+                    flags += ['-I', directory, '-Winvalid-pch']
+                except Exception as e:
+                    logging.error(f"Precompiled headers unavailable: {traceback.format_exc()}")
+
+            response = Executor.build(self, 'g++', flags + ['-xc++', '-'])
+            if header in savings:
+                response['pch'] = header
+                response['pch_savings'] = 0 if response['cache'] == 'hit' else savings[header]
+            return response
 
         def run(self) -> collections.defaultdict:
             shell_cmds = [self.executable]
@@ -140,13 +226,11 @@ class Executor:
 
         @classmethod
         def get_status(cls) -> list:
-            # TODO: Implement the method
-            return super().get_status()
+            return [Foundry.get_status(cls.__name__), Workspace.get_status(cls.__name__)]
 
         @classmethod
         def purge(cls) -> bool:
-            # TODO: Implement the method
-            return super().purge()
+            return Workspace.purge(cls.__name__)
 
     class JAVA(job.Job):
         auxiliary_data = collections.defaultdict()
@@ -156,16 +240,11 @@ class Executor:
             return "JAVA"
 
         def __get_main_method_classes(self) -> list:
-            def disassemble(class_file: str) -> str:
-                return subprocess.check_output(['javap', class_file], text=True, cwd=self.path)
-
             is_class_file = lambda file: file.suffix == '.class'
-            has_main_method = lambda byte_code: 'public static void main' in byte_code
 
             class_files = list(filter(is_class_file, self.target_directory.iterdir()))
-            byte_codes = list(map(disassemble, class_files))
 
-            main_method_classes = [class_file.stem for class_file, byte_code in zip(class_files, byte_codes) if has_main_method(byte_code)]
+            main_method_classes = [class_file.stem for class_file in class_files if ClassFile.has_main_method(class_file)]
             return main_method_classes
 
         def prepare(self, args: collections.defaultdict) -> collections.defaultdict:
@@ -179,10 +258,10 @@ class Executor:
                     response['message'] = output
                     return response
 
-                self.target_directory = pathlib.Path(self.path)
+                self.target_directory = pathlib.Path(self.workspace)
 
-                shell_cmds = ['javac', output]
-                process = subprocess.run(shell_cmds, capture_output=True, check=True, cwd=self.path, text=True)
+                shell_cmds = ['javac', '-d', self.workspace, output]
+                process = subprocess.run(shell_cmds, capture_output=True, check=True, cwd=self.workspace, text=True)
 
                 response['status'] = 'success'
                 response['stdout'] = process.stdout
@@ -219,18 +298,18 @@ class Executor:
             return response
 
         def run(self) -> dict:
-            shell_cmds = ['java', '-cp', self.path, self.main_class]
+            if Barista.enabled(self):
+                return Barista.submit(self)
+            shell_cmds = ['java', '-cp', self.workspace, self.main_class]
             return Executor.exec(self, shell_cmds)
 
         @classmethod
         def get_status(cls) -> list:
-            # TODO: Implement the method
-            return super().get_status()
+            return [Barista.get_status(), Workspace.get_status(cls.__name__)]
 
         @classmethod
         def purge(cls) -> bool:
-            # TODO: Implement the method
-            return super().purge()
+            return Workspace.purge(cls.__name__)
 
     class PYTHON(job.Job):
         auxiliary_data = collections.defaultdict()
@@ -250,15 +329,15 @@ class Executor:
             return response
 
         def run(self) -> dict:
+            if Zygote.enabled(self):
+                return Zygote.submit(self)
             shell_cmds = ['python3', '-c', self.source]
             return Executor.exec(self, shell_cmds)
 
         @classmethod
         def get_status(cls) -> list:
-            # TODO: Implement the method
-            return super().get_status()
+            return [Workspace.get_status(cls.__name__)]
 
         @classmethod
         def purge(cls) -> bool:
-            # TODO: Implement the method
-            return super().purge()
\ No newline at end of file
+            return Workspace.purge(cls.__name__)
\ No newline at end of file
@@ -0,0 +1,283 @@
+#!/usr/bin/python3
+
+import collections
+import contextlib
+import fcntl
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import traceback
+
+import src.common.config as config
+
+
+class Foundry:
+    """
+    A content-addressed cache for compiled binaries.
+
+    Binaries are keyed by the hash of the source, the compiler flags and
+    the compiler version, so resubmitting the same source (typically with
+    a different stdin) skips the compiler altogether.
+
+    The cache lives on disk and is bounded by the configured capacity.
+    Least recently used binaries are evicted first. Hit and miss counters
+    are kept on disk as well, since every job runs in its own process.
+    """
+
+    @classmethod
+    def load(cls) -> dict:
+        return config.Constants.rse['build_cache']
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls.load()['enabled']
+
+    @classmethod
+    def directory(cls) -> str:
+        path = os.path.expanduser(cls.load()['path'])
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @classmethod
+    @contextlib.contextmanager
+    def __lock(cls, name: str = '.lock'):
+        with open(os.path.join(cls.directory(), name), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def compiler_version(compiler: str) -> str:
+        return subprocess.check_output([compiler, '--version'], text=True)
+
+    @classmethod
+    def fingerprint(cls, source, compiler: str, flags: list) -> str:
+        """
+        Computes the cache key of a build.
+
+        Args:
+            source (str | bytes): The source code to be compiled.
+            compiler (str): The compiler executable, e.g. gcc.
+            flags (list): Compiler flags, excluding the output path.
+
+        Returns:
+            str: Hex digest identifying the build.
+        """
+        digest = hashlib.sha256()
+        parts = [source, compiler, '\0'.join(flags), cls.compiler_version(compiler)]
+        for part in parts:
+            digest.update(part if isinstance(part, bytes) else part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    @classmethod
+    def __artifacts(cls) -> list:
+        is_artifact = lambda entry: entry.is_file() and not entry.name.startswith('.')
+        return list(filter(is_artifact, os.scandir(cls.directory())))
+
+    @classmethod
+    def retrieve(cls, key: str, destination: str) -> bool:
+        """
+        Copies the cached binary for the key to the destination, if present.
+
+        Returns:
+            bool: True on a cache hit, False otherwise.
+        """
+        try:
+            artifact = os.path.join(cls.directory(), key)
+            with cls.__lock():
+                if not os.path.isfile(artifact):
+                    return False
+
+                # Refresh the timestamp, eviction is based on it
+                os.utime(artifact)
+
+                if os.path.lexists(destination):
+                    os.remove(destination)
+                try:
+                    os.link(artifact, destination)
+                except OSError:
+                    shutil.copy2(artifact, destination)
+
+            return True
+
+        except Exception as e:
+            logging.error(f"Unable to retrieve build {key}: {traceback.format_exc()}")
+            return False
+
+    @classmethod
+    def store(cls, key: str, executable: str) -> None:
+        """
+        Adds a freshly compiled binary to the cache and evicts
+        the least recently used binaries beyond the capacity.
+        """
+        try:
+            directory = cls.directory()
+            descriptor, staging = tempfile.mkstemp(dir=directory, prefix='.staging-')
+            os.close(descriptor)
+            shutil.copy2(executable, staging)
+
+            with cls.__lock():
+                os.replace(staging, os.path.join(directory, key))
+                cls.__evict()
+
+        except Exception as e:
+            logging.error(f"Unable to store build {key}: {traceback.format_exc()}")
+
+    @classmethod
+    def __evict(cls) -> None:
+        capacity = cls.load()['capacity'] * 2**20
+        artifacts = sorted(cls.__artifacts(), key=lambda entry: entry.stat().st_mtime)
+        occupied = sum(entry.stat().st_size for entry in artifacts)
+
+        evictions = 0
+        while artifacts and occupied > capacity:
+            artifact = artifacts.pop(0)
+            occupied -= artifact.stat().st_size
+            os.remove(artifact.path)
+            evictions += 1
+
+        if evictions:
+            logging.info(f"Evicted {evictions} builds from {cls.directory()}")
+            cls.__update_stats('*', 'evictions', evictions)
+
+    @classmethod
+    def __read_stats(cls) -> dict:
+        try:
+            with open(os.path.join(cls.directory(), '.stats.json')) as stats_file:
+                return json.load(stats_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @classmethod
+    def __update_stats(cls, lang: str, counter: str, increment: int = 1) -> None:
+        stats = cls.__read_stats()
+        tally = collections.Counter(stats.get(lang, {}))
+        tally[counter] += increment
+        stats[lang] = dict(tally)
+
+        path = os.path.join(cls.directory(), '.stats.json')
+        with open(f'{path}.tmp', 'w') as stats_file:
+            json.dump(stats, stats_file)
+        os.replace(f'{path}.tmp', path)
+
+    @classmethod
+    def tally(cls, lang: str, counter: str) -> None:
+        try:
+            with cls.__lock():
+                cls.__update_stats(lang, counter)
+        except Exception as e:
+            logging.error(f"Unable to update build cache stats: {traceback.format_exc()}")
+
+    '''
+    Precompiled headers
+    '''
+
+    @staticmethod
+    def __locate_header(compiler: str, flags: list, header: str) -> str:
+        process = subprocess.run(
+            [compiler] + flags + ['-xc++', '-E', '-H', '-o', os.devnull, '-'],
+            input=f'#include <{header}>\n', capture_output=True, text=True, check=True
+        )
+        # The first header reported by -H is the one included at the top level
+        return process.stderr.splitlines()[0].split(' ', 1)[1]
+
+    @staticmethod
+    def __probe(compiler: str, flags: list, header: str) -> float:
+        """
+        Times the compilation of a translation unit that only includes the header.
+        """
+        started = time.perf_counter()
+        subprocess.run(
+            [compiler] + flags + ['-xc++', '-c', '-o', os.devnull, '-'],
+            input=f'#include <{header}>\nint main() {{}}\n', capture_output=True, text=True, check=True
+        )
+        return time.perf_counter() - started
+
+    @classmethod
+    def precompiled_headers(cls, compiler: str, flags: list) -> tuple:
+        """
+        Returns the precompiled headers (pch.headers in rse.json) built with
+        the compiler and flags, building them on first use. PCHs are only
+        used by the compiler when built with matching flags, so every set
+        of flags (and compiler version) gets a directory of its own.
+
+        Args:
+            compiler (str): The compiler executable, e.g. g++.
+            flags (list): Compiler flags, excluding the input and the output.
+
+        Returns:
+            tuple: (directory, savings). The directory is to be put on the include
+            path (-I) ahead of the system headers, and savings maps every header
+            to the estimated compile time (s) saved per job including it.
+        """
+        headers = config.Constants.rse['pch']['headers']
+        root = os.path.join(cls.directory(), 'pch')
+        directory = os.path.join(root, cls.fingerprint('\0'.join(headers), compiler, flags))
+        savings_file = os.path.join(directory, 'savings.json')
+
+        if not os.path.exists(savings_file):
+            os.makedirs(root, exist_ok=True)
+            with cls.__lock('.pch.lock'):
+                if not os.path.exists(savings_file):
+                    cls.__build_headers(compiler, flags, headers, root, directory)
+
+        with open(savings_file) as file:
+            return directory, json.load(file)
+
+    @classmethod
+    def __build_headers(cls, compiler: str, flags: list, headers: list, root: str, directory: str) -> None:
+        staging = tempfile.mkdtemp(dir=root, prefix='.staging-')
+        try:
+            savings = dict()
+            for header in headers:
+                logging.info(f"Precompiling <{header}> for {compiler} {' '.join(flags)}")
+                target = os.path.join(staging, header)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(cls.__locate_header(compiler, flags, header), target)
+
+                cold = cls.__probe(compiler, flags, header)
+                subprocess.run(
+                    [compiler] + flags + ['-xc++-header', target, '-o', f'{target}.gch'],
+                    capture_output=True, text=True, check=True
+                )
+                warm = cls.__probe(compiler, flags + ['-I', staging, '-Winvalid-pch'], header)
+                savings[header] = round(max(cold - warm, 0), 3)
+
+            # Published last, the presence of savings.json marks a complete build
+            with open(os.path.join(staging, 'savings.json'), 'w') as file:
+                json.dump(savings, file)
+            os.replace(staging, directory)
+
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    @classmethod
+    def get_status(cls, lang: str) -> dict:
+        """
+        Returns the hit/miss counters of a language along with
+        the overall occupancy of the cache.
+        """
+        with cls.__lock():
+            stats = cls.__read_stats()
+            artifacts = cls.__artifacts()
+
+        return {
+            'lang': lang,
+            'hits': stats.get(lang, {}).get('hits', 0),
+            'misses': stats.get(lang, {}).get('misses', 0),
+            'evictions': stats.get('*', {}).get('evictions', 0),
+            'entries': len(artifacts),
+            'size': sum(entry.stat().st_size for entry in artifacts),
+            'capacity': cls.load()['capacity'] * 2**20,
+        }
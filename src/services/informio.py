@@ -1,10 +1,18 @@
 #!/usr/bin/python3
 
 
-import discord_webhook
+import asyncio
+import json
+import logging
+import multiprocessing.util
 import os
+import random
+import threading
+
+import aiohttp
 
 from src.common.config import Constants
+from src.common.response import Response
 
 
 class Informio:
@@ -14,23 +22,194 @@ class Informio:
     which means "to give shape to, to form, to instruct, to inform".
 
     Uses discord webhooks to transmit messages to specific discord channels
+
+    Messages are queued and delivered in the background, in order, by a
+    Herald of the webhook: an event loop on a thread of its own, with a
+    pooled HTTP session, one per process (flows run in forked processes,
+    the Herald of the parent does not survive the fork). Bursts of text
+    messages are coalesced into fewer messages, up to the 2000 characters
+    Discord allows; longer ones are paginated (see Response.paginate).
+    Rate limits (429) are waited out as Discord asks (Retry-After), and
+    the rate-limit headers are followed ahead of them.
+
+    Whatever is queued is delivered before the process exits (flush).
     """
 
+    heralds = dict()
+    lock = threading.Lock()
+
+    class Herald:
+        """
+        Delivers the messages of a webhook, from a thread of its own.
+        """
+
+        def __init__(self, url: str, setup: dict):
+            self.url = url
+            self.setup = setup
+            self.pid = os.getpid()
+            self.loop = asyncio.new_event_loop()
+            self.queue = None
+            self.ready = threading.Event()
+            self.thread = threading.Thread(target=self.__serve, name='informio', daemon=True)
+            self.thread.start()
+            self.ready.wait()
+
+            # Also run by forked processes on their way out (unlike atexit)
+            multiprocessing.util.Finalize(self, self.flush, args=(setup['flush_timeout'],), exitpriority=10)
+
+        def __serve(self) -> None:
+            asyncio.set_event_loop(self.loop)
+            self.queue = asyncio.Queue(self.setup['queue'])
+            self.loop.create_task(self.__deliver_forever())
+            self.ready.set()
+            self.loop.run_forever()
+
+        def submit(self, text: str, files: list) -> None:
+            """
+            Queues a message, waiting only if the queue is full.
+            """
+            message = {'content': text, 'files': [(filename, file.read()) for file, filename in files]}
+            asyncio.run_coroutine_threadsafe(self.queue.put(message), self.loop).result()
+
+        def flush(self, timeout: float) -> bool:
+            """
+            Waits for the queued messages to be delivered.
+
+            Returns:
+                bool: Whether all of them were delivered (or given up on) in time.
+            """
+            if os.getpid() != self.pid or not self.thread.is_alive():
+                return True
+            try:
+                asyncio.run_coroutine_threadsafe(self.queue.join(), self.loop).result(timeout)
+                return True
+            except TimeoutError:
+                logging.warning(f"Informio gave up on {self.queue.qsize()} messages after {timeout}s")
+                return False
+
+        async def __deliver_forever(self) -> None:
+            timeout = aiohttp.ClientTimeout(total=self.setup['timeout'])
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                following = None
+                while True:
+                    batch = [following or await self.queue.get()]
+                    following = None
+                    try:
+                        if not batch[0]['files']:
+                            following = await self.__gather(batch)
+
+                        content = '\n'.join(message['content'] for message in batch)
+                        await self.__post(session, content, batch[-1]['files'])
+
+                    except Exception as e:
+                        logging.error(f"Informio failed to deliver a message: {e}")
+                    finally:
+                        for _ in batch:
+                            self.queue.task_done()
+
+        async def __gather(self, batch: list):
+            """
+            Coalesces the text messages that follow within `linger` seconds, while they fit in a message.
+
+            Returns:
+                dict | None: The message that did not fit, for the next batch.
+            """
+            length = len(batch[0]['content'])
+            deadline = self.loop.time() + self.setup['linger']
+            while True:
+                try:
+                    following = await asyncio.wait_for(self.queue.get(), max(deadline - self.loop.time(), 0))
+                except asyncio.TimeoutError:
+                    return None
+
+                if following['files'] or length + 1 + len(following['content']) > self.setup['limit']:
+                    return following
+                batch.append(following)
+                length += 1 + len(following['content'])
+
+        async def __post(self, session: aiohttp.ClientSession, content: str, files: list) -> None:
+            for attempt in range(self.setup['retries'] + 1):
+                form = aiohttp.FormData()
+                form.add_field('payload_json', json.dumps({'content': content}), content_type='application/json')
+                for index, (filename, data) in enumerate(files):
+                    form.add_field(f'files[{index}]', data, filename=filename)
+
+                try:
+                    async with session.post(self.url, data=form) as response:
+                        await response.read()
+
+                        if response.status < 300:
+                            if response.headers.get('X-RateLimit-Remaining') == '0':
+                                # Out of requests in this bucket, waits for it to refill
+                                await asyncio.sleep(float(response.headers.get('X-RateLimit-Reset-After', 0)))
+                            return
+                        if response.status == 429:
+                            # Retry-After already covers the refill of the bucket
+                            delay = float(response.headers.get('Retry-After', self.setup['backoff']))
+                            logging.warning(f"Informio rate-limited, retrying in {delay:.2f}s")
+                            await asyncio.sleep(delay)
+                            continue
+                        if response.status < 500:
+                            raise RuntimeError(f"HTTP {response.status}: {(await response.text())[:200]}")
+
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logging.warning(f"Informio failed to reach Discord: {e}")
+
+                await asyncio.sleep(self.setup['backoff'] * 2 ** attempt * random.uniform(0.5, 1))
+
+            raise RuntimeError(f"Gave up after {self.setup['retries']} retries")
+
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Forgets the Heralds of the parent, in a forked process.
+        """
+        cls.lock = threading.Lock()
+        cls.heralds = dict()
+
     def __init__(self):
         self.webhook_url = Constants.creds["webhooks"]["#general"]["informio"]["url"]
         self.author = Constants.creds["webhooks"]["#general"]["informio"]["author"]
-        self.webhook = discord_webhook.DiscordWebhook(url=self.webhook_url)
+
+    @classmethod
+    def load(cls) -> dict:
+        return Constants.discord['informio']
+
+    @classmethod
+    def herald(cls, url: str) -> Herald:
+        """
+        Returns the Herald of the webhook in this process, started on first use.
+        """
+        with cls.lock:
+            if url not in cls.heralds:
+                cls.heralds[url] = Informio.Herald(url, cls.load())
+            return cls.heralds[url]
 
     def send_message(self, text: str, files=[]) -> None:
         """
-        Delivers a message to the general channel on discord
+        Delivers a message to the general channel on discord, in the background
+
+        Messages longer than Discord allows are paginated, and past `most_pages`
+        pages, attached as a gzipped text file instead (see Response.digest).
+        """
+        setup = self.load()
+        pages, attachments = Response.digest(text, setup['limit'], setup['most_pages'])
+
+        herald = self.herald(self.webhook_url)
+        for page in pages[:-1]:
+            herald.submit(page, [])
+        # Attachments go with the last page
+        herald.submit(pages[-1], list(files) + attachments)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits for the messages sent so far to be delivered
         """
-        self.webhook.content = text
+        return self.herald(self.webhook_url).flush(timeout or self.load()['flush_timeout'])
 
-        for file, filename in files:
-            self.webhook.add_file(file=file, filename=filename)
 
-        self.webhook.execute()
+# Flows run in forked processes, whose Heralds have to be their own
+os.register_at_fork(after_in_child=Informio.reset)
 
 
 if __name__ == "__main__":
@@ -1,100 +1,99 @@
 #!/usr/bin/python3
 
+import fnmatch
 import logging
 import os
-import subprocess
+import threading
 import traceback
 import zipfile
 from mimetypes import MimeTypes
 
 import pyzipper
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
 
 from src.common.config import Constants
+from src.services.bifrost import Bifrost
+from src.services.bindery import Bindery
+from src.services.cartographer import Cartographer
+from src.services.concordance import Concordance
+from src.services.conduit import Conduit
+from src.services.courier import Courier
+from src.services.scout import Scout
+from src.services.seeker import Seeker
 
 
 class Librarian:
     def __init__(self):
         """
-        Initializes the Librarian class, setting up the necessary configurations and credentials.
+        Initializes the Librarian class, setting up the necessary configurations.
 
-        This constructor sets up the Google Drive API configuration parameters, including
-        the service account file, folder ID, and scopes required for authentication.
+        This constructor sets up the Google Drive API configuration parameters, the
+        credentials themselves are loaded (once per process) by Bifrost.
 
         Attributes:
-            self.__SERVICE_ACCOUNT_FILE (str): Path to the service account JSON key file.
             self.__FOLDER_ID (str): ID of the folder in which files will be uploaded.
-            self.__SCOPES (list): List of scopes required for authentication.
             self.__FIELDS (list): List of fields to fetch upon successful upload.
         """
 
-        self.__SERVICE_ACCOUNT_FILE = Constants.creds["librarian"]["json-key-file"]
         self.__FOLDER_ID = Constants.creds["librarian"]["folder-id"]
-        self.__SCOPES = Constants.creds["librarian"]["scopes"]
         self.__FIELDS = Constants.creds["librarian"]["fields"]
 
     def __initiate_bifrost(self):
         """
         Establish a connection to the Google Drive API.
 
-        Initializes the Google Drive API service by creating and returning
-        an authenticated service instance with the provided credentials.
+        Returns the cached, authenticated Google Drive API service of the calling
+        thread (see Bifrost), built on first use and reused across calls.
 
         Returns:
             googleapiclient.discovery.Resource: An authenticated Google Drive API service.
         """
 
-        logging.info("Initializing connection to Google Drive API")
+        drive_service = Bifrost.connect()
 
-        creds = service_account.Credentials.from_service_account_file(
-            self.__SERVICE_ACCOUNT_FILE,
-            scopes=self.__SCOPES,
-        )
-        drive_service = build("drive", "v3", credentials=creds)
-
-        logging.info("Connection to Google Drive API established successfully")
+        logging.info(f"Connection to Google Drive API established, telemetry: {Bifrost.get_status()}")
         return drive_service
 
-    def __exec(self, command: str) -> dict:
+    def __scout(self, path_to_search: str, predicate, limit: int) -> dict:
         """
-        Execute a shell command and return a list of file paths.
+        Walk a directory in-process and return the paths satisfying the predicate.
 
-        This private method is used internally to execute shell commands and retrieve
-        a list of file paths based on the command's output.
+        This private method is used internally to search the paths not covered by
+        the indexes, walking the directory in parallel (see Scout).
 
         Args:
-            command (str): The shell command to execute.
+            path_to_search (str): The directory path to start the search from.
+            predicate (callable): Called with the os.DirEntry of every entry.
+            limit (int): Maximum number of paths to return, None for no limit.
 
         Returns:
-            list: A list of file paths resulting from the executed command.
+            list: A list of file paths satisfying the predicate.
         """
 
         try:
-            result = subprocess.check_output(command, shell=True, text=True)
-
-            filenames = str(result).splitlines()
-            filepaths = list(map(os.path.normpath, filenames))
+            if not os.path.isdir(path_to_search):
+                raise NotADirectoryError(f"Cannot find directory {path_to_search}")
 
+            workers = Constants.librarian["scout"]["workers"]
+            filepaths = sorted(Scout.walk(path_to_search, predicate, limit=limit, workers=workers))
             return {"status": "success", "filepaths": filepaths}
 
-        except subprocess.CalledProcessError as e:
-            return {"status": "error", "message": traceback.format_exc()}
-
         except Exception as e:
             return {"status": "error", "message": traceback.format_exc()}
 
-    def title_tracker(self, path_to_search: str, string_to_match: str) -> dict:
+    def title_tracker(self, path_to_search: str, string_to_match: str, limit: int = None) -> dict:
         """
         Search for files with a specific string in their names.
 
         This method searches for files in the specified directory and its subdirectories
-        that contain a given string in their filenames.
+        that contain a given string in their filenames. Paths covered by the filename
+        index (see Cartographer) are looked up in the index, the rest are walked.
 
         Args:
             path_to_search (str): The directory path to start the search from.
             string_to_match (str): The string to match in the filenames.
+            limit (int): Maximum number of file paths to return, None for no limit.
 
         Returns:
             list: A list of file paths matching the search criteria.
@@ -104,48 +103,88 @@ class Librarian:
             f"Searching for files with name matching '{string_to_match}' in {path_to_search}"
         )
 
-        command = (
-            f"find {path_to_search} -iname '*{string_to_match}*' -not -path '*/.*'"
-        )
-        return self.__exec(command)
+        if Cartographer.enabled():
+            try:
+                filepaths = Cartographer.search(path_to_search, string_to_match)
+                if filepaths is not None:
+                    return {"status": "success", "filepaths": filepaths[:limit]}
+            except Exception as e:
+                logging.error(f"Filename index unavailable: {traceback.format_exc()}")
 
-    def content_curator(self, path_to_search: str, string_to_match: str) -> dict:
+        # Fallback: Walk the paths not covered by the index
+        pattern = f"*{string_to_match.lower()}*"
+        matches = lambda entry: fnmatch.fnmatchcase(entry.name.lower(), pattern)
+        return self.__scout(path_to_search, matches, limit)
+
+    def content_curator(self, path_to_search: str, string_to_match: str, limit: int = None, regex: bool = False) -> dict:
         """
         Search for files containing a specific string in their content.
 
         This method searches for files in the specified directory and its subdirectories
-        that contain a given string within their content using the 'grep' command.
+        that contain a given string within their content, ranked by their number of hits
+        (see Seeker). Paths covered by the content index (see Concordance) only search
+        the candidates of the index, the rest are walked.
 
         Args:
             path_to_search (str): The directory path to start the search from.
             string_to_match (str): The string to match within the file content.
+            limit (int): Maximum number of file paths to return, None for no limit.
+            regex (bool): Whether string_to_match is a regular expression.
 
         Returns:
-            list: A list of file paths whose content matches the search criteria.
+            list: A list of file paths whose content matches the search criteria,
+                along with the matches (hits and line snippets) of every file.
         """
 
         logging.info(
             f"Searching for files with content matching '{string_to_match}' in {path_to_search}"
         )
 
-        command = f"find {path_to_search} -type f -exec grep -li '{string_to_match}' {{}} + -not -path '*/.*'"
-        return self.__exec(command)
+        try:
+            candidates = None
+            if Concordance.enabled() and not regex:
+                try:
+                    candidates = Concordance.candidates(path_to_search, string_to_match)
+                except Exception as e:
+                    logging.error(f"Content index unavailable: {traceback.format_exc()}")
+
+            if candidates is None:
+                # Fallback: Walk the paths not covered by the index
+                if not os.path.isdir(path_to_search):
+                    raise NotADirectoryError(f"Cannot find directory {path_to_search}")
+                is_file = lambda entry: entry.is_file(follow_symlinks=False)
+                workers = Constants.librarian["scout"]["workers"]
+                candidates = Scout.walk(path_to_search, is_file, workers=workers)
+
+            matches = Seeker.search(candidates, string_to_match, regex=regex, limit=limit)
+            return {
+                "status": "success",
+                "filepaths": [match["path"] for match in matches],
+                "matches": matches,
+            }
+
+        except Exception as e:
+            return {"status": "error", "message": traceback.format_exc()}
 
-    def archive_creator(self, path_to_archive: str, password: str) -> dict:
+    def archive_creator(self, path_to_archive: str, password: str, listener=None) -> dict:
         """
         Create a zip archive of a file or folder. Optionally password protect the archive.
 
         This method takes a file or folder path as input, along with a password (optional),
         and creates a zip archive containing the specified file
         or folder. The resulting zip file is stored in the same location as the
-        original file or folder.
+        original file or folder. The files are compressed in parallel (see Bindery)
+        unless disabled, media and archives are stored uncompressed.
 
         Args:
             path_to_archive (str): The path to the file or folder to be archived.
             password (str): The password to protect the zip archive. If None, Archive will not be encrypted.
+            listener (callable) [Optional]: Called with the bytes archived so far, the total
+                and the elapsed seconds, periodically (parallel mode only).
 
         Returns:
-            str: The path to the created (password-protected) zip archive.
+            str: The path to the created (password-protected) zip archive,
+                along with the archiving stats in parallel mode.
         """
 
         try:
@@ -159,6 +198,11 @@ class Librarian:
             # Construct the path for the zip archive
             zip_file_path = os.path.join(dir_name, f"{base_name}.zip")
 
+            if Bindery.enabled():
+                stats = Bindery.bind(path_to_archive, zip_file_path, password, listener)
+                logging.info(f"Archived {path_to_archive}: {stats}")
+                return {"status": "success", "zip_file_path": zip_file_path, "stats": stats}
+
             if password == None:
                 zipf = zipfile.ZipFile(zip_file_path, "w", zipfile.ZIP_DEFLATED)
             else:
@@ -230,12 +274,130 @@ class Librarian:
         except Exception as e:
             return {"status": "error", "message": traceback.format_exc()}
 
+    def tomes_transporter(self, path: str, listener=None) -> dict:
+        """
+        Upload every file of a folder (or a single file) to Google Drive, as is.
+
+        This method uploads the files several at a time (see Courier), resuming the
+        uploads interrupted by a previous run, and skipping the files already in the
+        Google Drive folder.
+
+        Args:
+            path (str): The path to the file or folder to be uploaded.
+            listener (callable) [Optional]: Called with the progress of the uploads, periodically.
+
+        Returns:
+            dict: The requested fields of every uploaded file, along with the duplicates
+            skipped and the files that failed to upload.
+        """
+
+        try:
+            if not os.path.exists(path):
+                raise Exception(f"Cannot find {path}")
+
+            if os.path.isdir(path):
+                paths = sorted(
+                    os.path.join(root, name)
+                    for root, _, names in os.walk(path)
+                    for name in names
+                    if os.path.isfile(os.path.join(root, name))
+                )
+            else:
+                paths = [path]
+
+            logging.info(f"Uploading {len(paths)} files from {path} to Google Drive")
+
+            delivery = Courier.deliver(paths, self.__FOLDER_ID, self.__FIELDS, listener)
+
+            return {
+                "status": "success" if not delivery["failed"] else "error",
+                "uploaded": [
+                    {"path": file["path"]} | {field: file.get(field) for field in self.__FIELDS}
+                    for file in delivery["uploaded"]
+                ],
+                "duplicates": delivery["duplicates"],
+                "failed": delivery["failed"],
+            }
+
+        except Exception as e:
+            return {"status": "error", "message": traceback.format_exc()}
+
+    def stream_transporter(self, path_to_archive: str, password: str, listener=None) -> dict:
+        """
+        Archive a file or folder and upload the zip to Google Drive as it is being built.
+
+        This method builds the zip archive of the file or folder (see Bindery) into a
+        Conduit, from which it is uploaded in chunks, with a resumable upload, while
+        the rest of it is still being compressed. The archive never touches the disk,
+        so folders larger than the free space can be uploaded, and the whole takes
+        about as long as the slower of compression and upload.
+
+        Args:
+            path_to_archive (str): The path to the file or folder to be archived.
+            password (str): The password to protect the zip archive. If None, Archive will not be encrypted.
+            listener (callable) [Optional]: Called with the bytes archived so far, the total
+                and the elapsed seconds, periodically.
+
+        Returns:
+            dict: The requested fields of the uploaded archive, along with the archiving stats.
+        """
+
+        try:
+            if not os.path.exists(path_to_archive):
+                raise Exception(f"Cannot find {path_to_archive}")
+
+            setup = Conduit.load()
+            drive_service = self.__initiate_bifrost()
+
+            base_name = os.path.basename(os.path.normpath(path_to_archive))
+            file_metadata = {"name": f"{base_name}.zip", "parents": [self.__FOLDER_ID]}
+            fields_to_fetch = ",".join(self.__FIELDS)
+
+            conduit = Conduit(setup["buffer"] * 2**20)
+            media = Conduit.Media(conduit, "application/zip", setup["chunk"] * 2**20)
+
+            outcome = dict()
+
+            def produce():
+                try:
+                    outcome["stats"] = Bindery.bind(path_to_archive, conduit, password, listener, pool)
+                    conduit.close()
+                except BaseException as e:
+                    conduit.abort(e)
+
+            logging.info(f"Streaming {path_to_archive} to Google Drive")
+
+            # The workers are forked here, not by the producer while the upload is under way
+            with Bindery.pool() as pool:
+                producer = threading.Thread(target=produce, name="bindery", daemon=True)
+                producer.start()
+                try:
+                    # Sizes up the media, which already needs the archive to be under way
+                    request = drive_service.files().create(body=file_metadata, media_body=media, fields=fields_to_fetch)
+                    file = None
+                    while file is None:
+                        _, file = request.next_chunk(num_retries=setup["retries"])
+                except BaseException:
+                    # Stops the archive from being built for nothing
+                    conduit.cancel()
+                    raise
+                finally:
+                    producer.join()
+
+            return {"status": "success", "stats": outcome.get("stats")} | {
+                field: file.get(field) for field in self.__FIELDS
+            }
+
+        except Exception as e:
+            return {"status": "error", "message": traceback.format_exc()}
+
     def enumerate_collection(self) -> dict:
         """
         Retrieves a comprehensive listing of files in the Google Drive collection.
 
         This method fetches detailed information about all files in the Google Drive,
-        including their unique identifiers, names, MIME types, and web view links.
+        including their unique identifiers, names, MIME types, and web view links,
+        going through every page of the listing.
 
         Returns:
             list: A list containing dictionaries with information about each file in the collection.
@@ -259,17 +421,10 @@ class Librarian:
             Ensure that proper Google Drive API credentials are set up in the service account file.
         """
         try:
-            drive_service = self.__initiate_bifrost()
-
-            results = (
-                drive_service.files()
-                .list(
-                    fields="files(id, name, mimeType, webViewLink)",
-                )
-                .execute()
-            )
+            self.__initiate_bifrost()
 
-            files = results.get("files", [])
+            # Every page of the listing, not just the first one
+            files = list(Bifrost.enumerate("id, name, mimeType, webViewLink"))
 
             if not files:
                 return {"status": "success", "message": "No files found."}
@@ -316,12 +471,90 @@ class Librarian:
         except Exception as e:
             return {"status": "error", "message": traceback.format_exc()}
 
+    def snap_remotes(self, file_ids: list) -> dict:
+        """
+        Remove several files from Google Drive, in batches.
+
+        This method deletes the files through the Drive batch endpoint (see Bifrost.batch),
+        retrying the deletions that were rate-limited. Files that are already gone
+        count as removed.
+
+        Args:
+            file_ids (list): The unique identifiers of the files to be removed.
+
+        Returns:
+            dict: A dictionary indicating the status of the file removal operation,
+                along with the number of files removed and the errors by file ID.
+
+                Example:
+                    {'status': 'success', 'message': '3 files removed successfully.', 'removed': 3, 'failed': {}}
+        """
+
+        try:
+            self.__initiate_bifrost()
+
+            outcomes = Bifrost.batch(
+                {file_id: (lambda files, file_id=file_id: files.delete(fileId=file_id)) for file_id in file_ids}
+            )
+
+            failed = {
+                file_id: str(error) for file_id, (_, error) in outcomes.items()
+                if error is not None and not (isinstance(error, HttpError) and error.resp.status == 404)
+            }
+            removed = len(outcomes) - len(failed)
+
+            if failed:
+                return {
+                    "status": "error",
+                    "message": f"{len(failed)} of {len(outcomes)} files could not be removed.",
+                    "removed": removed,
+                    "failed": failed,
+                }
+            return {
+                "status": "success",
+                "message": f"{removed} files removed successfully.",
+                "removed": removed,
+                "failed": failed,
+            }
+
+        except Exception as e:
+            return {"status": "error", "message": traceback.format_exc()}
+
+    def inspect_remotes(self, file_ids: list, fields: str = "id, name, mimeType, size, webViewLink") -> dict:
+        """
+        Fetch the metadata of several files from Google Drive, in batches.
+
+        Args:
+            file_ids (list): The unique identifiers of the files.
+            fields (str): The fields to fetch for every file.
+
+        Returns:
+            dict: A dictionary with the metadata of the files found, and the errors by file ID.
+        """
+
+        try:
+            self.__initiate_bifrost()
+
+            outcomes = Bifrost.batch(
+                {file_id: (lambda files, file_id=file_id: files.get(fileId=file_id, fields=fields)) for file_id in file_ids}
+            )
+
+            return {
+                "status": "success",
+                "files": [response for response, error in outcomes.values() if error is None],
+                "failed": {file_id: str(error) for file_id, (_, error) in outcomes.items() if error is not None},
+            }
+
+        except Exception as e:
+            return {"status": "error", "message": traceback.format_exc()}
+
     def purge_remote(self) -> dict:
         """
         Remove all files from Google Drive.
 
         This method initiates the deletion of all files from the connected Google Drive.
-        It iterates through the list of files, deleting each one individually.
+        It goes through every page of the list of files, and deletes them in batches
+        (see snap_remotes).
 
         Returns:
             dict: A dictionary indicating the status of the file removal operation.
@@ -339,17 +572,9 @@ class Librarian:
         """
 
         try:
-            drive_service = self.__initiate_bifrost()
-
-            results = (
-                drive_service.files()
-                .list(
-                    fields="files(id)",
-                )
-                .execute()
-            )
+            self.__initiate_bifrost()
 
-            files = results.get("files", [])
+            files = list(Bifrost.enumerate("id"))
 
             # Drop the parent folder from the list
             files = [file for file in files if file["id"] != self.__FOLDER_ID]
@@ -359,8 +584,9 @@ class Librarian:
 
             logging.info(f"Deleting {len(files)} files from Google Drive")
 
-            for file in files:
-                drive_service.files().delete(fileId=file["id"]).execute()
+            response = self.snap_remotes([file["id"] for file in files])
+            if response["status"] == "error":
+                return response
 
             return {"status": "success", "message": "All files removed successfully."}
 
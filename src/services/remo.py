@@ -2,17 +2,27 @@
 
 import asyncio
 import collections
+import concurrent.futures
+import copy
 import inspect
 import json
 import logging
+import os
+import queue
+import time
 import traceback
 
 from src.common.config import Constants
 from src.services.executor import Executor
 from src.services.job import Job
+from src.services.scheduler import Scheduler
+from src.services.workspace import Workspace
 
 
 class Remo:
+    # Shared by every flow process forked from the bot, see Scheduler
+    scheduler = Scheduler.from_config(Constants.rse['scheduler'])
+
     @classmethod
     def __is_executor(cls, member) -> bool:
         return inspect.isclass(member[1]) and member[1].__module__ == Executor.__module__
@@ -25,7 +35,13 @@ class Remo:
     def __load(cls) -> dict:
         cls.__executors = dict(cls.__list_executors())
 
-    def __init__(self, args: collections.defaultdict):
+    def __init__(self, args: collections.defaultdict, listener=None):
+        """
+        Args:
+            args (collections.defaultdict): Execution args, see RemoteScriptExecution
+            listener (callable) [Optional]: Receives the latest output of the running
+                job periodically, as listener(stdout, stderr, elapsed) (see Warden.run)
+        """
         Remo.__load()
 
         if args['lang'] not in Remo.__executors:
@@ -34,25 +50,158 @@ class Remo:
 
         self.lang = args['lang']
         self.args = args
+        self.listener = listener
 
     def run(self) -> collections.defaultdict:
         response = collections.defaultdict()
         try:
-            executor = Remo.__executors[self.lang]()
+            # Seconds spent waiting in the queue and in each phase
+            timings = collections.defaultdict(float)
+            started = time.perf_counter()
+
+            with Remo.scheduler.admit(self.lang) as ticket:
+                executor = Remo.__executors[self.lang]()
+
+                try:
+                    with ticket.phase('compile'):
+                        timings['wait'] += time.perf_counter() - started
+                        mark = time.perf_counter()
+                        prep_response = executor.prepare(self.args)
+                        timings['prepare'] = time.perf_counter() - mark
+
+                    if prep_response['status'] == 'error':
+                        prep_response['timings'] = Remo.__total(timings, started)
+                        return prep_response
+
+                    mark = time.perf_counter()
+                    if isinstance(self.args.get('stdin'), list):
+                        # Every case takes a run worker of its own
+                        run_response = self.__run_cases(executor, ticket)
+                        timings['run'] = time.perf_counter() - mark
+                    else:
+                        with ticket.phase('run'):
+                            timings['wait'] += time.perf_counter() - mark
+                            mark = time.perf_counter()
+                            executor.listener = self.listener
+                            run_response = executor.run()
+                            timings['run'] = time.perf_counter() - mark
+                        # Spilled to the workspace, which is about to be removed
+                        for key in ['stdout', 'stderr']:
+                            if f'{key}_file' in run_response:
+                                run_response[key] = Remo.__collect(run_response, key)
+
+                    run_response['timings'] = Remo.__total(timings, started)
+                    return run_response
+
+                finally:
+                    if getattr(executor, 'workspace', None):
+                        Workspace.remove(executor.workspace)
+
+        except Scheduler.QueueFull as e:
+            response['status'] = 'error'
+            response['message'] = str(e)
 
-            prep_response = executor.prepare(self.args)
-            if prep_response['status'] == 'error':
-                return prep_response
-            
-            run_response = executor.run()
-            return run_response
-        
         except Exception as e:
             response['status'] = 'error'
             response['message'] = traceback.format_exc()
             
         return response
 
+    @staticmethod
+    def __total(timings: dict, started: float) -> dict:
+        timings['total'] = time.perf_counter() - started
+        return dict(timings)
+
+    @classmethod
+    def purge(cls) -> bool:
+        """
+        Reclaims the workspaces left behind by jobs of every language.
+        """
+        cls.__load()
+        return all([executor.purge() for executor in cls.__executors.values()])
+
+    @staticmethod
+    def __normalize(output: str) -> list:
+        lines = [line.rstrip() for line in output.splitlines()]
+        while lines and not lines[-1]:
+            lines.pop()
+        return lines
+
+    @staticmethod
+    def __collect(run_response: dict, key: str) -> str:
+        """
+        Reads back an output that was spilled to the workspace, and removes the spilled file.
+        """
+        path = run_response.pop(f'{key}_file', None)
+        if path is None:
+            return run_response.get(key) or ''
+        try:
+            with open(path, errors='replace') as file:
+                return file.read()
+        finally:
+            os.remove(path)
+
+    def __run_cases(self, executor: Job, ticket: Scheduler.Ticket) -> collections.defaultdict:
+        """
+        Runs a prepared job against every stdin case, in parallel.
+
+        Every case holds a run worker of the scheduler while it runs (on the
+        ticket of the job, see Scheduler), so a batch never runs more cases
+        at a time than the scheduler allows, nor takes more of its queue.
+        Up to batch.parallelism cases are run at a time.
+
+        If expected outputs are provided, each case is judged AC or WA
+        (ignoring trailing whitespace), on top of the verdict of the run.
+        The timing of the run includes the waits for run workers.
+        """
+        cases = self.args.get('stdin')
+        expected = self.args.get('expected') or [None] * len(cases)
+        if len(expected) != len(cases):
+            raise ValueError(f'Got {len(expected)} expected outputs for {len(cases)} stdin cases')
+
+        pending = queue.SimpleQueue()
+        for index, stdin in enumerate(cases):
+            pending.put((index, stdin))
+        run_responses = [None] * len(cases)
+
+        def run_cases() -> None:
+            while True:
+                try:
+                    index, stdin = pending.get_nowait()
+                except queue.Empty:
+                    return
+                task = copy.copy(executor)
+                task.stdin = stdin
+                task.listener = None
+                with ticket.phase('run'):
+                    run_responses[index] = task.run()
+
+        parallelism = min(Constants.rse['batch']['parallelism'], len(cases))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as pool:
+            for future in [pool.submit(run_cases) for _ in range(parallelism)]:
+                future.result()
+
+        results = []
+        for index, (run_response, expected_output) in enumerate(zip(run_responses, expected)):
+            verdict = run_response.get('verdict', 'OK' if run_response['status'] == 'success' else 'RE')
+            stdout = Remo.__collect(run_response, 'stdout')
+            Remo.__collect(run_response, 'stderr')
+            if verdict == 'OK' and expected_output is not None:
+                matched = Remo.__normalize(stdout) == Remo.__normalize(expected_output)
+                verdict = 'AC' if matched else 'WA'
+
+            result = {'case': index + 1, 'verdict': verdict}
+            for key in ['status', 'stdout', 'stderr', 'stdout_truncated', 'stderr_truncated', 'message', 'cpu_time', 'wall_time', 'peak_rss']:
+                if key in run_response:
+                    result[key] = run_response[key]
+            results.append(result)
+
+        response = collections.defaultdict()
+        response['status'] = 'success'
+        response['summary'] = dict(collections.Counter(result['verdict'] for result in results))
+        response['cases'] = results
+        return response
+
 
 
 async def async_function(executor: Job, args, last_function):
@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+
+import contextlib
+import multiprocessing
+import os
+import time
+
+
+class Scheduler:
+    """
+    A bounded job queue with separate worker limits per phase.
+
+    Every flow request runs in its own process, so the queue is kept in
+    shared memory. It has to be created in the bot process, before the flow
+    processes are forked, for all of them to share the same queue.
+
+    A job is admitted into one of `capacity` tickets (QueueFull is raised
+    when none is left) and then waits for a worker of each phase it goes
+    through. Waiting jobs are served cheapest language first; a job that
+    has waited longer than `aging` seconds is served ahead of the rest, so
+    expensive languages do not starve.
+
+    A ticket may hold several workers of its phase (the cases of a batch,
+    see Remo), each counted against the workers of the phase. Those are
+    only handed out while no other job waits for a worker of the phase.
+    """
+
+    FREE, IDLE, WAITING, RUNNING = range(4)
+
+    class QueueFull(Exception):
+        pass
+
+    class Ticket:
+        def __init__(self, scheduler, index: int):
+            self.scheduler = scheduler
+            self.index = index
+
+        @contextlib.contextmanager
+        def phase(self, phase: str):
+            """
+            Waits for a worker of the phase and holds it until the block exits.
+            """
+            self.scheduler.acquire(self.index, phase)
+            try:
+                yield
+            finally:
+                self.scheduler.release(self.index)
+
+    def __init__(self, capacity: int, workers: dict, costs: dict, aging: float):
+        self.capacity = capacity
+        self.workers = workers
+        self.costs = costs
+        self.aging = aging
+        self.phases = list(workers.keys())
+
+        self.condition = multiprocessing.Condition()
+        self.__states = multiprocessing.Array('i', capacity, lock=False)
+        self.__phases = multiprocessing.Array('i', capacity, lock=False)
+        self.__pids = multiprocessing.Array('i', capacity, lock=False)
+        self.__held = multiprocessing.Array('i', capacity, lock=False)
+        self.__costs = multiprocessing.Array('d', capacity, lock=False)
+        self.__enqueued = multiprocessing.Array('d', capacity, lock=False)
+
+    @classmethod
+    def from_config(cls, setup: dict):
+        return cls(setup['capacity'], setup['workers'], setup['cost'], setup['aging'])
+
+    def __reclaim(self) -> None:
+        """
+        Frees the tickets of processes that died without releasing them.
+        """
+        for index in range(self.capacity):
+            if self.__states[index] == Scheduler.FREE:
+                continue
+            try:
+                os.kill(self.__pids[index], 0)
+            except ProcessLookupError:
+                self.__states[index] = Scheduler.FREE
+                self.__held[index] = 0
+                self.condition.notify_all()
+
+    def __count(self, state: int, phase: int = None) -> int:
+        return sum(
+            1 for index in range(self.capacity)
+            if self.__states[index] == state and (phase is None or self.__phases[index] == phase)
+        )
+
+    def __running(self, phase: int) -> int:
+        """
+        Counts the workers of the phase held by the tickets.
+        """
+        return sum(
+            self.__held[index] for index in range(self.capacity)
+            if self.__states[index] == Scheduler.RUNNING and self.__phases[index] == phase
+        )
+
+    def __priority(self, index: int) -> tuple:
+        waited = time.time() - self.__enqueued[index]
+        cost = 0 if waited > self.aging else self.__costs[index]
+        return cost, self.__enqueued[index]
+
+    def __is_eligible(self, index: int) -> bool:
+        phase = self.__phases[index]
+        if self.__running(phase) >= self.workers[self.phases[phase]]:
+            return False
+
+        priority = self.__priority(index)
+        return not any(
+            self.__states[other] == Scheduler.WAITING and self.__phases[other] == phase
+            and self.__priority(other) < priority
+            for other in range(self.capacity) if other != index
+        )
+
+    @contextlib.contextmanager
+    def admit(self, lang: str):
+        """
+        Admits a job into the queue.
+
+        Raises:
+            Scheduler.QueueFull: If all the tickets are taken.
+        """
+        with self.condition:
+            self.__reclaim()
+            free = [index for index in range(self.capacity) if self.__states[index] == Scheduler.FREE]
+            if not free:
+                raise Scheduler.QueueFull(f'Job queue is full ({self.capacity} jobs). Please retry later.')
+
+            index = free[0]
+            self.__states[index] = Scheduler.IDLE
+            self.__pids[index] = os.getpid()
+            self.__costs[index] = self.costs.get(lang, max(self.costs.values()))
+
+        try:
+            yield Scheduler.Ticket(self, index)
+        finally:
+            with self.condition:
+                self.__states[index] = Scheduler.FREE
+                self.__held[index] = 0
+                self.condition.notify_all()
+
+    def acquire(self, index: int, phase: str) -> None:
+        code = self.phases.index(phase)
+        with self.condition:
+            while self.__states[index] == Scheduler.WAITING:
+                # Another thread of the ticket is waiting for the first worker
+                self.condition.wait(timeout=1)
+
+            if self.__states[index] == Scheduler.RUNNING and self.__phases[index] == code:
+                # One more worker for the ticket, once the other jobs have theirs
+                while self.__running(code) >= self.workers[phase] or self.__count(Scheduler.WAITING, code):
+                    self.condition.wait(timeout=1)
+                    self.__reclaim()
+                self.__held[index] += 1
+                return
+
+            self.__states[index] = Scheduler.WAITING
+            self.__phases[index] = code
+            self.__enqueued[index] = time.time()
+
+            while not self.__is_eligible(index):
+                # Wake up periodically, priorities age and processes die
+                self.condition.wait(timeout=1)
+                self.__reclaim()
+
+            self.__states[index] = Scheduler.RUNNING
+            self.__held[index] = 1
+            self.condition.notify_all()
+
+    def release(self, index: int) -> None:
+        with self.condition:
+            self.__held[index] -= 1
+            if self.__held[index] == 0:
+                self.__states[index] = Scheduler.IDLE
+            self.condition.notify_all()
+
+    def is_full(self) -> bool:
+        with self.condition:
+            self.__reclaim()
+            return self.__count(Scheduler.FREE) == 0
+
+    def status(self) -> dict:
+        with self.condition:
+            self.__reclaim()
+            return {
+                'capacity': self.capacity,
+                'admitted': self.capacity - self.__count(Scheduler.FREE),
+                'waiting': {
+                    phase: self.__count(Scheduler.WAITING, code) for code, phase in enumerate(self.phases)
+                },
+                'running': {
+                    phase: self.__running(code) for code, phase in enumerate(self.phases)
+                },
+                'workers': self.workers,
+            }
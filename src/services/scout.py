@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+
+import concurrent.futures
+import os
+import queue
+import threading
+
+
+class Scout:
+    """
+    An in-process, parallel directory walker.
+
+    Directories are listed with os.scandir by a pool of threads, every
+    subdirectory found being handed back to the pool, and the entries that
+    satisfy the predicate are streamed to the caller as they are found.
+    Closing the generator (or reaching the limit) stops the walk.
+
+    The matches are passed through a bounded queue, so a slow consumer
+    holds the walkers back instead of piling the matches up in memory.
+    """
+
+    # Marks the end of the walk in the queue of matches
+    DONE = object()
+
+    @classmethod
+    def walk(cls, top: str, predicate=None, limit: int = None, workers: int = 8, skip_hidden: bool = True, buffer: int = 1024):
+        """
+        Walks the tree under top, symlinks are not followed.
+
+        Args:
+            top (str): The directory to walk.
+            predicate (callable) [Optional]: Called with the os.DirEntry of every
+                entry (from the walker threads), the entry is a match if truthy.
+                Every entry matches if not provided.
+            limit (int) [Optional]: Stop after that many matches.
+            workers (int): Threads listing directories.
+            skip_hidden (bool): Skip the entries whose name starts with a dot, and
+                whatever is under them.
+            buffer (int): Matches queued up before the walkers wait for the consumer.
+
+        Yields:
+            str: Paths of the matching entries, in no particular order.
+        """
+        matches = queue.Queue(maxsize=buffer)
+        stop = threading.Event()
+        pending = [0]
+        lock = threading.Lock()
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scout')
+
+        def put(item) -> None:
+            while not stop.is_set():
+                try:
+                    matches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def submit(directory: str) -> None:
+            with lock:
+                pending[0] += 1
+            try:
+                pool.submit(scan, directory)
+            except RuntimeError:
+                # The pool was shut down, the walk is over
+                finish()
+
+        def finish() -> None:
+            with lock:
+                pending[0] -= 1
+                done = pending[0] == 0
+            if done:
+                put(cls.DONE)
+
+        def scan(directory: str) -> None:
+            try:
+                with os.scandir(directory) as scanner:
+                    for entry in scanner:
+                        if stop.is_set():
+                            return
+                        if skip_hidden and entry.name.startswith('.'):
+                            continue
+                        try:
+                            if predicate is None or predicate(entry):
+                                put(entry.path)
+                            if entry.is_dir(follow_symlinks=False):
+                                submit(entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                pass
+            finally:
+                finish()
+
+        submit(top)
+        try:
+            found = 0
+            while limit is None or found < limit:
+                match = matches.get()
+                if match is cls.DONE:
+                    break
+                yield match
+                found += 1
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
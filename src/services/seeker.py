@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+import concurrent.futures
+import functools
+import mmap
+import multiprocessing
+import os
+import re
+
+from src.common.config import Constants
+
+
+class Seeker:
+    """
+    A content search engine, ranking the files by their number of hits.
+
+    The files are spread across a pool of processes (one per core by
+    default). Every file is memory-mapped and scanned with a compiled
+    pattern, a literal string unless told otherwise, so it is never read
+    into memory as a whole. Binary files (NUL bytes in the first block)
+    are skipped.
+
+    A match reports the number of hits in the file, along with the first
+    few lines they were found on.
+    """
+
+    # Bytes sniffed for NUL bytes, to tell binary files apart
+    SNIFF = 8192
+
+    @classmethod
+    def load(cls) -> dict:
+        return Constants.librarian['seeker']
+
+    @staticmethod
+    def compile(pattern: str, regex: bool = False, ignore_case: bool = True) -> re.Pattern:
+        source = pattern.encode() if regex else re.escape(pattern.encode())
+        return re.compile(source, re.IGNORECASE if ignore_case else 0)
+
+    @staticmethod
+    def __contains(content: mmap.mmap, needle: bytes) -> bool:
+        """
+        Checks whether the content contains the (lower-cased) needle, ignoring ASCII case.
+        Far cheaper than a case-insensitive regex, which cannot skip ahead on a literal prefix.
+        """
+        block, overlap = 2**20, max(len(needle) - 1, 0)
+        for offset in range(0, len(content), block):
+            if needle in content[max(offset - overlap, 0):offset + block].lower():
+                return True
+        return False
+
+    @classmethod
+    def scan(cls, path: str, matcher: re.Pattern, snippets: int, width: int, literal: bytes = None):
+        """
+        Scans a file for the pattern. If the pattern is the literal (lower-cased),
+        files without it are ruled out before the pattern is matched.
+
+        Returns:
+            dict | None: path, hits and snippets (line number and text of the
+            first lines with hits), None if the file has no hits or cannot be read.
+        """
+        try:
+            with open(path, 'rb') as file:
+                if b'\0' in file.read(cls.SNIFF):
+                    return None
+                if os.fstat(file.fileno()).st_size == 0:
+                    return None
+
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    if literal is not None and not cls.__contains(content, literal):
+                        return None
+
+                    hits = 0
+                    lines = []
+                    line, counted = 1, 0
+                    for match in matcher.finditer(content):
+                        hits += 1
+                        if len(lines) >= snippets:
+                            continue
+
+                        start = match.start()
+                        line += content[counted:start].count(b'\n')
+                        counted = start
+                        if lines and lines[-1]['line'] == line:
+                            continue
+
+                        begin = content.rfind(b'\n', 0, start) + 1
+                        end = content.find(b'\n', start)
+                        end = len(content) if end == -1 else end
+                        text = content[begin:min(end, begin + width)].decode(errors='replace').strip()
+                        lines.append({'line': line, 'text': text})
+
+            if not hits:
+                return None
+            return {'path': path, 'hits': hits, 'snippets': lines}
+
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def search(cls, paths, pattern: str, regex: bool = False, limit: int = None) -> list:
+        """
+        Searches the files for the pattern, ignoring case.
+
+        Args:
+            paths (iterable): Paths of the files to search.
+            pattern (str): A literal string, or a regular expression if regex.
+            regex (bool): Whether the pattern is a regular expression.
+            limit (int) [Optional]: Return only the top ranked matches.
+
+        Returns:
+            list: Matches (see scan), most hits first.
+        """
+        setup = cls.load()
+        matcher = cls.compile(pattern, regex)
+        workers = setup['workers'] or os.cpu_count()
+
+        # Forked, so that the workers start without re-importing the bot
+        context = multiprocessing.get_context('fork')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            scan = functools.partial(
+                cls.scan, matcher=matcher, snippets=setup['snippets'], width=setup['width'],
+                literal=None if regex else pattern.encode().lower()
+            )
+            matches = [match for match in pool.map(scan, paths, chunksize=setup['chunksize']) if match is not None]
+
+        matches.sort(key=lambda match: (-match['hits'], match['path']))
+        return matches[:limit]
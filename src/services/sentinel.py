@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import multiprocessing
+import os
+import select
+import struct
+import threading
+import time
+import traceback
+
+from src.common.config import Constants
+from src.services.cartographer import Cartographer
+from src.services.concordance import Concordance
+
+
+class Sentinel:
+    """
+    Keeps the Librarian indexes (see Cartographer and Concordance) current
+    by watching their roots with inotify, instead of rescanning them.
+
+    Every directory under the roots gets a watch. Events are collected
+    until the roots have been quiet for `debounce` seconds (or for at most
+    `max_delay` seconds while they keep changing), and are then applied to
+    the indexes as a single batch: Cartographer re-lists the directories
+    that changed, Concordance re-indexes the files that changed.
+
+    The roots are crawled once on start, to catch up with whatever changed
+    while nobody was watching. If inotify is not available, or the watch
+    limit (fs.inotify.max_user_watches) is hit, Sentinel falls back to the
+    periodic crawlers of the indexes.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_DONT_FOLLOW = 0x02000000
+    IN_ISDIR = 0x40000000
+
+    IN_CLOEXEC = 0o2000000
+    IN_NONBLOCK = 0o4000
+
+    MASK = (
+        IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW
+    )
+
+    EVENT = struct.Struct('iIII')
+
+    class WatchLimitReached(Exception):
+        pass
+
+    def __init__(self, roots: list):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.descriptor = self.libc.inotify_init1(Sentinel.IN_NONBLOCK | Sentinel.IN_CLOEXEC)
+        if self.descriptor < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+        self.roots = [os.path.normpath(os.path.abspath(root)) for root in roots]
+        self.watches = dict()
+        self.directories = set()
+        self.files = set()
+        for root in self.roots:
+            self.watch(root)
+
+    @classmethod
+    def load(cls) -> dict:
+        return Constants.librarian['sentinel']
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls.load()['enabled']
+
+    @staticmethod
+    def __covers(roots: list, path: str) -> bool:
+        return any(path == root or path.startswith(f'{root}/') for root in roots)
+
+    def watch(self, top: str) -> None:
+        """
+        Watches a directory and every (non-hidden) directory under it.
+
+        Raises:
+            Sentinel.WatchLimitReached: If the kernel refuses any more watches.
+        """
+        for directory, dirnames, _ in os.walk(top):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            descriptor = self.libc.inotify_add_watch(self.descriptor, os.fsencode(directory), Sentinel.MASK)
+            if descriptor < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise Sentinel.WatchLimitReached(f'Unable to watch {directory}, raise fs.inotify.max_user_watches')
+                if error in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    continue
+                raise OSError(error, os.strerror(error), directory)
+            self.watches[descriptor] = directory
+
+    def unwatch(self, top: str) -> None:
+        """
+        Drops the watches of a directory (which moved away) and of everything under it.
+        """
+        for descriptor, directory in list(self.watches.items()):
+            if directory == top or directory.startswith(f'{top}/'):
+                self.libc.inotify_rm_watch(self.descriptor, descriptor)
+                del self.watches[descriptor]
+
+    def events(self, data: bytes):
+        """
+        Yields (mask, path) for every event in a buffer read from inotify.
+        """
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _, length = Sentinel.EVENT.unpack_from(data, offset)
+            offset += Sentinel.EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            directory = self.watches.get(descriptor)
+            if directory is None:
+                yield mask, None
+            else:
+                yield mask, os.path.join(directory, os.fsdecode(name)) if name else directory
+            if mask & Sentinel.IN_IGNORED:
+                self.watches.pop(descriptor, None)
+
+    def collect(self, mask: int, path: str) -> None:
+        """
+        Notes down what an event means for the indexes.
+        """
+        if path is None or os.path.basename(path).startswith('.'):
+            return
+
+        if mask & (Sentinel.IN_DELETE_SELF | Sentinel.IN_MOVE_SELF):
+            # Reported by the parent directory as well, nothing to index
+            return
+
+        directory = os.path.dirname(path)
+        if mask & (Sentinel.IN_CREATE | Sentinel.IN_DELETE | Sentinel.IN_MOVED_FROM | Sentinel.IN_MOVED_TO):
+            self.directories.add(directory)
+        self.files.add(path)
+
+        if mask & Sentinel.IN_ISDIR:
+            if mask & Sentinel.IN_MOVED_FROM:
+                self.unwatch(path)
+            elif mask & (Sentinel.IN_CREATE | Sentinel.IN_MOVED_TO):
+                self.watch(path)
+
+    def flush(self) -> None:
+        """
+        Applies the collected changes to the indexes, as a batch.
+        """
+        cartographer_roots = Cartographer.load()['roots'] if Cartographer.enabled() else []
+        concordance_roots = Concordance.load()['roots'] if Concordance.enabled() else []
+        cartographer_roots = [os.path.normpath(os.path.abspath(root)) for root in cartographer_roots]
+        concordance_roots = [os.path.normpath(os.path.abspath(root)) for root in concordance_roots]
+
+        directories = [path for path in self.directories if Sentinel.__covers(cartographer_roots, path)]
+        files = [path for path in self.files if Sentinel.__covers(concordance_roots, path)]
+        self.directories, self.files = set(), set()
+
+        if directories:
+            logging.info(f"Sentinel refreshed names {Cartographer.refresh(directories)}")
+        if files:
+            logging.info(f"Sentinel refreshed contents {Concordance.refresh(files)}")
+
+    def serve(self) -> None:
+        debounce = self.load()['debounce']
+        max_delay = self.load()['max_delay']
+        first_event = None
+
+        while True:
+            timeout = None if first_event is None else debounce
+            readable, _, _ = select.select([self.descriptor], [], [], timeout)
+
+            if readable:
+                overflowed = False
+                while True:
+                    try:
+                        data = os.read(self.descriptor, 2**16)
+                    except BlockingIOError:
+                        break
+                    for mask, path in self.events(data):
+                        overflowed = overflowed or bool(mask & Sentinel.IN_Q_OVERFLOW)
+                        self.collect(mask, path)
+
+                if overflowed:
+                    # Events were lost, only a crawl can tell what changed
+                    logging.warning("Sentinel missed events, crawling the roots")
+                    self.directories, self.files = set(), set()
+                    Sentinel.catch_up()
+
+                first_event = first_event or time.monotonic()
+                if time.monotonic() - first_event < max_delay:
+                    continue
+
+            if first_event is not None:
+                try:
+                    self.flush()
+                except Exception as e:
+                    logging.error(f"Sentinel failed to refresh the indexes: {traceback.format_exc()}")
+                first_event = None
+
+    @staticmethod
+    def catch_up() -> None:
+        for index in [Cartographer, Concordance]:
+            if not index.enabled():
+                continue
+            for root in index.load()['roots']:
+                try:
+                    logging.info(f"Crawled {index.crawl(root)}")
+                except Exception as e:
+                    logging.error(f"Unable to crawl {root}: {traceback.format_exc()}")
+
+    @classmethod
+    def patrol(cls) -> None:
+        roots = []
+        for index in [Cartographer, Concordance]:
+            if index.enabled():
+                roots += index.load()['roots']
+        # Nested roots are watched once, through the outermost one
+        roots = {os.path.normpath(os.path.abspath(root)) for root in roots}
+        roots = [root for root in roots if not cls.__covers(list(roots - {root}), root)]
+
+        try:
+            sentinel = cls(roots)
+            cls.catch_up()
+            sentinel.serve()
+        except (OSError, AttributeError, cls.WatchLimitReached) as e:
+            logging.error(f"Sentinel unavailable, falling back to periodic crawls: {e}")
+            # Daemonic processes cannot have children, the crawlers run as threads instead
+            crawlers = [
+                threading.Thread(target=index.patrol, name=index.__name__.lower(), daemon=True)
+                for index in [Cartographer, Concordance] if index.enabled()
+            ]
+            for crawler in crawlers:
+                crawler.start()
+            for crawler in crawlers:
+                crawler.join()
+
+    @classmethod
+    def start(cls):
+        """
+        Starts keeping the Librarian indexes current, with Sentinel if enabled,
+        with the periodic crawlers of the indexes otherwise.
+
+        Returns:
+            multiprocessing.Process | None: The watcher.
+        """
+        if not cls.enabled():
+            Cartographer.start()
+            Concordance.start()
+            return None
+        watcher = multiprocessing.Process(target=cls.patrol, name='sentinel', daemon=True)
+        watcher.start()
+        return watcher
@@ -0,0 +1,408 @@
+#!/usr/bin/python3
+
+import collections
+import contextlib
+import logging
+import math
+import os
+import re
+import resource
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+import src.common.config as config
+
+
+class Warden:
+    """
+    Runs a command confined with native resource limits.
+
+    Limits are applied by the kernel instead of being polled for:
+        - RLIMIT_CPU enforces the time limit (CPU seconds)
+        - a cgroup v2 (memory.max, cpu.max) enforces the memory limit when
+          a delegated cgroup is available, RLIMIT_AS otherwise
+        - the process group is killed once it spends more than wall_factor
+          times its time limit on the wall clock (sleeping, blocked on stdin)
+
+    Nothing is polled either: the command is waited for in wait4(), and the
+    wall clock limit is a timer. Usage is reported from wait4() or, with a
+    cgroup, from the cgroup itself, which accounts for every descendant of
+    the command.
+    """
+
+    class Sink:
+        """
+        Collects the output of a stream incrementally.
+
+        The first `spill` bytes are kept in memory, the rest is spilled to a
+        temporary file, in the directory given (the workspace of the job,
+        removed along with it). Nothing beyond `cap` bytes is kept, the sink
+        reports an overflow instead. The latest `tail` characters are always at hand
+        for progress updates.
+        """
+
+        def __init__(self, cap: int, spill: int, tail: int, directory: str = None):
+            self.cap = cap
+            self.spill = spill
+            self.tail_size = tail
+            self.directory = directory
+            self.head = bytearray()
+            self.tail = bytearray()
+            self.file = None
+            self.size = 0
+            self.overflowed = False
+            self.lock = threading.Lock()
+
+        def write(self, chunk: bytes) -> bool:
+            """
+            Returns:
+                bool: False once the cap is exceeded.
+            """
+            with self.lock:
+                if self.size + len(chunk) > self.cap:
+                    chunk = chunk[:self.cap - self.size]
+                    self.overflowed = True
+
+                if self.file is None and len(self.head) + len(chunk) > self.spill:
+                    self.file = tempfile.NamedTemporaryFile(prefix='jarvis-', suffix='.out', dir=self.directory, delete=False)
+                    self.file.write(self.head)
+                    self.head += chunk[:self.spill - len(self.head)]
+                elif self.file is None:
+                    self.head += chunk
+
+                if self.file is not None:
+                    self.file.write(chunk)
+
+                self.size += len(chunk)
+                self.tail = (self.tail + chunk)[-self.tail_size:]
+                return not self.overflowed
+
+        def peek(self) -> str:
+            with self.lock:
+                return self.tail.decode(errors='replace')
+
+        def close(self) -> None:
+            if self.file is not None:
+                self.file.close()
+
+        def report(self, key: str) -> dict:
+            """
+            Returns:
+                dict: The output (or its head, if spilled) under the key,
+                and the path of the spilled output under <key>_file.
+            """
+            report = {key: self.head.decode(errors='replace')}
+            if self.file is not None:
+                report[f'{key}_file'] = self.file.name
+            if self.overflowed:
+                report[f'{key}_truncated'] = True
+            return report
+
+    @classmethod
+    def load(cls) -> dict:
+        return config.Constants.rse['limiter']
+
+    @classmethod
+    def sink(cls, directory: str = None):
+        setup = config.Constants.rse['stream']
+        return cls.Sink(setup['cap'] * 2**20, setup['spill'] * 2**20, setup['tail'], directory)
+
+    @classmethod
+    def is_native(cls) -> bool:
+        return cls.load()['mode'] == 'native'
+
+    @classmethod
+    def confine(cls, time_limit: float, memory_limit: int = None) -> None:
+        """
+        Applies the rlimits to the calling process.
+
+        Args:
+            time_limit (float): CPU time limit in seconds.
+            memory_limit (int): Address space limit in Kilobytes, None to skip.
+        """
+        cpu_limit = math.ceil(time_limit)
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 1))
+        if memory_limit is not None:
+            memory_limit *= 1024
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    @classmethod
+    def verdict(cls, status: int, cpu_time: float, time_limit: float, killed: bool, oom_kills: int = 0, overflowed: bool = False) -> str:
+        """
+        Classifies the wait status of a confined process.
+
+        Returns:
+            str: One of OK, TLE, MLE, OLE, RE
+        """
+        if overflowed:
+            return 'OLE'
+        if killed:
+            return 'TLE'
+        if oom_kills:
+            return 'MLE'
+        if os.WIFSIGNALED(status):
+            if os.WTERMSIG(status) == signal.SIGXCPU:
+                return 'TLE'
+            if os.WTERMSIG(status) == signal.SIGXFSZ:
+                return 'OLE'
+            if os.WTERMSIG(status) == signal.SIGKILL and cpu_time >= time_limit:
+                return 'TLE'
+            return 'RE'
+        return 'OK' if os.WEXITSTATUS(status) == 0 else 'RE'
+
+    @classmethod
+    def parse_report(cls, stderr: str) -> dict:
+        """
+        Extracts the usage from the report timeout.pl prints to stderr,
+        for the jobs that ran under the perl fallback.
+        """
+        match = re.search(r'(\w+) CPU ([\d.]+) MEM -?\d+ MAXMEM -?\d+ STALE \d+ MAXMEM_RSS (-?\d+)\s*$', stderr or '')
+        if not match:
+            return dict()
+
+        reason, cpu_time, peak_rss = match.groups()
+        verdicts = {'FINISHED': 'OK', 'TIMEOUT': 'TLE', 'HANGUP': 'TLE', 'MEM': 'MLE', 'MEM_RSS': 'MLE'}
+        return {
+            'verdict': verdicts.get(reason, 'RE'),
+            'cpu_time': float(cpu_time),
+            'peak_rss': max(int(peak_rss), 0),
+        }
+
+    '''
+    cgroup v2
+    '''
+
+    @classmethod
+    def __cgroup_root(cls):
+        root = cls.load()['cgroup']
+        if not root or not os.path.exists('/sys/fs/cgroup/cgroup.controllers'):
+            return None
+        try:
+            os.makedirs(root, exist_ok=True)
+            with open(os.path.join(root, 'cgroup.subtree_control')) as subtree_control:
+                enabled = subtree_control.read().split()
+            if not {'memory', 'cpu'}.issubset(enabled):
+                with open(os.path.join(root, 'cgroup.subtree_control'), 'w') as subtree_control:
+                    subtree_control.write('+memory +cpu')
+            return root
+        except OSError:
+            return None
+
+    @classmethod
+    def __create_cgroup(cls, memory_limit: int):
+        root = cls.__cgroup_root()
+        if root is None:
+            return None
+        try:
+            cgroup = os.path.join(root, f'job-{uuid.uuid4().hex}')
+            os.mkdir(cgroup)
+            limits = {
+                'memory.max': str(memory_limit * 1024),
+                'memory.swap.max': '0',
+                'cpu.max': f"{int(cls.load()['cpu_quota'] * 100000)} 100000",
+            }
+            for name, value in limits.items():
+                with open(os.path.join(cgroup, name), 'w') as control:
+                    control.write(value)
+            return cgroup
+        except OSError:
+            logging.error(f"Unable to create a cgroup: {traceback.format_exc()}")
+            return None
+
+    @staticmethod
+    def __read_cgroup(cgroup: str, name: str) -> dict:
+        with open(os.path.join(cgroup, name)) as control:
+            return dict(line.split() for line in control.read().splitlines())
+
+    @classmethod
+    def __dispose_cgroup(cls, cgroup: str) -> dict:
+        usage = dict()
+        try:
+            usage['cpu_time'] = int(cls.__read_cgroup(cgroup, 'cpu.stat')['usage_usec']) / 10**6
+            usage['oom_kills'] = int(cls.__read_cgroup(cgroup, 'memory.events').get('oom_kill', 0))
+            # memory.peak is only available on Linux 5.19+
+            with contextlib.suppress(FileNotFoundError):
+                with open(os.path.join(cgroup, 'memory.peak')) as control:
+                    usage['peak_rss'] = int(control.read()) // 1024
+
+            # Left-over descendants keep the cgroup busy
+            with contextlib.suppress(FileNotFoundError):
+                with open(os.path.join(cgroup, 'cgroup.kill'), 'w') as control:
+                    control.write('1')
+            for attempt in range(50):
+                try:
+                    os.rmdir(cgroup)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+
+        except OSError:
+            logging.error(f"Unable to dispose the cgroup {cgroup}: {traceback.format_exc()}")
+
+        return usage
+
+    '''
+    Execution
+    '''
+
+    @classmethod
+    def __wrap(cls, shell_cmds: list, time_limit: float, memory_limit: int, cgroup: str) -> list:
+        """
+        Wraps the command in a shell that joins the cgroup and applies the
+        rlimits (see confine) before it execs the command, instead of a
+        preexec_fn, which is unsafe to run from a threaded process.
+        """
+        cpu_limit = math.ceil(time_limit)
+        setup = [f'ulimit -S -t {cpu_limit}', f'ulimit -H -t {cpu_limit + 1}']
+        if cgroup:
+            setup.insert(0, 'echo $$ > "$0"')
+        else:
+            setup.append(f'ulimit -v {memory_limit}')
+        procs = os.path.join(cgroup, 'cgroup.procs') if cgroup else 'warden'
+        return ['/bin/sh', '-c', ' && '.join(setup + ['exec "$@"']), procs, *shell_cmds]
+
+    @staticmethod
+    def __feed(stream, payload: bytes) -> None:
+        with contextlib.suppress(BrokenPipeError, OSError):
+            stream.write(payload)
+        with contextlib.suppress(BrokenPipeError, OSError):
+            stream.close()
+
+    @staticmethod
+    def __drain(stream, sink, overflow: threading.Event, kill) -> None:
+        for chunk in iter(lambda: stream.read1(2**16), b''):
+            if not sink.write(chunk) and not overflow.is_set():
+                overflow.set()
+                kill()
+        stream.close()
+        sink.close()
+
+    @classmethod
+    def run(cls, shell_cmds: list, cwd: str, stdin, time_limit: float, memory_limit: int, listener=None, spill_directory: str = None) -> collections.defaultdict:
+        """
+        Runs the command under the limits and streams its output and usage.
+
+        Args:
+            shell_cmds (list): The command to run.
+            cwd (str): Working directory of the command.
+            stdin (str | bytes): Standard input of the command.
+            time_limit (float): CPU time limit in seconds.
+            memory_limit (int): Memory limit in Kilobytes.
+            listener (callable) [Optional]: Called as listener(stdout, stderr, elapsed)
+                with the latest output, every stream.interval seconds while the command runs.
+            spill_directory (str) [Optional]: Where output beyond stream.spill MB is spilled.
+
+        Returns:
+            collections.defaultdict: status, stdout, stderr, verdict, returncode,
+            cpu_time (s), wall_time (s) and peak_rss (KB, from the cgroup, or from
+            wait4() if the command outgrew this process, None otherwise), and a
+            message on failures. Spilled outputs
+            are reported by their head, with the full output at stdout_file/stderr_file.
+            The command is killed (OLE) once an output exceeds stream.cap MB.
+        """
+        response = collections.defaultdict()
+        cgroup = cls.__create_cgroup(memory_limit)
+
+        try:
+            started = time.monotonic()
+            process = subprocess.Popen(
+                cls.__wrap(shell_cmds, time_limit, memory_limit, cgroup),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                start_new_session=True,
+            )
+
+            killed = threading.Event()
+            exited = threading.Event()
+            lock = threading.Lock()
+
+            def kill():
+                with lock:
+                    if not exited.is_set():
+                        killed.set()
+                        with contextlib.suppress(ProcessLookupError):
+                            os.killpg(process.pid, signal.SIGKILL)
+
+            def report():
+                # Every interval, until the command exits
+                while not exited.wait(interval):
+                    listener(stdout.peek(), stderr.peek(), time.monotonic() - started)
+
+            payload = stdin or ''
+            payload = payload if isinstance(payload, bytes) else payload.encode()
+            stdout, stderr = cls.sink(spill_directory), cls.sink(spill_directory)
+            overflow = threading.Event()
+            interval = config.Constants.rse['stream']['interval']
+            workers = [
+                threading.Thread(target=cls.__feed, args=(process.stdin, payload), daemon=True),
+                threading.Thread(target=cls.__drain, args=(process.stdout, stdout, overflow, kill), daemon=True),
+                threading.Thread(target=cls.__drain, args=(process.stderr, stderr, overflow, kill), daemon=True),
+            ]
+            if listener:
+                workers.append(threading.Thread(target=report, daemon=True))
+            for worker in workers:
+                worker.start()
+
+            # The wall clock limit, for commands that sleep or block
+            timer = threading.Timer(time_limit * cls.load()['wall_factor'], kill)
+            timer.daemon = True
+            timer.start()
+
+            _, status, usage = os.wait4(process.pid, 0)
+            response['wall_time'] = time.monotonic() - started
+            timer.cancel()
+            with lock:
+                exited.set()
+            # Reaped here, keep Popen from waiting on it again
+            process.returncode = os.waitstatus_to_exitcode(status)
+
+            # Descendants that outlived the command may still hold the pipes
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(process.pid, signal.SIGKILL)
+            for worker in workers:
+                worker.join(timeout=1)
+
+            response['cpu_time'] = usage.ru_utime + usage.ru_stime
+            # ru_maxrss carries over the footprint of this process (the command
+            # is forked from it), the peak is the command's own only beyond it
+            outgrown = usage.ru_maxrss > resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            response['peak_rss'] = usage.ru_maxrss if outgrown else None
+            oom_kills = 0
+            if cgroup:
+                cgroup_usage = cls.__dispose_cgroup(cgroup)
+                oom_kills = cgroup_usage.pop('oom_kills', 0)
+                response.update(cgroup_usage)
+                cgroup = None
+
+            response.update(stdout.report('stdout'))
+            response.update(stderr.report('stderr'))
+            response['returncode'] = process.returncode
+            response['verdict'] = cls.verdict(status, response['cpu_time'], time_limit, killed.is_set(), oom_kills, overflow.is_set())
+
+            if response['verdict'] == 'OK':
+                response['status'] = 'success'
+            else:
+                response['status'] = 'error'
+                response['message'] = {
+                    'TLE': f'Time limit exceeded ({time_limit}s)',
+                    'MLE': f'Memory limit exceeded ({memory_limit} KB)',
+                    'OLE': f"Output limit exceeded ({config.Constants.rse['stream']['cap']} MB)",
+                    'RE': f'Command {shell_cmds} returned non-zero exit status {process.returncode}',
+                }[response['verdict']]
+
+        except Exception as e:
+            response['status'] = 'error'
+            response['message'] = traceback.format_exc()
+
+        finally:
+            if cgroup:
+                cls.__dispose_cgroup(cgroup)
+
+        return response
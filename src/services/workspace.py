@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import traceback
+
+import src.common.config as config
+
+
+class Workspace:
+    """
+    Per-job scratch directories for the sources and binaries of Executor jobs.
+
+    Every job gets its own directory, so concurrent jobs never clobber each
+    other, and the directory is reused across the compile and run phases of
+    the job. Workspaces are created on the first usable root listed in
+    rse.json (RAM-backed by default, sparing the SD card), falling back to the
+    temporary directory of the system.
+
+    A workspace is named <lang>-<pid>-<random>, after the process that owns
+    it. Remo removes the workspace of a job once the job is done; purge()
+    reclaims the ones left behind by processes that died, and keeps the
+    overall usage within the quota.
+    """
+
+    @classmethod
+    def load(cls) -> dict:
+        return config.Constants.rse['workspace']
+
+    @classmethod
+    def root(cls) -> str:
+        for root in cls.load()['roots'] + [os.path.join(tempfile.gettempdir(), 'jarvis')]:
+            root = os.path.expanduser(root)
+            try:
+                os.makedirs(root, mode=0o700, exist_ok=True)
+                if os.access(root, os.W_OK | os.X_OK):
+                    return root
+            except OSError:
+                continue
+        raise OSError('No usable root for workspaces')
+
+    @staticmethod
+    def __size(path: str) -> int:
+        size = 0
+        for directory, _, files in os.walk(path):
+            for file in files:
+                try:
+                    size += os.lstat(os.path.join(directory, file)).st_blocks * 512
+                except FileNotFoundError:
+                    continue
+        return size
+
+    @staticmethod
+    def __owner(entry: os.DirEntry):
+        try:
+            return int(entry.name.split('-')[1])
+        except (IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def __is_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    @classmethod
+    def __workspaces(cls, lang: str = None) -> list:
+        prefix = f'{lang}-' if lang else ''
+        return [
+            entry for entry in os.scandir(cls.root())
+            if entry.is_dir(follow_symlinks=False) and entry.name.startswith(prefix)
+        ]
+
+    @classmethod
+    def create(cls, lang: str) -> str:
+        """
+        Creates a workspace for a job of the language.
+
+        Raises:
+            OSError: If the workspaces are over the quota, even after a purge.
+
+        Returns:
+            str: Path to the workspace.
+        """
+        quota = cls.load()['quota'] * 2**20
+        if cls.__size(cls.root()) > quota:
+            cls.purge()
+            if cls.__size(cls.root()) > quota:
+                raise OSError(f"Workspaces exceed their quota ({cls.load()['quota']} MB)")
+
+        return tempfile.mkdtemp(prefix=f'{lang}-{os.getpid()}-', dir=cls.root())
+
+    @classmethod
+    def remove(cls, path: str) -> None:
+        shutil.rmtree(path, ignore_errors=True)
+
+    @classmethod
+    def purge(cls, lang: str = None) -> bool:
+        """
+        Removes the workspaces whose owner is gone. If the workspaces are still
+        over the quota, removes the oldest ones that outlived stale_after seconds.
+
+        Args:
+            lang (str) [Optional]: Only purge the workspaces of the language.
+
+        Returns:
+            bool: True if the purge succeeded.
+        """
+        try:
+            survivors = []
+            for entry in cls.__workspaces(lang):
+                owner = cls.__owner(entry)
+                if owner is None or not cls.__is_alive(owner):
+                    cls.remove(entry.path)
+                else:
+                    survivors.append(entry)
+
+            quota = cls.load()['quota'] * 2**20
+            occupied = cls.__size(cls.root())
+            expiry = time.time() - cls.load()['stale_after']
+
+            for entry in sorted(survivors, key=lambda entry: entry.stat().st_mtime):
+                if occupied <= quota:
+                    break
+                if entry.stat().st_mtime < expiry:
+                    occupied -= cls.__size(entry.path)
+                    logging.info(f"Reclaiming stale workspace {entry.path}")
+                    cls.remove(entry.path)
+
+            return True
+
+        except Exception as e:
+            logging.error(f"Unable to purge workspaces: {traceback.format_exc()}")
+            return False
+
+    @classmethod
+    def get_status(cls, lang: str) -> dict:
+        workspaces = cls.__workspaces(lang)
+        return {
+            'lang': lang,
+            'root': cls.root(),
+            'workspaces': len(workspaces),
+            'size': sum(cls.__size(entry.path) for entry in workspaces),
+            'quota': cls.load()['quota'] * 2**20,
+        }
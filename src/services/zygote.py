@@ -0,0 +1,357 @@
+#!/usr/bin/python3
+
+import argparse
+import builtins
+import collections
+import contextlib
+import fcntl
+import importlib
+import json
+import logging
+import os
+import pickle
+import resource
+import signal
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+import src.common.config as config
+from src.services.warden import Warden
+from src.services.workspace import Workspace
+
+
+class Zygote:
+    """
+    A fork server for Executor.PYTHON jobs.
+
+    The zygote is a warm interpreter, detached from the process that spawned
+    it, with the commonly used stdlib modules already imported. It listens on
+    a unix socket and forks a supervisor per job, which in turn forks the
+    child that runs the source. The child inherits the warm interpreter, so
+    a job starts without paying for an interpreter startup.
+
+    The child is confined with the time_limit (CPU seconds) and memory_limit
+    (Kilobytes) of the job, and is killed once it spends more than
+    wall_factor (see Warden) times its time limit on the wall clock. Its
+    output is capped at stream.cap MB, like the output of Warden.run.
+    """
+
+    @classmethod
+    def load(cls) -> dict:
+        return config.Constants.rse['zygote']
+
+    @classmethod
+    def enabled(cls, task) -> bool:
+        return getattr(task, 'warm', cls.load()['enabled'])
+
+    @classmethod
+    def directory(cls) -> str:
+        path = os.path.expanduser(cls.load()['path'])
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        return path
+
+    @classmethod
+    def address(cls) -> str:
+        return os.path.join(cls.directory(), 'zygote.sock')
+
+    @staticmethod
+    def __send(connection: socket.socket, payload) -> None:
+        payload = pickle.dumps(payload)
+        connection.sendall(struct.pack('>Q', len(payload)) + payload)
+
+    @staticmethod
+    def __receive(connection: socket.socket):
+        with connection.makefile('rb') as stream:
+            size, = struct.unpack('>Q', stream.read(8))
+            return pickle.loads(stream.read(size))
+
+    '''
+    Client side
+    '''
+
+    @classmethod
+    def __connect(cls) -> socket.socket:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(cls.address())
+            return connection
+        except OSError:
+            connection.close()
+            raise
+
+    @classmethod
+    def __spawn(cls) -> None:
+        """
+        Starts the zygote unless another process already did.
+        """
+        with open(os.path.join(cls.directory(), 'zygote.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            with contextlib.suppress(OSError):
+                cls.__connect().close()
+                return
+
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(cls.address())
+
+            root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            logging.info("Spawning the Python zygote")
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'src.services.zygote', 'serve'],
+                cwd=root,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+
+            deadline = time.monotonic() + cls.load()['startup_timeout']
+            while not os.path.exists(cls.address()):
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('Python zygote failed to start')
+                time.sleep(0.02)
+
+    @classmethod
+    def submit(cls, task) -> collections.defaultdict:
+        """
+        Runs a prepared Executor.PYTHON job on the zygote.
+
+        Returns:
+            collections.defaultdict: A response shaped like the one of Executor.exec
+        """
+        try:
+            request = {
+                'source': task.source,
+                'stdin': task.stdin or '',
+                'cwd': task.path,
+                'time_limit': task.time_limit,
+                'memory_limit': task.memory_limit,
+                'spill': task.workspace,
+            }
+
+            try:
+                connection = cls.__connect()
+            except OSError:
+                cls.__spawn()
+                connection = cls.__connect()
+
+            with connection:
+                cls.__send(connection, request)
+                return collections.defaultdict(None, cls.__receive(connection))
+
+        except Exception as e:
+            response = collections.defaultdict()
+            response['status'] = 'error'
+            response['message'] = traceback.format_exc()
+            return response
+
+    '''
+    Server side
+    '''
+
+    @classmethod
+    def serve(cls) -> None:
+        for module in cls.load()['preload']:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                logging.warning(f"Zygote could not preload {module}")
+
+        # Supervisors are never waited for, let the kernel reap them
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+        staging = f'{cls.address()}.{os.getpid()}'
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(staging)
+        server.listen(16)
+        os.replace(staging, cls.address())
+
+        while True:
+            connection, _ = server.accept()
+            # The footprint jobs inherit, as the supervisor does not keep the peak of the zygote
+            footprint = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if os.fork() == 0:
+                server.close()
+                try:
+                    cls.__supervise(connection, footprint)
+                finally:
+                    os._exit(0)
+            connection.close()
+
+    @classmethod
+    def __supervise(cls, connection: socket.socket, footprint: int) -> None:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        request = cls.__receive(connection)
+
+        streams = [tempfile.TemporaryFile() for _ in range(3)]
+        stdin, stdout, stderr = streams
+        payload = request['stdin']
+        stdin.write(payload if isinstance(payload, bytes) else payload.encode())
+        stdin.seek(0)
+
+        started = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            connection.close()
+            cls.__execute(request, streams)
+
+        killed = threading.Event()
+        exited = threading.Event()
+        lock = threading.Lock()
+
+        def kill():
+            with lock:
+                if not exited.is_set():
+                    killed.set()
+                    with contextlib.suppress(ProcessLookupError):
+                        os.kill(pid, signal.SIGKILL)
+
+        # The wall clock limit, for jobs that sleep or block
+        timer = threading.Timer(request['time_limit'] * Warden.load()['wall_factor'], kill)
+        timer.daemon = True
+        timer.start()
+
+        _, status, usage = os.wait4(pid, 0)
+        wall_time = time.monotonic() - started
+        timer.cancel()
+        with lock:
+            exited.set()
+
+        response = dict()
+        response['cpu_time'] = usage.ru_utime + usage.ru_stime
+        response['wall_time'] = wall_time
+        # ru_maxrss carries over the footprint of the zygote (the job is forked
+        # from it), the peak is the job's own only beyond it (see Warden.run)
+        outgrown = usage.ru_maxrss > footprint
+        response['peak_rss'] = usage.ru_maxrss if outgrown else None
+
+        for stream, key in [(stdout, 'stdout'), (stderr, 'stderr')]:
+            stream.seek(0)
+            sink = Warden.sink(request['spill'])
+            for chunk in iter(lambda: stream.read(2**16), b''):
+                sink.write(chunk)
+            sink.close()
+            response.update(sink.report(key))
+
+        response['verdict'] = Warden.verdict(status, response['cpu_time'], request['time_limit'], killed.is_set())
+        if response['verdict'] == 'TLE':
+            response['status'] = 'error'
+            response['message'] = f"Time limit exceeded ({request['time_limit']}s)"
+        elif response['verdict'] == 'OLE':
+            response['status'] = 'error'
+            response['message'] = f"Output limit exceeded ({config.Constants.rse['stream']['cap']} MB)"
+        elif os.WIFSIGNALED(status):
+            response['status'] = 'error'
+            response['message'] = f'Job died with {signal.Signals(os.WTERMSIG(status)).name}'
+        elif os.WEXITSTATUS(status) != 0:
+            response['status'] = 'error'
+            response['message'] = f'Job returned non-zero exit status {os.WEXITSTATUS(status)}'
+        else:
+            response['status'] = 'success'
+
+        cls.__send(connection, response)
+        connection.close()
+
+    @classmethod
+    def __execute(cls, request: dict, streams: list) -> None:
+        """
+        Runs the source in the forked child, mimicking `python3 -c`.
+        Never returns.
+        """
+        status = 1
+        try:
+            for descriptor, stream in enumerate(streams):
+                os.dup2(stream.fileno(), descriptor)
+
+            if request['cwd']:
+                os.chdir(request['cwd'])
+
+            Warden.confine(request['time_limit'], request['memory_limit'])
+            # The output goes to files, bound them the way Warden bounds its pipes
+            cap = config.Constants.rse['stream']['cap'] * 2**20
+            resource.setrlimit(resource.RLIMIT_FSIZE, (cap, cap))
+            signal.signal(signal.SIGXFSZ, signal.SIG_DFL)
+
+            sys.argv = ['-c']
+            namespace = {'__name__': '__main__', '__builtins__': builtins}
+            exec(compile(request['source'], '<string>', 'exec'), namespace)
+            status = 0
+
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                status = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+
+        except BaseException as e:
+            # Hide the frame of the zygote from the traceback
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+
+        finally:
+            with contextlib.suppress(BaseException):
+                sys.stdout.flush()
+                sys.stderr.flush()
+            os._exit(status)
+
+    @classmethod
+    def benchmark(cls, runs: int) -> dict:
+        """
+        Compares the latency of cold (a python3 process confined by Warden,
+        see Executor.exec) and warm (zygote) executions of a trivial job.
+        """
+        from src.services.executor import Executor
+
+        args = {
+            'lang': 'PYTHON',
+            'path': tempfile.gettempdir(),
+            'source': "import collections\nprint(sum(map(int, input().split())))",
+            'stdin': '1 2 3',
+        }
+
+        latencies = dict()
+        for mode in ['cold', 'warm']:
+            task = Executor.PYTHON()
+            task.prepare(dict(args, warm=mode == 'warm'))
+            try:
+                # Warm up, so that spawning the zygote is not measured
+                task.run()
+
+                samples = []
+                for _ in range(runs):
+                    started = time.perf_counter()
+                    response = task.run()
+                    samples.append(time.perf_counter() - started)
+                    assert response['status'] == 'success', response
+            finally:
+                Workspace.remove(task.workspace)
+
+            latencies[mode] = {
+                'mean': statistics.mean(samples),
+                'median': statistics.median(samples),
+                'min': min(samples),
+                'max': max(samples),
+            }
+
+        latencies['speedup'] = latencies['cold']['median'] / latencies['warm']['median']
+        return latencies
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fork server for Python jobs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('serve', help='Start the zygote')
+    bench = subparsers.add_parser('benchmark', help='Compare cold and warm job latency')
+    bench.add_argument('--runs', type=int, default=20)
+    cli_args = parser.parse_args()
+
+    if cli_args.command == 'serve':
+        Zygote.serve()
+    else:
+        print(json.dumps(Zygote.benchmark(cli_args.runs), indent=4))
@@ -0,0 +1,273 @@
+#!/usr/bin/python3
+"""
+A fake Google Drive API server, to exercise Librarian (see Bifrost) offline.
+
+Serves just enough of Drive v3 for listings (paginated), file metadata,
+deletions, uploads (simple and resumable) and the batch endpoint, along
+with the OAuth token endpoint, and answers a share of the requests
+(batched ones included) with rate-limit errors.
+
+Usage:
+    python3 test/fake_drive.py --files 2500 --rate-limit 0.1 --key /tmp/fake-key.json
+
+Then point Librarian to it, in src/common/constants:
+    librarian.json  "bifrost": {"endpoint": "http://localhost:8765/", ...}
+    creds.json      "librarian": {"json-key-file": "/tmp/fake-key.json", ...}
+"""
+
+import argparse
+import email.parser
+import hashlib
+import json
+import random
+import threading
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REASONS = {200: 'OK', 204: 'No Content', 308: 'Resume Incomplete', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found'}
+
+
+class Drive:
+    def __init__(self, count: int, rate_limit: float, max_batch: int):
+        self.files = {
+            f'file{i:06d}': {
+                'id': f'file{i:06d}',
+                'name': f'tome-{i}.zip',
+                'mimeType': 'application/zip',
+                'size': str(i * 1024),
+                'webViewLink': f'https://drive.example/file{i:06d}',
+            } for i in range(count)
+        }
+        self.rate_limit = rate_limit
+        self.max_batch = max_batch
+        self.sessions = dict()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'batches': 0, 'rate_limited': 0, 'uploads': 0, 'chunks': 0}
+
+    def throttled(self) -> bool:
+        if random.random() < self.rate_limit:
+            self.stats['rate_limited'] += 1
+            return True
+        return False
+
+    def handle(self, method: str, target: str, body: bytes) -> tuple:
+        """
+        Returns:
+            tuple: status, JSON response (None for no content).
+        """
+        self.stats['requests'] += 1
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        path = url.path
+
+        if path == '/token' and method == 'POST':
+            return 200, {'access_token': uuid.uuid4().hex, 'expires_in': 3600, 'token_type': 'Bearer'}
+
+        if self.throttled():
+            error = {'code': 403, 'message': 'User Rate Limit Exceeded', 'errors': [{'reason': 'userRateLimitExceeded'}]}
+            return 403, {'error': error}
+
+        with self.lock:
+            if path == '/drive/v3/files' and method == 'GET':
+                size = min(int(query.get('pageSize', 100)), 1000)
+                offset = int(query.get('pageToken', 0))
+                ids = sorted(self.files)
+                page = {'files': [self.files[key] for key in ids[offset:offset + size]]}
+                if offset + size < len(ids):
+                    page['nextPageToken'] = str(offset + size)
+                return 200, page
+
+            if path.startswith('/drive/v3/files/'):
+                file_id = path.rsplit('/', 1)[1]
+                if file_id not in self.files:
+                    return 404, {'error': {'code': 404, 'message': f'File not found: {file_id}.'}}
+                if method == 'GET':
+                    return 200, self.files[file_id]
+                if method == 'DELETE':
+                    del self.files[file_id]
+                    return 204, None
+
+        return 400, {'error': {'code': 400, 'message': f'Unsupported: {method} {path}'}}
+
+    def create(self, metadata: dict, content: bytes) -> dict:
+        file_id = f'upload{len(self.files):06d}'
+        self.files[file_id] = {
+            'id': file_id,
+            'name': metadata.get('name'),
+            'mimeType': 'application/octet-stream',
+            'size': str(len(content)),
+            'md5Checksum': hashlib.md5(content).hexdigest(),
+            'webViewLink': f'https://drive.example/{file_id}',
+            'webContentLink': f'https://drive.example/{file_id}?export=download',
+        }
+        self.stats['uploads'] += 1
+        return self.files[file_id]
+
+    def upload(self, method: str, target: str, headers, body: bytes) -> tuple:
+        """
+        Returns:
+            tuple: status, headers and JSON response (None for no content).
+        """
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        if method == 'POST' and query.get('uploadType') == 'multipart':
+            message = email.parser.BytesParser().parsebytes(f'Content-Type: {headers["Content-Type"]}\r\n\r\n'.encode() + body)
+            metadata, media = message.get_payload()
+            with self.lock:
+                return 200, {}, self.create(json.loads(metadata.get_payload()), media.get_payload(decode=True))
+
+        if method == 'POST' and query.get('uploadType') == 'resumable':
+            session_id = uuid.uuid4().hex
+            with self.lock:
+                self.sessions[session_id] = {'metadata': json.loads(body or b'{}'), 'data': bytearray(), 'file': None}
+            return 200, {'Location': f'http://{headers["Host"]}/upload/drive/v3/files?upload_id={session_id}'}, None
+
+        session = self.sessions.get(query.get('upload_id'))
+        if method != 'PUT' or session is None:
+            return 404, {}, {'error': {'code': 404, 'message': 'No such upload session'}}
+
+        with self.lock:
+            if session['file'] is not None:
+                return 200, {}, session['file']
+
+            span, total = headers['Content-Range'][len('bytes '):].split('/')
+            if span != '*':
+                start = int(span.split('-')[0])
+                if start != len(session['data']):
+                    return 400, {}, {'error': {'code': 400, 'message': f'Expected offset {len(session["data"])}'}}
+                session['data'] += body
+                self.stats['chunks'] += 1
+
+            if total != '*' and len(session['data']) == int(total):
+                session['file'] = self.create(session['metadata'], bytes(session['data']))
+                return 200, {}, session['file']
+
+            received = {'Range': f'bytes=0-{len(session["data"]) - 1}'} if session['data'] else {}
+            return 308, received, None
+
+    def batch(self, content_type: str, body: bytes) -> tuple:
+        """
+        Returns:
+            tuple: status, content type and body of the multipart/mixed response.
+        """
+        self.stats['batches'] += 1
+        message = email.parser.BytesParser().parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+        parts = message.get_payload()
+        if len(parts) > self.max_batch:
+            return 400, 'application/json', json.dumps({'error': {'code': 400, 'message': 'Too many requests in a batch'}}).encode()
+
+        boundary = f'batch_{uuid.uuid4().hex}'
+        answers = []
+        for part in parts:
+            request = part.get_payload(decode=False)
+            head, _, inner_body = request.partition('\r\n\r\n') if '\r\n\r\n' in request else request.partition('\n\n')
+            method, target, _ = head.splitlines()[0].split(' ', 2)
+            status, payload = self.handle(method, target, inner_body.encode())
+            content = json.dumps(payload) if payload is not None else ''
+            answers.append(
+                f'--{boundary}\r\n'
+                f'Content-Type: application/http\r\n'
+                f'Content-ID: <response-{part["Content-ID"][1:-1]}>\r\n\r\n'
+                f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+                f'Content-Type: application/json; charset=UTF-8\r\n'
+                f'Content-Length: {len(content)}\r\n\r\n'
+                f'{content}\r\n'
+            )
+        answers.append(f'--{boundary}--\r\n')
+        return 200, f'multipart/mixed; boundary={boundary}', ''.join(answers).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    drive = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve(self, method: str) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+
+        if self.path.startswith('/batch/'):
+            self.respond(*self.drive.batch(self.headers['Content-Type'], body))
+            return
+
+        if self.path.startswith('/upload/'):
+            status, headers, payload = self.drive.upload(method, self.path, self.headers, body)
+            content = json.dumps(payload).encode() if payload is not None else b''
+            self.send_response(status)
+            for header, value in headers.items():
+                self.send_header(header, value)
+            self.send_header('Content-Type', 'application/json; charset=UTF-8')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+
+        status, payload = self.drive.handle(method, self.path, body)
+        content = json.dumps(payload).encode() if payload is not None else b''
+        self.respond(status, 'application/json; charset=UTF-8', content)
+
+    def do_GET(self):
+        self.serve('GET')
+
+    def do_POST(self):
+        self.serve('POST')
+
+    def do_PUT(self):
+        self.serve('PUT')
+
+    def do_DELETE(self):
+        self.serve('DELETE')
+
+
+def write_key(path: str, port: int) -> None:
+    """
+    Writes a service account key file whose tokens come from the fake server.
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    key = {
+        'type': 'service_account',
+        'project_id': 'fake-drive',
+        'private_key_id': uuid.uuid4().hex,
+        'private_key': private_key.decode(),
+        'client_email': 'librarian@fake-drive.iam.gserviceaccount.com',
+        'client_id': '1',
+        'token_uri': f'http://localhost:{port}/token',
+    }
+    with open(path, 'w') as file:
+        json.dump(key, file, indent=4)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--files', type=int, default=2500, help='Files in the fake Drive')
+    parser.add_argument('--rate-limit', type=float, default=0.1, help='Share of the requests answered with 403 userRateLimitExceeded')
+    parser.add_argument('--max-batch', type=int, default=100, help='Most requests allowed in a batch')
+    parser.add_argument('--key', help='Write a service account key file for the fake server to this path')
+    args = parser.parse_args()
+
+    if args.key:
+        write_key(args.key, args.port)
+
+    Handler.drive = Drive(args.files, args.rate_limit, args.max_batch)
+    server = ThreadingHTTPServer(('localhost', args.port), Handler)
+    print(f'Fake Drive serving {args.files} files on http://localhost:{args.port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(Handler.drive.stats)
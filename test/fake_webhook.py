@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+"""
+A fake Discord webhook, to exercise Informio offline (see test/test_informio.py).
+
+Takes messages (JSON or multipart, with attachments) the way Discord
+does, rejects the ones over 2000 characters, and rate-limits them: every
+window allows a number of messages, answering the rest with 429 and a
+Retry-After, along with the X-RateLimit-* headers Discord sends. The
+messages received are listed by GET /messages.
+
+Usage:
+    python3 test/fake_webhook.py --rate 5 --window 2
+
+Then point Informio to it, in src/common/constants/creds.json:
+    "webhooks": {"#general": {"informio": {"url": "http://localhost:8766/webhook", ...}}}
+"""
+
+import argparse
+import email.parser
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Webhook:
+    def __init__(self, rate: int, window: float, limit: int):
+        self.rate = rate
+        self.window = window
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.messages = []
+        self.bucket = {'reset': time.monotonic() + window, 'remaining': rate}
+        self.stats = {'requests': 0, 'rate_limited': 0, 'rejected': 0}
+
+    def admit(self) -> dict:
+        """
+        Returns:
+            dict: The rate-limit headers, with Retry-After if the request is rejected.
+        """
+        now = time.monotonic()
+        if now >= self.bucket['reset']:
+            self.bucket = {'reset': now + self.window, 'remaining': self.rate}
+
+        headers = {
+            'X-RateLimit-Limit': str(self.rate),
+            'X-RateLimit-Reset-After': f"{self.bucket['reset'] - now:.3f}",
+        }
+        if self.bucket['remaining'] == 0:
+            self.stats['rate_limited'] += 1
+            return headers | {'X-RateLimit-Remaining': '0', 'Retry-After': f"{self.bucket['reset'] - now:.3f}"}
+
+        self.bucket['remaining'] -= 1
+        return headers | {'X-RateLimit-Remaining': str(self.bucket['remaining'])}
+
+    def receive(self, content_type: str, body: bytes) -> tuple:
+        """
+        Returns:
+            tuple: status, headers and JSON response (None for no content).
+        """
+        with self.lock:
+            self.stats['requests'] += 1
+            headers = self.admit()
+            if 'Retry-After' in headers:
+                return 429, headers, {'message': 'You are being rate limited.', 'retry_after': float(headers['Retry-After'])}
+
+            files = []
+            if content_type.startswith('multipart/form-data'):
+                message = email.parser.BytesParser().parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+                payload = {}
+                for part in message.get_payload():
+                    if part.get_param('name', header='content-disposition') == 'payload_json':
+                        payload = json.loads(part.get_payload(decode=True))
+                    else:
+                        files.append({'filename': part.get_filename(), 'size': len(part.get_payload(decode=True))})
+            else:
+                payload = json.loads(body)
+
+            content = payload.get('content') or ''
+            if len(content) > self.limit:
+                self.stats['rejected'] += 1
+                return 400, headers, {'message': 'Invalid Form Body', 'errors': {'content': f'Must be {self.limit} or fewer in length.'}}
+
+            self.messages.append({'content': content, 'files': files, 'received': time.time()})
+            return 204, headers, None
+
+
+class Handler(BaseHTTPRequestHandler):
+    webhook = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status: int, headers: dict, payload) -> None:
+        content = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path == '/messages':
+            with self.webhook.lock:
+                self.respond(200, {}, {'messages': self.webhook.messages, 'stats': self.webhook.stats})
+        else:
+            self.respond(404, {}, {'message': 'Unknown Webhook'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        self.respond(*self.webhook.receive(self.headers.get('Content-Type', ''), body))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--rate', type=int, default=5, help='Messages allowed per window')
+    parser.add_argument('--window', type=float, default=2, help='Seconds of a rate-limit window')
+    parser.add_argument('--limit', type=int, default=2000, help='Most characters in a message')
+    args = parser.parse_args()
+
+    Handler.webhook = Webhook(args.rate, args.window, args.limit)
+    server = ThreadingHTTPServer(('localhost', args.port), Handler)
+    print(f'Fake webhook serving on http://localhost:{args.port}/webhook')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(Handler.webhook.stats)
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+Tests of the delivery of Informio messages, against the fake webhook.
+
+Usage:
+    python3 -m pytest test/test_informio.py
+"""
+
+import json
+import threading
+import time
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import fake_webhook
+from src.common.config import Constants
+from src.services.informio import Informio
+
+
+class Webhook:
+    def __init__(self, rate: int, window: float):
+        handler = type('Handler', (fake_webhook.Handler,), {'webhook': fake_webhook.Webhook(rate, window, 2000)})
+        self.server = ThreadingHTTPServer(('localhost', 0), handler)
+        self.url = f'http://localhost:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def post(self, content: str) -> None:
+        request = urllib.request.Request(
+            f'{self.url}/webhook', json.dumps({'content': content}).encode(), {'Content-Type': 'application/json'}
+        )
+        urllib.request.urlopen(request).close()
+
+    def received(self) -> dict:
+        with urllib.request.urlopen(f'{self.url}/messages') as response:
+            return json.load(response)
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    def serve(rate: int, window: float) -> Webhook:
+        server = Webhook(rate, window)
+        servers.append(server)
+        creds = {'webhooks': {'#general': {'informio': {'url': f'{server.url}/webhook', 'author': 'test'}}}}
+        monkeypatch.setattr(Constants, 'creds', creds, raising=False)
+        return server
+
+    servers = []
+    monkeypatch.setitem(Constants.discord, 'informio', Constants.discord['informio'] | {'linger': 0.2, 'flush_timeout': 10})
+    yield serve
+    for server in servers:
+        server.server.shutdown()
+        server.server.server_close()
+
+
+def test_burst_is_coalesced(webhook):
+    server = webhook(rate=5, window=1)
+    informio = Informio()
+
+    sent = [f'message {index}' for index in range(60)]
+    for text in sent:
+        informio.send_message(text)
+    assert informio.flush()
+
+    received = server.received()
+    assert len(received['messages']) < 5
+    assert '\n'.join(message['content'] for message in received['messages']).split('\n') == sent
+
+
+def test_rate_limit_waits_retry_after_once(webhook):
+    server = webhook(rate=1, window=1)
+    # Empties the bucket, the first attempt of the Herald is rate-limited
+    server.post('ahead')
+    informio = Informio()
+
+    started = time.time()
+    informio.send_message('behind')
+    assert informio.flush()
+
+    received = server.received()
+    assert [message['content'] for message in received['messages']] == ['ahead', 'behind']
+    assert received['stats']['rate_limited'] == 1
+    # Delivered once Retry-After (within a window) was waited out, not the bucket reset on top of it
+    assert received['messages'][1]['received'] - started < 1.5
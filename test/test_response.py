@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""
+Regression tests of Response.paginate.
+
+Usage:
+    python3 -m pytest test/test_response.py
+"""
+
+import re
+import signal
+
+import pytest
+
+from src.common.response import Response
+
+ESCAPE = re.compile(r'\u001b\[[0-9;]*m')
+
+
+@pytest.fixture(autouse=True)
+def deadline():
+    # Paginating must never hang the sender
+    def expire(signum, frame):
+        raise TimeoutError('paginate did not return')
+
+    signal.signal(signal.SIGALRM, expire)
+    signal.alarm(5)
+    yield
+    signal.alarm(0)
+
+
+def plain(text: str) -> str:
+    return ESCAPE.sub('', re.sub(r'```\w*\n?', '', text)).replace('\n', '')
+
+
+def check(pages: list, limit: int, intact: bool = True) -> None:
+    for page in pages:
+        assert 0 < len(page) <= limit
+        assert page.count('```') % 2 == 0
+        for match in re.finditer('\u001b', page) if intact else []:
+            assert ESCAPE.match(page, match.start())
+
+
+@pytest.mark.parametrize('limit', [2000, 500, 120])
+def test_paginate_keeps_content(limit):
+    response = Response('success', 'Files found:')
+    response += Response('general', '\n'.join(f'/home/suman/{"d/" * (index % 20)}file{index}.txt' for index in range(300)))
+    text = str(response)
+
+    pages = Response.paginate(text, limit)
+
+    check(pages, limit)
+    assert plain(''.join(pages)) == plain(text)
+
+
+@pytest.mark.parametrize('text, limit, intact', [
+    # Language tokens longer than the page
+    ('```' + 'x' * 2100 + '\n' + 'y' * 3000, 2000, True),
+    ('```' + 'x' * 300 + '\n' + 'y' * 500, 200, True),
+    # Longest language and style reopened on every page
+    ('```' + 'l' * 32 + '\n\u001b[' + '1;' * 13 + '31m' + 'y' * 300 + '```', 100, True),
+    # Escape sequence longer than the page, split as text
+    ('```ansi\n\u001b[' + '1;' * 300 + '31m' + 'y' * 900 + '```', 200, False),
+])
+def test_paginate_long_fence_and_style(text, limit, intact):
+    pages = Response.paginate(text, limit)
+
+    check(pages, limit, intact)
+    assert ''.join(pages).count('y') == text.count('y')
+
+
+@pytest.mark.parametrize('limit', [10, 20, 50])
+def test_paginate_tiny_limits(limit):
+    text = '```' + 'l' * 32 + '\n\u001b[' + '1;' * 13 + '31m' + 'y' * 300 + '```'
+
+    pages = Response.paginate(text, limit)
+
+    assert ''.join(pages).count('y') == 300